@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+一次分析的配置快照
+
+config.py 是进程级的模块：后端按请求改写其中的时间范围，会影响同一进程中正在进行的其他分析，
+逐条消息用 getattr 读取配置也有额外开销。AnalysisConfig 在分析开始前解析一次，之后不可修改，
+显式传给 load_json / load_message_table、ChatAnalyzer 和 PersonalAnalyzer，
+同一进程中的多个线程 / 协程可以各自用不同的配置同时分析。
+
+字段名与 config.py 中的配置项相同，config.py 缺少的项取 _DEFAULTS 中的默认值；
+MessageFilter.from_config、get_parse_cache 等按属性读取配置的函数可以直接接收 AnalysisConfig。
+各模块未传入配置时都经 resolve_config 读取 config 模块，不再各自导入。
+列表 / 集合类的配置项统一转为 tuple / frozenset，快照可以哈希，也可以安全地在线程间共享。
+"""
+
+from collections import namedtuple
+
+# 分析相关的配置项及 config.py 中缺少时的默认值
+_DEFAULTS = {
+    # 词频统计
+    'TOP_N': 200,
+    'MIN_FREQ': 1,
+    'MIN_WORD_LEN': 1,
+    'MAX_WORD_LEN': 10,
+    'WHITELIST': frozenset(),
+    # 新词发现
+    'PMI_THRESHOLD': 2.0,
+    'ENTROPY_THRESHOLD': 0.5,
+    'NEW_WORD_MIN_FREQ': 20,
+    'NEW_WORD_APPROXIMATE': False,
+    'NEW_WORD_MEMORY_MB': 1024,
+    # 词组合并
+    'MERGE_MIN_FREQ': 30,
+    'MERGE_MIN_PROB': 0.3,
+    'MERGE_MAX_LEN': 6,
+    # 单字过滤
+    'SINGLE_MIN_SOLO_RATIO': 0.01,
+    'SINGLE_MIN_SOLO_COUNT': 5,
+    # 停用词
+    'USE_STOPWORDS': False,
+    'STOPWORDS_PATHS': ('resources/baidu_stopwords.txt', 'backend/resources/baidu_stopwords.txt'),
+    'STOPWORDS_MANUAL': (),
+    'STOPWORDS_WARN_IF_MISSING': True,
+    'STOPWORDS_ENCODING': 'utf-8',
+    # 排行榜与热词展示
+    'RANK_TOP_N': 10,
+    'CONTRIBUTOR_TOP_N': 10,
+    'SAMPLE_COUNT': 10,
+    'SAMPLE_SEED': 0,
+    # 时间范围与时段
+    'MESSAGE_START_DATE': None,
+    'MESSAGE_END_DATE': None,
+    'NIGHT_OWL_HOURS': tuple(range(0, 6)),
+    'EARLY_BIRD_HOURS': tuple(range(6, 9)),
+    # 机器人过滤
+    'FILTER_BOT_MESSAGES': True,
+    'BOT_UINS': frozenset(),
+    'BOT_SUB_MSG_TYPES': frozenset((577, 65)),
+    # 消息过滤规则
+    'BLOCK_KEYWORDS': (),
+    'BLOCK_PATTERNS': (),
+    'MIN_TEXT_LENGTH': 0,
+    # 解析与分词
+    'PARSE_WORKERS': 1,
+    'MAX_DECOMPRESSED_SIZE_MB': None,
+    'SEGMENT_WORKERS': 1,
+    'SEGMENT_CACHE_SIZE': 100000,
+    'TOKENIZER_CACHE_FILE': 'resources/tokenizer.cache',
+    'TOKENIZER_WARMUP': True,
+    'PARSE_CACHE_ENABLED': True,
+    'PARSE_CACHE_DIR': 'runtime_outputs/parse_cache',
+    'PARSE_CACHE_MAX_MB': 2048,
+    # 增量分析
+    'ANALYSIS_STATE_DIR': 'runtime_outputs/analysis_state',
+    # 批量分析与报告输出（batch.py）
+    'BATCH_WORKERS': 0,
+    'BATCH_OUTPUT_DIR': 'runtime_outputs/batch',
+    'ENABLE_IMAGE_EXPORT': True,
+    'IMAGE_GENERATION_MODE': 'ask',
+}
+
+_FROZENSET_FIELDS = ('WHITELIST',)
+_TUPLE_FIELDS = ('STOPWORDS_PATHS', 'STOPWORDS_MANUAL', 'NIGHT_OWL_HOURS', 'EARLY_BIRD_HOURS',
+                 'BLOCK_KEYWORDS', 'BLOCK_PATTERNS')
+
+
+def _normalize(values):
+    for name in _FROZENSET_FIELDS:
+        values[name] = frozenset(values[name] or ())
+    for name in _TUPLE_FIELDS:
+        values[name] = tuple(values[name] or ())
+    # 发送者 uin 在消息中为字符串
+    values['BOT_UINS'] = frozenset(str(uin) for uin in values['BOT_UINS'] or ())
+    values['BOT_SUB_MSG_TYPES'] = frozenset(int(t) for t in values['BOT_SUB_MSG_TYPES'] or ())
+    return values
+
+
+class AnalysisConfig(namedtuple('AnalysisConfig', list(_DEFAULTS), defaults=list(_DEFAULTS.values()))):
+    """不可修改的分析配置"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_module(cls, module=None, **overrides):
+        """
+        从配置模块解析
+
+        Args:
+            module: 配置模块或任何带同名属性的对象；None 时导入 config，不存在则全部取默认值
+            overrides: 覆盖的配置项，如 MESSAGE_START_DATE='2024-01-01'
+        """
+        if module is None:
+            try:
+                import config as module
+            except ImportError:
+                module = None
+        unknown = set(overrides) - set(_DEFAULTS)
+        if unknown:
+            raise TypeError(f"未知的配置项: {', '.join(sorted(unknown))}")
+        values = {name: getattr(module, name, default) for name, default in _DEFAULTS.items()}
+        values.update(overrides)
+        return cls(**_normalize(values))
+
+    def replace(self, **changes):
+        """返回修改了部分配置项的新快照"""
+        unknown = set(changes) - set(_DEFAULTS)
+        if unknown:
+            raise TypeError(f"未知的配置项: {', '.join(sorted(unknown))}")
+        return type(self)(**_normalize({**self._asdict(), **changes}))
+
+
+def resolve_config(config=None):
+    """调用方未传入配置时，从 config 模块解析一份快照"""
+    return config if config is not None else AnalysisConfig.from_module()
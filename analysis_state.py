@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+可合并的分析中间状态
+
+ChatAnalyzer 的分析分两段：第一轮遍历消息（过滤、名称信息、趣味统计、文本清理、按基础词典分词），
+之后在全部文本上做新词发现、词组合并、重新分词和结果整理。AnalysisState 保存第一轮遍历的全部结果，
+可以合并、可以 pickle 序列化：
+
+    state = ChatAnalyzer(data_2024_01, config=cfg).collect_state()
+    ...
+    analyzer = ChatAnalyzer.from_state(state_01 + state_02 + ..., config=cfg)
+    analyzer.analyze()
+
+state_a + state_b 的分析结果与对 a、b 的消息按顺序拼接后整体分析完全一致
+（词频、贡献者、例句、各榜单、小时分布），因此可以按月份等分片并行做第一轮遍历，最后合并。
+合并有顺序：a 的消息在前。各分片须使用相同的配置（时间范围、过滤规则）。
+
+跨分片的部分按原始数据保存、在分析时统一计算：
+- 回复目标：需要按消息ID查找的目标连同消息ID -> 发送者的列一起合并，被回复的消息可以在其他分片中
+- 名称映射：保存每个 uin 用过的名称序列，合并后再选取
+- 复读：保存分片首条和末条消息，合并时补上跨越分片边界的一次复读
+- 新词发现的 n-gram 统计：精确模式按合并后的总频次筛选候选，各分片单独筛选会漏掉跨分片累计达到阈值的词，
+  因此保存清理后的文本，n-gram 与单字独立性在分析时对合并后的文本统计（一遍扫描）；
+  最耗时的分词结果（TokenCache）则随状态保存和合并，分析时只重新切分包含新词的文本
+
+增量分析（analyzer.analyze_incremental）把状态保存到文件，新的导出到来时只处理水位线（Watermark）之后的消息，
+合并到已有状态上再完成分析；状态中的 ngrams（ngrams.NgramIndex）使新词发现也只需扫描新增的文本。
+"""
+
+import os
+import pickle
+from array import array
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from message_table import NO_TIME
+from segmenter import TokenCache
+from utils import atomic_write
+
+STATE_FORMAT_VERSION = 2
+
+# 按发送者累计的计数器（ChatAnalyzer 的同名属性），以及按小时的分布
+USER_COUNTERS = (
+    'user_msg_count',
+    'user_char_count',
+    'user_image_count',
+    'user_forward_count',
+    'user_reply_count',
+    'user_at_count',
+    'user_ated_count',
+    'user_emoji_count',
+    'user_link_count',
+    'user_night_count',
+    'user_morning_count',
+    'user_repeat_count',
+    'hour_distribution',
+)
+
+# 影响第一轮遍历的配置项：各分片须相同，增量分析时有变化则整体重新分析
+FIRST_PASS_FIELDS = (
+    'MESSAGE_START_DATE',
+    'MESSAGE_END_DATE',
+    'NIGHT_OWL_HOURS',
+    'EARLY_BIRD_HOURS',
+    'FILTER_BOT_MESSAGES',
+    'BOT_UINS',
+    'BOT_SUB_MSG_TYPES',
+    'BLOCK_KEYWORDS',
+    'BLOCK_PATTERNS',
+    'MIN_TEXT_LENGTH',
+)
+
+
+def first_pass_settings(config):
+    """配置中影响第一轮遍历的部分"""
+    return {name: getattr(config, name) for name in FIRST_PASS_FIELDS}
+
+
+class Watermark:
+    """
+    已处理消息的位置：最新的时间戳，以及该时间戳上的消息ID（同一毫秒可能有多条消息）
+
+    之后的导出可以与已处理的消息重叠，newer 只保留更新的消息：时间戳更晚的，
+    或时间戳相同但消息ID不在已处理集合中的（缺少消息ID的视为已处理）。没有时间戳的消息无法定位，一律视为已处理。
+    """
+
+    def __init__(self, timestamp=None, msg_ids=frozenset()):
+        self.timestamp = timestamp
+        self.msg_ids = msg_ids
+
+    def __eq__(self, other):
+        return isinstance(other, Watermark) and (self.timestamp, self.msg_ids) == (other.timestamp, other.msg_ids)
+
+    def __repr__(self):
+        return f"Watermark({self.timestamp!r}, {len(self.msg_ids)} ids)"
+
+    def newer(self, table, rows):
+        """rows 中比水位线更新的行"""
+        if self.timestamp is None:
+            return rows
+        timestamps = table.timestamps[rows]
+        keep = (timestamps != NO_TIME) & (timestamps > self.timestamp)
+        same = np.flatnonzero(timestamps == self.timestamp)
+        if len(same):
+            seen = [key for key in map(table.msg_key, self.msg_ids) if key is not None]
+            keys = table.msg_keys[rows[same]]
+            keep[same] = (keys != -1) & ~np.isin(keys, seen)
+        return rows[keep]
+
+    def advance(self, table, rows):
+        """处理完 rows 之后的水位线"""
+        timestamps = table.timestamps[rows]
+        timestamps = timestamps[timestamps != NO_TIME]
+        if not len(timestamps):
+            return self
+        latest = int(timestamps.max())
+        if self.timestamp is not None and latest < self.timestamp:
+            return self
+        keys = table.msg_keys[rows[table.timestamps[rows] == latest]].tolist()
+        extra_ids = {key: msg_id for msg_id, key in table.extra_msg_ids.items()} if min(keys) <= -2 else {}
+        msg_ids = {str(key) if key >= 0 else extra_ids[key] for key in keys if key != -1}
+        if latest == self.timestamp:
+            msg_ids |= self.msg_ids
+        return Watermark(latest, frozenset(msg_ids))
+
+    def merged(self, other):
+        """两个水位线中较新的（时间戳相同时合并消息ID）"""
+        if other.timestamp is None or (self.timestamp is not None and self.timestamp > other.timestamp):
+            return self
+        if self.timestamp == other.timestamp:
+            return Watermark(self.timestamp, self.msg_ids | other.msg_ids)
+        return other
+
+
+class AnalysisState:
+    """
+    第一轮遍历的结果
+
+    Attributes:
+        chat_name: 群名
+        message_count: 消息总数（含被过滤的消息）
+        skipped: 有文本但清理后为空的消息数
+        filtered: 被过滤规则丢弃的条数（按规则）
+        counters: USER_COUNTERS 中各计数器
+        uin_names: uin -> 按消息顺序用过的名称（相邻重复只记一次）
+        member_names: uin -> 最后一次出现的群名片
+        uins: 出现过的发送者 uin
+        texts: [(清理后文本, 发送者 uin), ...]，按消息顺序
+        tokens: texts 按基础词典分词的 TokenCache
+        reply_targets: 回复目标，按消息顺序；已知 uin 为 str，需按消息ID查找的为 int 消息键
+        msgid_keys / msgid_senders: 消息键及其发送者在 uin_pool 中的下标
+        uin_pool: msgid_senders 引用的 uin 列表
+        extra_msg_ids: 非数字消息ID -> 负数消息键（MessageTable.extra_msg_ids，各表单独分配，合并时重新映射）
+        head / tail: 首条 / 末条处理过的消息 (清理后文本, 发送者 uin)，用于补算跨分片的复读
+        watermark: 已处理消息的水位线（Watermark）
+        settings: 第一轮遍历使用的配置（first_pass_settings）
+        ngrams: texts 前缀的 n-gram 索引（ngrams.NgramIndex），增量分析时保存，没有时为 None
+    """
+
+    def __init__(self, chat_name=None):
+        self.chat_name = chat_name
+        self.message_count = 0
+        self.skipped = 0
+        self.filtered = Counter()
+        self.counters = {name: Counter() for name in USER_COUNTERS}
+        self.uin_names = defaultdict(list)
+        self.member_names = {}
+        self.uins = set()
+        self.texts = []
+        self.tokens = None
+        self.reply_targets = []
+        self.msgid_keys = array('q')
+        self.msgid_senders = array('i')
+        self.uin_pool = []
+        self.extra_msg_ids = {}
+        self.head = None
+        self.tail = None
+        self.watermark = Watermark()
+        self.settings = None
+        self.ngrams = None
+
+    def __len__(self):
+        """清理后有效文本的条数"""
+        return len(self.texts)
+
+    def copy(self):
+        """拷贝：分析会消耗状态中的文本和分词结果，从拷贝分析可以保留原状态"""
+        other = AnalysisState(self.chat_name)
+        other.message_count = self.message_count
+        other.skipped = self.skipped
+        other.filtered = Counter(self.filtered)
+        other.counters = {name: Counter(counter) for name, counter in self.counters.items()}
+        other.uin_names = defaultdict(list, {uin: list(names) for uin, names in self.uin_names.items()})
+        other.member_names = dict(self.member_names)
+        other.uins = set(self.uins)
+        other.texts = list(self.texts)
+        other.tokens = self.tokens.copy() if self.tokens is not None else None
+        other.reply_targets = list(self.reply_targets)
+        other.msgid_keys = array('q', self.msgid_keys)
+        other.msgid_senders = array('i', self.msgid_senders)
+        other.uin_pool = list(self.uin_pool)
+        other.extra_msg_ids = dict(self.extra_msg_ids)
+        other.head = self.head
+        other.tail = self.tail
+        other.watermark = self.watermark
+        other.settings = self.settings
+        # NgramIndex 更新时返回新的索引，不修改自身，可以共用
+        other.ngrams = self.ngrams
+        return other
+
+    def matches(self, config):
+        """状态是否按 config 中影响第一轮遍历的配置收集（未记录配置的状态视为一致）"""
+        return self.settings is None or self.settings == first_pass_settings(config)
+
+    def __add__(self, other):
+        if not isinstance(other, AnalysisState):
+            return NotImplemented
+        merged = self.copy()
+        merged += other
+        return merged
+
+    def __radd__(self, other):
+        # 支持 sum(states)
+        if other == 0:
+            return self.copy()
+        return NotImplemented
+
+    def __iadd__(self, other):
+        """把 other（消息在 self 之后）合并进来"""
+        if not isinstance(other, AnalysisState):
+            return NotImplemented
+        if self.settings is not None and other.settings is not None and self.settings != other.settings:
+            changed = [name for name in FIRST_PASS_FIELDS if self.settings.get(name) != other.settings.get(name)]
+            raise ValueError(f"分析状态的配置不一致，不能合并: {', '.join(changed)}")
+        if self.settings is None:
+            self.settings = other.settings
+        if self.chat_name is None:
+            self.chat_name = other.chat_name
+        # n-gram 索引覆盖 self 的文本，合并后仍是前缀
+        if self.ngrams is None and not self.texts:
+            self.ngrams = other.ngrams
+        self.watermark = self.watermark.merged(other.watermark)
+        self.message_count += other.message_count
+        self.skipped += other.skipped
+        self.filtered.update(other.filtered)
+
+        # 跨分片边界的复读：other 的首条消息与 self 的末条消息比较，计数顺序与整体遍历时相同
+        repeats = self.counters['user_repeat_count']
+        if self.tail is not None and other.head is not None:
+            prev_clean, prev_sender = self.tail
+            cleaned, sender = other.head
+            if cleaned and len(cleaned) >= 2 and cleaned == prev_clean and sender != prev_sender:
+                repeats[sender] += 1
+        for name, counter in other.counters.items():
+            self.counters[name].update(counter)
+        if other.head is not None:
+            self.head = self.head if self.head is not None else other.head
+            self.tail = other.tail
+
+        for uin, names in other.uin_names.items():
+            own = self.uin_names[uin]
+            own.extend(names[1:] if own and names and own[-1] == names[0] else names)
+        self.member_names.update(other.member_names)
+        self.uins |= other.uins
+
+        if other.tokens is not None:
+            self.tokens = other.tokens.copy() if self.tokens is None else TokenCache.concat([self.tokens, other.tokens])
+        self.texts.extend(other.texts)
+
+        # other 的负数消息键映射到合并后的编号，同一个非数字消息ID在各分片中对应同一个键
+        key_map = np.zeros(len(other.extra_msg_ids), dtype=np.int64)
+        for msg_id, key in other.extra_msg_ids.items():
+            new_key = self.extra_msg_ids.get(msg_id)
+            if new_key is None:
+                new_key = -2 - len(self.extra_msg_ids)
+                self.extra_msg_ids[msg_id] = new_key
+            key_map[-2 - key] = new_key
+        msgid_keys = np.array(other.msgid_keys, dtype=np.int64)
+        extra = msgid_keys <= -2
+        msgid_keys[extra] = key_map[-2 - msgid_keys[extra]]
+        self.msgid_keys.frombytes(msgid_keys.tobytes())
+        self.reply_targets.extend(
+            int(key_map[-2 - target]) if not isinstance(target, str) and target <= -2 else target
+            for target in other.reply_targets
+        )
+        pool_ids = {uin: i for i, uin in enumerate(self.uin_pool)}
+        remap = [pool_ids.setdefault(uin, len(pool_ids)) for uin in other.uin_pool]
+        self.uin_pool = list(pool_ids)
+        self.msgid_senders.extend(remap[sender_id] for sender_id in other.msgid_senders)
+        return self
+
+    def save(self, path):
+        """写入文件（先写临时文件再原子替换）"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with atomic_write(path) as f:
+            pickle.dump((STATE_FORMAT_VERSION, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """读取 save() 写入的文件；格式版本不符时抛出 ValueError"""
+        with open(path, 'rb') as f:
+            version, state = pickle.load(f)
+        if version != STATE_FORMAT_VERSION or not isinstance(state, cls):
+            raise ValueError(f"分析状态文件格式版本不符: {path}")
+        return state
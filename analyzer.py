@@ -1,24 +1,38 @@
 # -*- coding: utf-8 -*-
 import os
-import re
-import random
+import time
+import hashlib
 import string
-import math
 # 尝试导入 jieba_fast（更快），如果失败则回退到 jieba（标准版本）
 try:
     import jieba_fast as jieba
 except ImportError:
     import jieba
+from array import array
 from collections import Counter, defaultdict
-import config as cfg
+import numpy as np
 from utils import (
     is_emoji,
-    parse_timestamp,
-    parse_datetime,
     clean_text,
-    calculate_entropy,
-    analyze_single_chars,
+    sanitize_filename,
+    SingleCharStats,
 )
+from message_table import (
+    MessageTable,
+    MessageKeyIndex,
+    NO_TIME,
+    FLAG_LINK,
+    FLAG_FORWARD,
+    datetime_to_ms,
+    local_hour,
+    count_first_seen,
+)
+from message_filter import FilterPipeline, RULE_LABELS, parse_date_bound
+from analysis_config import resolve_config
+from analysis_state import AnalysisState, Watermark, USER_COUNTERS, first_pass_settings
+import tokenizer_cache
+from segmenter import AnalysisTokenizer, base_tokenizer, TokenCache, WordContributions, WordSamples, resolve_segment_workers
+from ngrams import NgramIndex, count_ngrams, count_ngrams_approx, select_new_words
 from logger import get_logger, init_logging
 
 init_logging()
@@ -33,50 +47,43 @@ except (AttributeError, Exception):
 
 logger = get_logger('analyzer')
 
-_STOPWORDS_CACHE = None
+# (STOPWORDS_PATHS, STOPWORDS_MANUAL, STOPWORDS_WARN_IF_MISSING, STOPWORDS_ENCODING) -> 停用词集合
+_STOPWORDS_CACHE = {}
 
-_DIGIT_SYMBOL_PATTERN = re.compile(r'^[\d\W]+$')
-_URL_PATTERN = re.compile(r'https?://')
-_SENTENCE_SPLIT_PATTERN = re.compile(r'[，。！？、；：""''（）\s\n\r,\.!?\(\)]')
 
-def load_stopwords(force_enable=None):
+def load_stopwords(force_enable=None, config=None):
     """
     加载停用词
     
+    结果按配置中的 STOPWORDS_* 项缓存，不同配置的分析各自得到对应的停用词。
+    
     Args:
         force_enable: 如果为True，强制加载停用词；如果为False，强制不加载；如果为None，使用配置文件的值
+        config: AnalysisConfig，None 时从 config 模块解析
     """
-    global _STOPWORDS_CACHE
-    
-    # 如果强制禁用，直接返回空集合
-    if force_enable is False:
-        return set()
-    
-    # 如果缓存已存在且不是强制启用，直接返回缓存
-    if _STOPWORDS_CACHE is not None and force_enable is not True:
-        return _STOPWORDS_CACHE
+    config = resolve_config(config)
     
     # 决定是否启用停用词
-    if force_enable is True:
-        use_stopwords = True
+    if force_enable is not None:
+        use_stopwords = force_enable
     else:
-        # 安全获取USE_STOPWORDS，如果不存在则默认为False
-        use_stopwords = getattr(cfg, 'USE_STOPWORDS', False)
+        use_stopwords = config.USE_STOPWORDS
     
     if not use_stopwords:
-        logger.info("📚 停用词功能已禁用")
-        _STOPWORDS_CACHE = set()
-        return _STOPWORDS_CACHE
+        if force_enable is None:
+            logger.info("📚 停用词功能已禁用")
+        return set()
+    
+    key = (config.STOPWORDS_PATHS, config.STOPWORDS_MANUAL,
+           config.STOPWORDS_WARN_IF_MISSING, config.STOPWORDS_ENCODING)
+    cached = _STOPWORDS_CACHE.get(key)
+    if cached is not None:
+        return cached
     
     stopwords = set()
     
     base_dir = os.path.dirname(__file__)
-    # 安全获取STOPWORDS_PATHS，如果不存在则使用默认路径
-    stopwords_paths = getattr(cfg, 'STOPWORDS_PATHS', [
-        'resources/baidu_stopwords.txt',
-        'backend/resources/baidu_stopwords.txt'
-    ])
-    candidate_paths = [os.path.join(base_dir, path) for path in stopwords_paths]
+    candidate_paths = [os.path.join(base_dir, path) for path in config.STOPWORDS_PATHS]
     
     stopwords_path = None
     for p in candidate_paths:
@@ -87,20 +94,17 @@ def load_stopwords(force_enable=None):
     file_count = 0
     if stopwords_path:
         try:
-            encoding = getattr(cfg, 'STOPWORDS_ENCODING', 'utf-8')
-            with open(stopwords_path, 'r', encoding=encoding) as f:
-                file_words = {line.strip() for line in f if line.strip() and not line.startswith('#')}
+            file_words = tokenizer_cache.stopword_file(stopwords_path, config.STOPWORDS_ENCODING)
             stopwords.update(file_words)
             file_count = len(file_words)
             logger.info(f"📚 从文件加载停用词 {file_count} 个 (来源: {os.path.basename(stopwords_path)})")
         except Exception as e:
             logger.error(f"❌ 加载停用词文件失败: {e}")
     else:
-        warn_if_missing = getattr(cfg, 'STOPWORDS_WARN_IF_MISSING', True)
-        if warn_if_missing:
+        if config.STOPWORDS_WARN_IF_MISSING:
             logger.warning(f"⚠️  停用词文件不存在，尝试路径: {candidate_paths}")
     
-    manual_words = set(cfg.STOPWORDS_MANUAL) if hasattr(cfg, 'STOPWORDS_MANUAL') else set()
+    manual_words = set(config.STOPWORDS_MANUAL)
         
     stopwords.update(manual_words)
     manual_count = len(manual_words)
@@ -110,33 +114,69 @@ def load_stopwords(force_enable=None):
         logger.info(f"📝 手动添加停用词 {manual_count} 个")
     logger.info(f"✅ 停用词总数: {total_count} 个 (文件: {file_count}, 手动: {manual_count})")
     
-    _STOPWORDS_CACHE = stopwords
-    return _STOPWORDS_CACHE
+    _STOPWORDS_CACHE[key] = stopwords
+    return stopwords
+
+
+def warm_up(config=None):
+    """
+    预加载分词词典和停用词，返回耗时（秒）
+
+    服务进程启动时调用，词典加载不再落在第一个请求上。
+    """
+    start = time.perf_counter()
+    base_tokenizer()
+    load_stopwords(force_enable=True, config=config)
+    return time.perf_counter() - start
 
 
 class ChatAnalyzer:
-    def __init__(self, data, use_stopwords=None):
+    def __init__(self, data, use_stopwords=None, config=None, since=None):
+        """
+        Args:
+            data: load_json / load_message_table 的结果
+            use_stopwords: 是否使用停用词；None 时取配置 USE_STOPWORDS
+            config: AnalysisConfig；None 时从 config 模块解析一份快照，分析过程中不再读取全局配置
+            since: 上次分析的 AnalysisState；传入时只处理比它的水位线更新的消息（增量分析），
+                data 须不带加载时过滤（加载时丢弃的消息无法区分新旧）
+        """
+        self.config = resolve_config(config)
+        self._watermark = since.watermark if since is not None else Watermark()
+        if since is not None and data.get('messageFilter') is not None:
+            raise ValueError("增量分析的消息不能带加载时过滤（message_filter）")
+        # 机器人、屏蔽词等过滤规则，每次分析编译一次，按块整列求值
+        self._filters = FilterPipeline.from_config(self.config)
         self.data = data
         self.messages = data.get('messages', [])
         self.chat_name = data.get('chatName', data.get('chatInfo', {}).get('name', '未知群聊'))
-
-        # 如果传入了use_stopwords参数，使用传入的值；否则使用配置文件的值
+        # 列表先转为列式存储；既不是列表也不是 MessageTable 时（如 load_json(lazy=True) 返回的迭代器），
+        # 在 analyze() 中分块单遍流式消费
+        if isinstance(self.messages, list):
+            self.messages = MessageTable.from_messages(self.messages)
+        self.streaming = not isinstance(self.messages, MessageTable)
+        # 被过滤规则丢弃的条数（按规则），加载时已被 MessageFilter 丢弃的机器人消息也计入
+        self._filtered = Counter(bot=0 if self.streaming else self._prefiltered()['bot'])
+
+        # 如果传入了use_stopwords参数，使用传入的值；否则使用配置的值
         if use_stopwords is not None:
             self.use_stopwords = use_stopwords
         else:
-            # 安全获取USE_STOPWORDS，如果不存在则默认为False
-            self.use_stopwords = getattr(cfg, 'USE_STOPWORDS', False)
+            self.use_stopwords = self.config.USE_STOPWORDS
         
         # 根据use_stopwords参数决定是否加载停用词
         if self.use_stopwords:
-            self.stopwords = load_stopwords(force_enable=True)
+            self.stopwords = load_stopwords(force_enable=True, config=self.config)
         else:
             self.stopwords = set()
         
-        self._filter_messages_and_build_mappings()
+        self._init_time_filter()
+        self._init_name_mapping()
+        if not self.streaming:
+            self._filter_messages_and_build_mappings()
         self.word_freq = Counter()
-        self.word_samples = defaultdict(list)
-        self.word_contributors = defaultdict(Counter)
+        self.word_samples = {}
+        self._sample_index = WordSamples()
+        self.word_contributors = WordContributions()
         self.user_msg_count = Counter()
         self.user_char_count = Counter()
         self.user_char_per_msg = {}
@@ -156,94 +196,135 @@ class ChatAnalyzer:
         self.merged_words = {}
         self.single_char_stats = {}  
         self.cleaned_texts_with_sender = []  # 改为存储 (文本, 发送者uin) 元组
+        # 本次分析的分词器：新词只加入它自己的词典，不影响同一进程中的其他分析
+        self.tokenizer = AnalysisTokenizer()
+        # 本次分析加入词典的 (词, 词频)，按添加顺序；并行分词时各进程据此安装新词
+        self._user_words = []
+        self.segment_workers = resolve_segment_workers(self.config.SEGMENT_WORKERS)
+        # 分词结果缓存，及其已应用的新词数（_user_words 的前缀长度）
+        self._tokens = None
+        self._applied_words = 0
+        # 回复目标按消息顺序记录：已知 uin 为 str，需按消息ID查找的为 int 消息键，遍历结束后统一解析
+        self._reply_targets = []
+        self._prev_clean = None
+        self._prev_sender = None
+        self._head = None
+        self._skipped = 0
+        # from_state 传入的第一轮结果，analyze() 时不再遍历消息
+        self._state = None
+        # 新词发现是否使用可增量更新的 n-gram 索引（from_state 的 track_ngrams），及更新后的索引
+        self._track_ngrams = False
+        self.ngram_index = None
+
+    def _init_time_filter(self):
+        """解析时间过滤配置"""
+        self._message_start_date = self.config.MESSAGE_START_DATE
+        self._message_end_date = self.config.MESSAGE_END_DATE
+        self._time_filter_enabled = not (self._message_start_date is None and self._message_end_date is None)
+        self._start_dt = None
+        self._end_dt = None
+        self._start_ms = None
+        self._end_ms = None
+        if not self._time_filter_enabled:
+            return
+
+        if self._message_start_date:
+            try:
+                self._start_dt = parse_date_bound(self._message_start_date)
+                self._start_ms = datetime_to_ms(self._start_dt)
+            except Exception as e:
+                logger.warning(f"起始日期格式错误: {self._message_start_date}, 错误: {e}")
+        
+        if self._message_end_date:
+            try:
+                self._end_dt = parse_date_bound(self._message_end_date, end_of_day=True)
+                self._end_ms = datetime_to_ms(self._end_dt)
+            except Exception as e:
+                logger.warning(f"结束日期格式错误: {self._message_end_date}, 错误: {e}")
+
+    def _select_rows(self, table):
+        """按时间范围和增量分析的水位线过滤，返回保留的行号，并推进水位线"""
+        if not self._time_filter_enabled:
+            rows = np.arange(len(table))
+        else:
+            rows = np.flatnonzero(table.time_mask(self._start_ms, self._end_ms))
+        rows = self._watermark.newer(table, rows)
+        self._watermark = self._watermark.advance(table, rows)
+        return rows
+
+    def _apply_filters(self, table, rows):
+        """对时间过滤后的行求值过滤规则，返回保留的行号，并累计各规则丢弃的条数"""
+        keep, dropped = self._filters.evaluate(table, rows)
+        self._filtered.update(dropped)
+        return rows[keep]
+
+    def _log_time_filter(self, original_count, filtered_count):
+        if self._start_dt or self._end_dt:
+            time_range = []
+            if self._start_dt:
+                time_range.append(f"从 {self._message_start_date}")
+            if self._end_dt:
+                time_range.append(f"到 {self._message_end_date}")
+            logger.info(f"⏰ 时间范围过滤: {' '.join(time_range)}")
+            logger.info(f"   原始消息: {original_count} 条, 过滤后: {filtered_count} 条")
+
+    def _prefiltered(self):
+        """加载时已被 MessageFilter 丢弃的条数（按原因），未使用加载过滤时为空"""
+        message_filter = self.data.get('messageFilter')
+        return message_filter.dropped if message_filter is not None else Counter()
 
-    
     def _filter_messages_and_build_mappings(self):
         """
-        合并时间过滤和构建 uin 到 name 及 msgid_to_sender 的映射，
-        减少两次遍历带来的性能开销
+        合并时间过滤和收集 uin 到 name 及 msgid_to_sender 的映射信息，
+        减少两次遍历带来的性能开销（名称映射在第一轮结束后建立）
         """
-        # 安全获取时间过滤配置
-        message_start_date = getattr(cfg, 'MESSAGE_START_DATE', None)
-        message_end_date = getattr(cfg, 'MESSAGE_END_DATE', None)
-        
-        if message_start_date is None and message_end_date is None:
-            filtered_messages = self.messages
-        else:
-            from datetime import datetime
-            start_dt = None
-            end_dt = None
-            
-            if message_start_date:
-                try:
-                    start_dt = datetime.strptime(message_start_date, '%Y-%m-%d')
-                    start_dt = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
-                    from datetime import timezone, timedelta
-                    start_dt = start_dt.replace(tzinfo=timezone(timedelta(hours=8)))
-                except Exception as e:
-                    logger.warning(f"起始日期格式错误: {message_start_date}, 错误: {e}")
-            
-            if message_end_date:
-                try:
-                    end_dt = datetime.strptime(message_end_date, '%Y-%m-%d')
-                    end_dt = end_dt.replace(hour=23, minute=59, second=59, microsecond=999999)
-                    from datetime import timezone, timedelta
-                    end_dt = end_dt.replace(tzinfo=timezone(timedelta(hours=8)))
-                except Exception as e:
-                    logger.warning(f"结束日期格式错误: {message_end_date}, 错误: {e}")
-            
-            filtered_messages = []
-            for msg in self.messages:
-                timestamp = msg.get('timestamp', '')
-                msg_dt = parse_datetime(timestamp)
-                if msg_dt is None:
-                    continue
-                if start_dt and msg_dt < start_dt:
-                    continue
-                if end_dt and msg_dt > end_dt:
-                    continue
-                filtered_messages.append(msg)
-            
-            filtered_count = len(filtered_messages)
-            original_count = len(self.messages)
-            if start_dt or end_dt:
-                time_range = []
-                if start_dt:
-                    time_range.append(f"从 {message_start_date}")
-                if end_dt:
-                    time_range.append(f"到 {message_end_date}")
-                logger.info(f"⏰ 时间范围过滤: {' '.join(time_range)}")
-                logger.info(f"   原始消息: {original_count} 条, 过滤后: {filtered_count} 条")
-
-        self.messages = filtered_messages
-        
-        uin_names = defaultdict(list)
-        uin_member_names = {}
-        msgid_to_sender = {}
-        all_uins = set()
-
-        for msg in self.messages:
-            if self._is_bot_message(msg):
-                continue
-            sender = msg.get('sender', {})
-            uin = sender.get('uin')
-            name = (sender.get('name') or '').strip()
-            msg_id = msg.get('messageId')
-            if uin:
-                all_uins.add(uin)
-            if uin and name:
-                if not uin_names[uin] or uin_names[uin][-1] != name:
-                    uin_names[uin].append(name)
-            if uin:
-                raw_msg = msg.get('rawMessage', {})
-                send_member_name = raw_msg.get('sendMemberName', '').strip()
-                if send_member_name:
-                    uin_member_names[uin] = send_member_name
-            if msg_id and uin:
-                msgid_to_sender[msg_id] = uin
+        self._rows = self._select_rows(self.messages)
+        # 加载时丢弃的时间范围外消息和机器人消息仍计入原始条数 / 消息总数，与不过滤时一致
+        prefiltered = self._prefiltered()
+        if self._time_filter_enabled:
+            self._log_time_filter(len(self.messages) + prefiltered['time'] + prefiltered['bot'],
+                                  len(self._rows) + prefiltered['bot'])
+
+        # 被过滤的消息同样计入消息总数
+        self.message_count = len(self._rows) + prefiltered['bot']
+        self._rows = self._apply_filters(self.messages, self._rows)
+        for row in self.messages.iter_rows(self._rows):
+            self._collect_sender_info(row)
+
+    def _init_name_mapping(self):
+        self.message_count = 0
+        self.uin_to_name = {}
+        self._uin_names = defaultdict(list)
+        self._uin_member_names = {}
+        self._all_uins = set()
+        # msgid_to_sender 以 (消息键, 发送者 id) 两列收集，遍历结束后建成排序索引
+        self._msgid_keys = array('q')
+        self._msgid_senders = array('i')
+        self._uin_pool = []
+        self._extra_msg_ids = {}
+
+    def _collect_sender_info(self, row):
+        """收集单条消息的发送者名称和 msgid_to_sender 映射"""
+        uin = row.sender
+        name = row.name
+        if uin:
+            self._all_uins.add(uin)
+        if uin and name:
+            uin_names = self._uin_names[uin]
+            if not uin_names or uin_names[-1] != name:
+                uin_names.append(name)
+        if uin and row.member_name:
+            self._uin_member_names[uin] = row.member_name
+        if row.msg_key != -1 and uin:
+            self._msgid_keys.append(row.msg_key)
+            self._msgid_senders.append(row.sender_id)
+
+    def _build_name_mapping(self):
+        uin_names = self._uin_names
+        uin_member_names = self._uin_member_names
 
         self.uin_to_name = {}
-        for uin in all_uins:
+        for uin in self._all_uins:
             chosen_name = None
             
             # 优先使用有效的name
@@ -265,46 +346,111 @@ class ChatAnalyzer:
                 chosen_name = f"用户{uin}" 
             
             self.uin_to_name[uin] = chosen_name
-        
-        self.msgid_to_sender = msgid_to_sender
 
-    def _is_bot_message(self, msg):
-        """判断是否为机器人消息（基于 subMsgType 或 配置的机器人UIN）"""
-        # 安全获取FILTER_BOT_MESSAGES，如果不存在则默认为True
-        filter_bot = getattr(cfg, 'FILTER_BOT_MESSAGES', True)
-        if not filter_bot:
-            return False
-        
-        raw_msg = msg.get('rawMessage', {})
-        sub_msg_type = raw_msg.get('subMsgType', 0)
-        if sub_msg_type in [577, 65]:
-            return True
-        
-        # 安全获取BOT_UINS，如果不存在则默认为空列表
-        bot_uins = getattr(cfg, 'BOT_UINS', [])
-        if bot_uins:
-            sender_uin = msg.get('sender', {}).get('uin')
-            if sender_uin and str(sender_uin) in [str(uin) for uin in bot_uins]:
-                return True
-        
-        return False
+        # 名称映射建好后不再需要中间结果
+        self._uin_names = defaultdict(list)
+        self._uin_member_names = {}
 
     def get_name(self, uin):
         return self.uin_to_name.get(uin, f"未知用户({uin})")
 
-    def analyze(self):
-        logger.info(f"📊 开始分析: {self.chat_name}")
-        logger.info(f"📝 消息总数: {len(self.messages)}")
+    @classmethod
+    def from_state(cls, state, use_stopwords=None, config=None, track_ngrams=False):
+        """
+        从 AnalysisState（可以是多个分片合并的结果）创建分析器，analyze() 时跳过第一轮遍历
 
-        logger.info("🧹 第一轮：处理消息，预处理文本、统计词频和趣味数据...")
-        self._process_messages_once()
+        传入的状态不会被修改，可以继续与其他状态合并或再次分析。
+        track_ngrams 为 True 时新词发现使用并更新 state.ngrams（没有时建立），
+        分析后更新的索引在 analyzer.ngram_index，可存回状态供下次增量分析使用；
+        近似新词发现（NEW_WORD_APPROXIMATE）不使用索引，analyzer.ngram_index 为 None
+        """
+        analyzer = cls({'messages': [], 'chatName': state.chat_name or '未知群聊'},
+                       use_stopwords=use_stopwords, config=config)
+        analyzer._state = state.copy()
+        analyzer._track_ngrams = track_ngrams
+        return analyzer
+
+    def collect_state(self):
+        """
+        第一轮遍历：过滤、收集名称信息、趣味统计、清理文本并按基础词典分词，结果打包为 AnalysisState
 
-        logger.info("🔤 分析单字独立性...")
-        self.single_char_stats = analyze_single_chars(
-            [text for text, _ in self.cleaned_texts_with_sender]
+        返回的状态可以与其他分片的状态合并（见 analysis_state），再用 from_state 完成分析
+        """
+        if self.streaming:
+            logger.info("🧹 第一轮：流式读取消息，预处理文本、统计词频和趣味数据...")
+            self._process_message_stream()
+            logger.info(f"📝 消息总数: {self.message_count}")
+        else:
+            logger.info(f"📝 消息总数: {self.message_count}")
+            logger.info("🧹 第一轮：处理消息，预处理文本、统计词频和趣味数据...")
+            self._process_messages_once()
+
+        state = AnalysisState(self.chat_name)
+        state.message_count = self.message_count
+        state.skipped = self._skipped
+        state.filtered = self._filtered
+        state.counters = {name: getattr(self, name) for name in USER_COUNTERS}
+        state.uin_names = self._uin_names
+        state.member_names = self._uin_member_names
+        state.uins = self._all_uins
+        state.texts = self.cleaned_texts_with_sender
+        state.tokens = TokenCache(
+            [text for text, _ in self.cleaned_texts_with_sender],
+            workers=self.segment_workers,
+            cache_size=self.config.SEGMENT_CACHE_SIZE,
+            tokenizer=self.tokenizer,
         )
+        state.reply_targets = self._reply_targets
+        state.msgid_keys = self._msgid_keys
+        state.msgid_senders = self._msgid_senders
+        state.uin_pool = self._uin_pool
+        state.extra_msg_ids = self._extra_msg_ids
+        state.head = self._head
+        state.tail = (self._prev_clean, self._prev_sender) if self._head is not None else None
+        state.watermark = self._watermark
+        state.settings = first_pass_settings(self.config)
+        return state
+
+    def _load_state(self, state):
+        """载入第一轮结果：建立名称映射、解析回复目标、统计词频"""
+        self.chat_name = state.chat_name or self.chat_name
+        self.message_count = state.message_count
+        self._skipped = state.skipped
+        self._filtered = state.filtered
+        for name, counter in state.counters.items():
+            setattr(self, name, counter)
+
+        self._uin_names = state.uin_names
+        self._uin_member_names = state.member_names
+        self._all_uins = state.uins
+        self._build_name_mapping()
+
+        self._reply_targets = state.reply_targets
+        self._msgid_keys = state.msgid_keys
+        self._msgid_senders = state.msgid_senders
+        self._uin_pool = state.uin_pool
+        self._resolve_reply_targets()
+
+        self.cleaned_texts_with_sender = state.texts
+        # 分词结果改用本次分析的分词器和设置，之后加入的新词只影响本次分析
+        self._tokens = state.tokens
+        self._tokens.tokenizer = self.tokenizer
+        self._tokens.workers = self.segment_workers
+        self._tokens.cache_size = self.config.SEGMENT_CACHE_SIZE
+        self.ngram_index = state.ngrams
+        self._finish_message_pass()
+
+    def analyze(self):
+        logger.info(f"📊 开始分析: {self.chat_name}")
+
+        if self._state is not None:
+            state, self._state = self._state, None
+            logger.info(f"📝 消息总数: {state.message_count}（从分析状态恢复）")
+        else:
+            state = self.collect_state()
+        self._load_state(state)
 
-        logger.info("🔍 新词发现...")
+        logger.info("🔍 新词发现与单字独立性分析...")
         discovered_count = self._discover_new_words()  
 
         logger.info("🔗 词组合并...")
@@ -315,189 +461,183 @@ class ChatAnalyzer:
             logger.info("🔄 重新分词以应用新词...")
             self._reprocess_word_frequency()
         
+        # 例句在过滤后只为导出的热词取出原文，文本要留到过滤完成
+        logger.info("🧹 过滤整理...")
+        self._filter_results()
+
         logger.info("🧹 释放临时内存...")
         if self.cleaned_texts_with_sender:
             memory_mb = len(self.cleaned_texts_with_sender) * 100 / 1024 / 1024
             self.cleaned_texts_with_sender.clear()
+            self._tokens = None
             logger.debug(f"已释放约 {memory_mb:.1f} MB 内存")
 
-        logger.info("🧹 过滤整理...")
-        self._filter_results()
-
         logger.info("✅ 分析完成!")
 
     def _process_messages_once(self):
         """一次遍历实现预处理文本、词频统计、趣味统计"""
+        self._uin_pool = self.messages.uins
+        self._extra_msg_ids = self.messages.extra_msg_ids
+        for row in self.messages.iter_rows(self._rows):
+            self._process_message(row)
+        self._count_time_buckets(self.messages, self._rows)
 
-        skipped = 0
-        bot_filtered = 0
-        prev_clean = None
-        prev_sender = None
-
-        for msg in self.messages:
-
-            if self._is_bot_message(msg):
-                continue
-            
-            sender_uin = msg.get('sender', {}).get('uin')
-            if not sender_uin:
-                continue
-
-            if self._is_bot_message(msg):
-                bot_filtered += 1
-                continue
-            
-            sender_uin = msg.get('sender', {}).get('uin')
-            if not sender_uin:
-                continue
-            
-            content = msg.get('content', {})
-            text = content.get('text', '') if isinstance(content, dict) else ''
-
-            at_contents = []
-            if '@' in text:
-                elements = msg.get('rawMessage', {}).get('elements', [])
-                for element in elements:
-                    text_element = element.get('textElement')
-                    if not text_element:
-                        continue
-                        
-                    at_type = text_element.get('atType', 0)
-                    content_text = text_element.get('content', '')
-                    
-                    if at_type == 2 and content_text:
-                        at_contents.append(content_text)
-                        
-            cleaned = clean_text(text, at_contents)
-            
-            if cleaned and len(cleaned) >= 1:
-                self.cleaned_texts_with_sender.append((cleaned, sender_uin))
-
-                words = list(jieba.cut(cleaned))
-
-                for word in words:
-                    word = word.strip()
-                    if not word:
-                        continue
-                    if self.use_stopwords and word in self.stopwords:
-                        continue
+    def _process_message_stream(self):
+        """
+        单遍流式处理：消息按块转为 MessageTable，时间过滤、名称信息和统计在同一次遍历中完成，
+        处理完的块即被丢弃。回复目标需要按消息ID查找的（包括前向引用），在第一轮结束后统一解析。
+        """
+        original_count = 0
+        for table in MessageTable.iter_chunks(self.messages):
+            # 各块共用字符串池和非数字消息ID的编号，发送者 id、消息键在块间一致
+            self._uin_pool = table.uins
+            self._extra_msg_ids = table.extra_msg_ids
+            rows = self._select_rows(table)
+            original_count += len(table)
+            self.message_count += len(rows)
+            rows = self._apply_filters(table, rows)
+            for row in table.iter_rows(rows):
+                self._collect_sender_info(row)
+                self._process_message(row)
+            self._count_time_buckets(table, rows)
+
+        # 惰性加载的过滤计数在读完后才完整
+        prefiltered = self._prefiltered()
+        original_count += prefiltered['time'] + prefiltered['bot']
+        self.message_count += prefiltered['bot']
+        self._filtered['bot'] += prefiltered['bot']
+        if self._time_filter_enabled:
+            self._log_time_filter(original_count, self.message_count)
+
+        # 群名可能位于 messages 之后，读完后再取一次
+        chat_info = self.data.get('chatInfo') or {}
+        self.chat_name = self.data.get('chatName', chat_info.get('name') or self.chat_name)
+        self.messages = []
+
+    def _resolve_reply_targets(self):
+        """用 msgid_to_sender 排序索引批量解析回复目标，并按原消息顺序计入 user_replied_count"""
+        msgid_index = MessageKeyIndex(self._msgid_keys, self._msgid_senders)
+        self._msgid_keys = array('q')
+        self._msgid_senders = array('i')
+
+        ref_keys = [target for target in self._reply_targets if not isinstance(target, str)]
+        sender_ids = iter(msgid_index.lookup(ref_keys).tolist())
+        uin_pool = self._uin_pool
+        for target in self._reply_targets:
+            if not isinstance(target, str):
+                sender_id = next(sender_ids)
+                target = uin_pool[sender_id] if sender_id >= 0 else None
+            if target and target != '0':
+                self.user_replied_count[target] += 1
+        logger.debug(f"回复: {len(self._reply_targets)} 条, 按消息ID查找 {len(ref_keys)} 条")
+        self._reply_targets = []
+
+    def _process_message(self, row):
+        """处理单条消息：预处理文本、词频统计、趣味统计"""
+        sender_uin = row.sender
+        if not sender_uin:
+            return
+        
+        text = row.text
+
+        at_contents = []
+        if '@' in text:
+            for at in row.ats:
+                if at.at_type == 2 and at.content:
+                    at_contents.append(at.content)
                     
-                    self.word_freq[word] += 1
-                    if sender_uin:
-                        self.word_contributors[word][sender_uin] += 1
-                    sample_count = getattr(cfg, 'SAMPLE_COUNT', 10)
-                    if len(self.word_samples[word]) < sample_count * 3:
-                        self.word_samples[word].append(cleaned)
-
-                self.user_msg_count[sender_uin] += 1
-                self.user_char_count[sender_uin] += len(cleaned)
-            else:
-                if text:
-                    skipped += 1
-
-            raw = msg.get('rawMessage', {})
-            elements = raw.get('elements', [])
+        cleaned = clean_text(text, at_contents)
+        
+        if cleaned and len(cleaned) >= 1:
+            # 分词和词频统计在遍历结束后按文本顺序批量进行（可并行）
+            self.cleaned_texts_with_sender.append((cleaned, sender_uin))
 
-            image_count = 0 
-            emoji_count_from_elements = 0 
-            has_forward = False
-            has_link = False
-            has_reply = False
+            self.user_msg_count[sender_uin] += 1
+            self.user_char_count[sender_uin] += len(cleaned)
+        else:
+            if text:
+                self._skipped += 1
+
+        # @ 统计
+        for at in row.ats:
+            if at.in_text and at.at_type > 0 and at.uid and at.uid != '0':
+                self.user_at_count[sender_uin] += 1
+                self.user_ated_count[at.uid] += 1
+
+        # 回复统计
+        for reply in row.replies:
+            # 优先用 senderUid（如果有的话）
+            target_uin = reply.sender_uid
+            if target_uin and target_uin != '0':
+                self._reply_targets.append(target_uin)
+                continue
 
-            
+            # 如果没有，回退到用 msgId 查找（-1 为缺失，0 为 '0'）
+            ref_key = reply.source_key
+            if ref_key == -1 or ref_key == 0:
+                ref_key = reply.replay_key
+            if ref_key != -1 and ref_key != 0:
+                self._reply_targets.append(ref_key)
+        
+        # 统计各项数据
+        if row.image_count > 0:
+            self.user_image_count[sender_uin] += row.image_count  
+        
+        if row.replies:
+            self.user_reply_count[sender_uin] += 1
+        
+        if row.flags & FLAG_LINK:
+            self.user_link_count[sender_uin] += 1
+        
+        if row.flags & FLAG_FORWARD:
+            self.user_forward_count[sender_uin] += 1    
 
-            for elem in elements:
-                elem_type = elem.get('elementType')
-                
-                if elem_type == 2:  # 图片元素
-                    pic_elem = elem.get('picElement', {})
-                    summary = pic_elem.get('summary', '')
-                    # 判断是否为表情包（summary格式为 [表情名称]）
-                    if summary and summary.startswith('[') and summary.endswith(']'):
-                        emoji_count_from_elements += 1
-                    else:
-                        image_count += 1
-                
-                elif elem_type == 1:  # 文本元素
-                    text_elem = elem.get('textElement', {})
-                    at_type = text_elem.get('atType', 0)
-                    at_uid = text_elem.get('atUid', '')
-                    at_uid_str = str(at_uid) if at_uid else ''
-                    if at_type > 0 and at_uid_str and at_uid_str != '0' and at_uid_str != '':
-                        self.user_at_count[sender_uin] += 1
-                        self.user_ated_count[at_uid_str] += 1
-                    
-                    # 链接统计
-                    text_content = text_elem.get('content', '')
-                    if re.search(_URL_PATTERN, text_content):
-                        has_link = True
-                
-                elif elem_type == 10:  # 链接元素
-                    has_link = True
-                
-                elif elem_type == 16 and 'multiForwardMsgElement' in elem:  # 合并转发元素
-                    has_forward = True
-                
-                elif elem_type == 7:  # 回复元素
-                    has_reply = True
-                    reply_elem = elem.get('replyElement', {})
-                    
-                    # 优先用 senderUid（如果有的话）
-                    target_uin = reply_elem.get('senderUid')
-                    
-                    # 如果没有，回退到用 msgId 查找
-                    if not target_uin or target_uin == '0':
-                        ref_msg_id = reply_elem.get('sourceMsgIdInRecords')
-                        if not ref_msg_id or ref_msg_id == '0':
-                            ref_msg_id = reply_elem.get('replayMsgId')
-                        
-                        if ref_msg_id and ref_msg_id != '0':
-                            target_uin = self.msgid_to_sender.get(ref_msg_id)
-                    
-                    if target_uin and str(target_uin) != '0':
-                        self.user_replied_count[str(target_uin)] += 1
-            
-            # 统计各项数据
-            if image_count > 0:
-                self.user_image_count[sender_uin] += image_count  
-            
-            if has_reply:
-                self.user_reply_count[sender_uin] += 1
-            
-            if has_link:
-                self.user_link_count[sender_uin] += 1
-            
-            if has_forward:
-                self.user_forward_count[sender_uin] += 1    
+        emoji_count = row.emoji_count + row.sticker_count
+        if emoji_count > 0:
+            self.user_emoji_count[sender_uin] += emoji_count
+        
+        if cleaned and len(cleaned) >= 2:
+            if cleaned == self._prev_clean and sender_uin != self._prev_sender:
+                self.user_repeat_count[sender_uin] += 1
 
-            emojis = content.get('emojis', []) if isinstance(content, dict) else []
-            emoji_count = len(emojis) + emoji_count_from_elements
-            if emoji_count > 0:
-                self.user_emoji_count[sender_uin] += emoji_count
-            
-            hour = parse_timestamp(msg.get('timestamp', ''))
-            if hour is not None:
-                self.hour_distribution[hour] += 1
-                # 安全获取时间范围配置
-                night_owl_hours = getattr(cfg, 'NIGHT_OWL_HOURS', range(0, 6))
-                early_bird_hours = getattr(cfg, 'EARLY_BIRD_HOURS', range(6, 9))
-                if hour in night_owl_hours:
-                    self.user_night_count[sender_uin] += 1
-                if hour in early_bird_hours:
-                    self.user_morning_count[sender_uin] += 1
-            
-            if cleaned and len(cleaned) >= 2:
-                if cleaned == prev_clean and sender_uin != prev_sender:
-                    self.user_repeat_count[sender_uin] += 1
+        if self._prev_sender is None:
+            self._head = (cleaned, sender_uin)
+        self._prev_clean = cleaned
+        self._prev_sender = sender_uin
 
-            prev_clean = cleaned
-            prev_sender = sender_uin
-        
-        # 处理跳过及机器人消息计数日志
-        if cfg.FILTER_BOT_MESSAGES and bot_filtered > 0:
-            logger.debug(f"有效文本: {len(self.cleaned_texts_with_sender)} 条, 跳过: {skipped} 条, 过滤机器人: {bot_filtered} 条")
+    def _count_time_buckets(self, table, rows):
+        """
+        小时分布、夜猫子、早起统计：对 _process_message 计入的行（未被过滤、有发送者、有时间戳）
+        整列计算东八区小时，按首次出现顺序累加，结果与逐条统计一致
+        """
+        rows = rows[table.sender_ids[rows] >= 0]
+        timestamps = table.timestamps[rows]
+        timed = timestamps != NO_TIME
+        hours = local_hour(timestamps[timed])
+        senders = table.sender_ids[rows[timed]]
+
+        for hour, count in zip(*count_first_seen(hours)):
+            self.hour_distribution[hour] += count
+
+        night_owl_hours = self.config.NIGHT_OWL_HOURS
+        early_bird_hours = self.config.EARLY_BIRD_HOURS
+        uins = table.uins
+        for counter, bucket_hours in ((self.user_night_count, night_owl_hours),
+                                      (self.user_morning_count, early_bird_hours)):
+            in_bucket = np.isin(hours, list(bucket_hours))
+            for sender_id, count in zip(*count_first_seen(senders[in_bucket])):
+                counter[uins[sender_id]] += count
+
+    def _finish_message_pass(self):
+        self._count_word_frequency()
+
+        # 处理跳过及被过滤消息计数日志
+        filtered = ', '.join(f"过滤{label}: {self._filtered[rule]} 条"
+                             for rule, label in RULE_LABELS if self._filtered[rule])
+        if filtered:
+            logger.debug(f"有效文本: {len(self.cleaned_texts_with_sender)} 条, 跳过: {self._skipped} 条, {filtered}")
         else:
-            logger.debug(f"有效文本: {len(self.cleaned_texts_with_sender)} 条, 跳过: {skipped} 条")
+            logger.debug(f"有效文本: {len(self.cleaned_texts_with_sender)} 条, 跳过: {self._skipped} 条")
 
         # 计算人均字数（保留1位小数）
         for uin in self.user_msg_count:
@@ -507,66 +647,48 @@ class ChatAnalyzer:
                 self.user_char_per_msg[uin] = round(char_count / msg_count, 1)
 
     def _discover_new_words(self):
-        """新词发现"""
-        ngram_freq = Counter()
-        left_neighbors = defaultdict(Counter)
-        right_neighbors = defaultdict(Counter)
-        total_chars = 0
-        
-        for text, _ in self.cleaned_texts_with_sender:
-            sentences = re.split(_SENTENCE_SPLIT_PATTERN, text)
-            for sentence in sentences:
-                sentence = sentence.strip()
-                if len(sentence) < 2:
-                    continue
-                total_chars += len(sentence)
-                
-                for n in range(2, min(6, len(sentence) + 1)):
-                    for i in range(len(sentence) - n + 1):
-                        ngram = sentence[i:i+n]
-                        # 只跳过纯空格
-                        if not ngram.strip():
-                            continue
-                        ngram_freq[ngram] += 1
-                        if i > 0:
-                            left_neighbors[ngram][sentence[i-1]] += 1
-                        else:
-                            left_neighbors[ngram]['<BOS>'] += 1
-                        if i + n < len(sentence):
-                            right_neighbors[ngram][sentence[i+n]] += 1
-                        else:
-                            right_neighbors[ngram]['<EOS>'] += 1
-        
-        for word, freq in ngram_freq.items():
-            if freq < cfg.NEW_WORD_MIN_FREQ:
-                continue
-            
-            # 邻接熵
-            left_ent = calculate_entropy(left_neighbors[word])
-            right_ent = calculate_entropy(right_neighbors[word])
-            min_ent = min(left_ent, right_ent)
-            if min_ent < cfg.ENTROPY_THRESHOLD:
-                continue
-            
-            # PMI
-            min_pmi = float('inf')
-            for i in range(1, len(word)):
-                left_freq = ngram_freq.get(word[:i], 0)
-                right_freq = ngram_freq.get(word[i:], 0)
-                if left_freq > 0 and right_freq > 0:
-                    pmi = math.log2((freq * total_chars) / (left_freq * right_freq + 1e-10))
-                    min_pmi = min(min_pmi, pmi)
-            
-            if min_pmi == float('inf'):
-                min_pmi = 0
-            
-            if min_pmi < cfg.PMI_THRESHOLD:
-                continue
-            
-            self.discovered_words.add(word)
+        """新词发现；编码文本的同一遍扫描中统计单字独立性（single_char_stats）"""
+        texts = [text for text, _ in self.cleaned_texts_with_sender]
+        char_stats = SingleCharStats()
+        if self.config.NEW_WORD_APPROXIMATE:
+            # 近似模式：重频摘要筛选候选，内存不随消息量增长
+            stats, report = count_ngrams_approx(
+                texts,
+                self.config.NEW_WORD_MIN_FREQ,
+                memory_mb=self.config.NEW_WORD_MEMORY_MB,
+                char_stats=char_stats,
+            )
+            logger.info(f"🔍 近似新词发现: 候选 {report['candidates']} 个, "
+                        f"预计召回率 {report['expected_recall']:.1%} (下界 {report['recall_lower_bound']:.1%})")
+            logger.debug(f"各长度误差上界: {report['error_bounds']}")
+            if self._track_ngrams:
+                # 近似模式不维护精确的 n-gram 索引：丢弃已有索引（本次新增的文本未计入），
+                # 之后切回精确模式时整体重建
+                self.ngram_index = None
+        elif self._track_ngrams:
+            # 增量分析：已有索引时只扫描上次之后加入的文本
+            if self.ngram_index is None:
+                self.ngram_index = NgramIndex.build(texts, self.config.NEW_WORD_MIN_FREQ)
+                stats = self.ngram_index.select(self.config.NEW_WORD_MIN_FREQ)
+            else:
+                self.ngram_index, stats, report = self.ngram_index.update(texts, self.config.NEW_WORD_MIN_FREQ)
+                if report['rebuilt']:
+                    logger.info("🔍 n-gram 索引整体重建")
+                else:
+                    logger.info(f"🔍 n-gram 索引增量更新: 重新统计 {report['resolved']} 个 n-gram, "
+                                f"扫描旧文本 {report['rescanned']} 条")
+            char_stats = self.ngram_index.char_stats
+        else:
+            # 两遍统计：先筛出达到频次阈值的 n-gram，再只为它们统计左右邻字
+            stats = count_ngrams(texts, self.config.NEW_WORD_MIN_FREQ, char_stats=char_stats)
+        self.single_char_stats = char_stats.result()
+
+        # 邻接熵与切分 PMI 对全部候选向量化计算
+        self.discovered_words.update(select_new_words(stats, self.config.ENTROPY_THRESHOLD, self.config.PMI_THRESHOLD))
         
         for word in self.discovered_words:
-            jieba.add_word(word, freq=1000)
+            self.tokenizer.add_word(word, freq=1000)
+            self._user_words.append((word, 1000))
         
         discovered_count = len(self.discovered_words)
 
@@ -575,33 +697,23 @@ class ChatAnalyzer:
         return discovered_count
 
     def _merge_word_pairs(self):
-        bigram_counter = Counter()
-        word_right_counter = Counter()
-        
-        for text, _ in self.cleaned_texts_with_sender:
-            words = [w for w in jieba.cut(text) if w.strip()]
-            for i in range(len(words) - 1):
-                w1, w2 = words[i].strip(), words[i+1].strip()
-                if not w1 or not w2:
-                    continue
-                if re.match(_DIGIT_SYMBOL_PATTERN, w1) or re.match(_DIGIT_SYMBOL_PATTERN, w2):
-                    continue
-                bigram_counter[(w1, w2)] += 1
-                word_right_counter[w1] += 1
+        self._apply_new_words()
+        bigram_counter, word_right_counter = self._tokens.count_word_pairs()
         
         for (w1, w2), count in bigram_counter.items():
             merged = w1 + w2
-            if len(merged) > cfg.MERGE_MAX_LEN:
+            if len(merged) > self.config.MERGE_MAX_LEN:
                 continue
-            if count < cfg.MERGE_MIN_FREQ:
+            if count < self.config.MERGE_MIN_FREQ:
                 continue
             
             # 条件概率 P(w2|w1)
             if word_right_counter[w1] > 0:
                 prob = count / word_right_counter[w1]
-                if prob >= cfg.MERGE_MIN_PROB:
+                if prob >= self.config.MERGE_MIN_PROB:
                     self.merged_words[merged] = (w1, w2, count, prob)
-                    jieba.add_word(merged, freq=count * 1000)
+                    self.tokenizer.add_word(merged, freq=count * 1000)
+                    self._user_words.append((merged, count * 1000))
 
         merged_count = len(self.merged_words)
         
@@ -614,30 +726,33 @@ class ChatAnalyzer:
         
         return merged_count
     
+    def _apply_new_words(self):
+        """新词加入词典后，只重新切分包含新词的文本，其余文本沿用已有的切分结果"""
+        new_words = [word for word, _ in self._user_words[self._applied_words:]]
+        self._applied_words = len(self._user_words)
+        if not new_words:
+            return
+        resegmented = self._tokens.resegment(
+            [text for text, _ in self.cleaned_texts_with_sender],
+            new_words,
+            user_words=self._user_words,
+        )
+        logger.debug(f"重新切分包含新词的文本: {resegmented}/{len(self._tokens)} 条")
+
+    def _count_word_frequency(self):
+        """在分词结果缓存上统计词频、贡献者和例句"""
+        texts = self.cleaned_texts_with_sender
+        self.word_freq, self.word_contributors, self._sample_index = self._tokens.count_words(
+            [sender_uin for _, sender_uin in texts],
+            stopwords=self.stopwords if self.use_stopwords else (),
+            sample_count=self.config.SAMPLE_COUNT,
+            seed=self.config.SAMPLE_SEED,
+        )
+
     def _reprocess_word_frequency(self):
-        # 清空旧的词频统计
-        self.word_freq = Counter()
-        self.word_samples = defaultdict(list)
-        self.word_contributors = defaultdict(Counter)
-        
-        # 重新处理每条消息
-        for cleaned, sender_uin in self.cleaned_texts_with_sender:
-            # 重新分词
-            words = list(jieba.cut(cleaned))
-            
-            for word in words:
-                word = word.strip()
-                if not word:
-                    continue
-                if self.use_stopwords and word in self.stopwords:
-                    continue
-                
-                # 重新统计
-                self.word_freq[word] += 1
-                if sender_uin:
-                    self.word_contributors[word][sender_uin] += 1
-                if len(self.word_samples[word]) < cfg.SAMPLE_COUNT * 3:
-                    self.word_samples[word].append(cleaned)
+        # 用加入新词后的词典重新分词统计
+        self._apply_new_words()
+        self._count_word_frequency()
         
         logger.debug(f"重新分词完成，当前词汇总数: {len(self.word_freq)}")
 
@@ -646,15 +761,15 @@ class ChatAnalyzer:
         filtered_freq = Counter()
         
         for word, freq in self.word_freq.items():
-            if len(word) < cfg.MIN_WORD_LEN or len(word) > cfg.MAX_WORD_LEN:
+            if len(word) < self.config.MIN_WORD_LEN or len(word) > self.config.MAX_WORD_LEN:
                 continue
-            if freq < cfg.MIN_FREQ:
+            if freq < self.config.MIN_FREQ:
                 continue
             if is_emoji(word):
                 filtered_freq[word] = freq
                 continue
 
-            if word in cfg.WHITELIST:
+            if word in self.config.WHITELIST:
                 filtered_freq[word] = freq
                 continue
             
@@ -667,7 +782,7 @@ class ChatAnalyzer:
                 stats = self.single_char_stats.get(word)
                 if stats:
                     total, indep, ratio = stats
-                    if ratio < cfg.SINGLE_MIN_SOLO_RATIO or indep < cfg.SINGLE_MIN_SOLO_COUNT:
+                    if ratio < self.config.SINGLE_MIN_SOLO_RATIO or indep < self.config.SINGLE_MIN_SOLO_COUNT:
                         continue
                 else:
                     continue
@@ -676,17 +791,18 @@ class ChatAnalyzer:
         
         self.word_freq = filtered_freq
         
-        # 采样
-        for word in self.word_samples:
-            samples = self.word_samples[word]
-            sample_count = getattr(cfg, 'SAMPLE_COUNT', 10)
-            if len(samples) > sample_count:
-                self.word_samples[word] = random.sample(samples, sample_count)
+        # 例句：只为导出的热词从文本下标取出原文
+        texts = self.cleaned_texts_with_sender
+        self.word_samples = {
+            word: [texts[i][0] for i in self._sample_index.get(word)]
+            for word, _ in self.get_top_words()
+        }
+        self._sample_index = WordSamples()
         
         logger.debug(f"过滤后 {len(self.word_freq)} 个词")
 
     def get_top_words(self, n=None):
-        n = n or cfg.TOP_N
+        n = n or self.config.TOP_N
         return self.word_freq.most_common(n)
 
     def get_word_detail(self, word):
@@ -695,19 +811,19 @@ class ChatAnalyzer:
             'freq': self.word_freq.get(word, 0),
             'samples': self.word_samples.get(word, []),
             'contributors': [(self.get_name(uin), count) 
-                           for uin, count in self.word_contributors[word].most_common(cfg.CONTRIBUTOR_TOP_N)]
+                           for uin, count in self.word_contributors.top(word, self.config.CONTRIBUTOR_TOP_N)]
         }
 
     def get_fun_rankings(self):
         rankings = {}
         
-        def fmt(counter, top_n=cfg.RANK_TOP_N):
+        def fmt(counter, top_n=self.config.RANK_TOP_N):
             return [(self.get_name(uin), count) for uin, count in counter.most_common(top_n)]
         
         rankings['话痨榜'] = fmt(self.user_msg_count)
         rankings['字数榜'] = fmt(self.user_char_count)
         
-        sorted_avg = sorted(self.user_char_per_msg.items(), key=lambda x: x[1], reverse=True)[:cfg.RANK_TOP_N]
+        sorted_avg = sorted(self.user_char_per_msg.items(), key=lambda x: x[1], reverse=True)[:self.config.RANK_TOP_N]
         rankings['长文王'] = [(self.get_name(uin), f"{avg:.1f}字/条") for uin, avg in sorted_avg]
         
         rankings['图片狂魔'] = fmt(self.user_image_count)
@@ -740,21 +856,21 @@ class ChatAnalyzer:
                         'uin': uin,
                         'count': count
                     }
-                    for uin, count in self.word_contributors[word].most_common(cfg.CONTRIBUTOR_TOP_N)
+                    for uin, count in self.word_contributors.top(word, self.config.CONTRIBUTOR_TOP_N)
                 ],
-                'samples': self.word_samples.get(word, [])[:getattr(cfg, 'SAMPLE_COUNT', 10)]
+                'samples': self.word_samples.get(word, [])[:self.config.SAMPLE_COUNT]
             })
 
         result = {
             'chatName': self.chat_name,
-            'messageCount': len(self.messages),
+            'messageCount': self.message_count,
             'topWords': top_words,
             'rankings': {},
             'hourDistribution': {str(h): self.hour_distribution.get(h, 0) for h in range(24)}
         }
         
         # 趣味榜单（包含uin）
-        def fmt_with_uin(counter, top_n=cfg.RANK_TOP_N):
+        def fmt_with_uin(counter, top_n=self.config.RANK_TOP_N):
             return [
                 {'name': self.get_name(uin), 'uin': uin, 'value': count}
                 for uin, count in counter.most_common(top_n)
@@ -764,7 +880,7 @@ class ChatAnalyzer:
         result['rankings']['字数榜'] = fmt_with_uin(self.user_char_count)
         
         # 长文王特殊处理
-        sorted_avg = sorted(self.user_char_per_msg.items(), key=lambda x: x[1], reverse=True)[:cfg.RANK_TOP_N]
+        sorted_avg = sorted(self.user_char_per_msg.items(), key=lambda x: x[1], reverse=True)[:self.config.RANK_TOP_N]
         result['rankings']['长文王'] = [
             {'name': self.get_name(uin), 'uin': uin, 'value': f"{avg:.1f}字/条"}
             for uin, avg in sorted_avg
@@ -783,3 +899,71 @@ class ChatAnalyzer:
         result['rankings']['复读机'] = fmt_with_uin(self.user_repeat_count)
         
         return result
+
+
+def has_chat_name(chat_name):
+    """导出是否带有群名（加载时缺失的群名以 '未知群聊' 代替）"""
+    return bool(chat_name) and chat_name != '未知群聊'
+
+
+def state_path_for(chat_name, config=None):
+    """
+    群的分析状态文件路径：ANALYSIS_STATE_DIR 下按群名命名
+
+    导出中没有群号，群名是唯一的标识；文件名附带原始群名的哈希，
+    清理非法字符后相同的不同群名（如 "a/b" 与 "a_b"）不会共用状态。
+    """
+    config = resolve_config(config)
+    digest = hashlib.sha1(chat_name.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(config.ANALYSIS_STATE_DIR, f"{sanitize_filename(chat_name)}_{digest}.state")
+
+
+def analyze_incremental(data, state_path=None, use_stopwords=None, config=None):
+    """
+    增量分析：只处理 data 中比上次分析更新的消息，与已保存的状态合并后完成分析，并更新状态文件
+
+    新的导出可以与已分析的消息重叠（如每月导出全年的记录），按状态中的水位线跳过已处理的消息。
+    词频、各榜单、小时分布由合并后的状态得出，新词发现只扫描新增的文本（ngrams.NgramIndex），
+    结果与对全部消息整体分析一致。状态文件不存在、无法读取，或第一轮相关的配置（时间范围、过滤规则、时段）
+    有变化时整体分析。
+
+    Args:
+        data: load_json / load_message_table 的结果，不带加载时过滤
+        state_path: 状态文件路径；None 时按群名放在 ANALYSIS_STATE_DIR 下（没有群名的导出必须指定）
+        use_stopwords / config: 同 ChatAnalyzer
+
+    Returns:
+        完成分析的 ChatAnalyzer
+    """
+    config = resolve_config(config)
+    if state_path is None:
+        chat_name = data.get('chatName', data.get('chatInfo', {}).get('name'))
+        if not has_chat_name(chat_name):
+            # 不同群的无名导出会合并进同一份状态
+            raise ValueError("导出没有群名，无法确定增量分析的状态文件，请指定 state_path")
+        state_path = state_path_for(chat_name, config)
+
+    previous = None
+    if os.path.exists(state_path):
+        try:
+            previous = AnalysisState.load(state_path)
+        except Exception as e:
+            logger.warning(f"⚠️ 分析状态读取失败，整体分析: {state_path}, 错误: {e}")
+        else:
+            if not previous.matches(config):
+                logger.info("⚙️ 时间范围或过滤配置有变化，整体分析")
+                previous = None
+
+    added = ChatAnalyzer(data, use_stopwords, config, since=previous).collect_state()
+    if previous is not None:
+        logger.info(f"📥 增量分析: 新消息 {added.message_count} 条，已有 {previous.message_count} 条")
+        state = previous + added
+    else:
+        state = added
+
+    analyzer = ChatAnalyzer.from_state(state, use_stopwords, config, track_ngrams=True)
+    analyzer.analyze()
+    state.ngrams = analyzer.ngram_index
+    state.save(state_path)
+    logger.debug(f"分析状态已保存: {state_path}")
+    return analyzer
@@ -36,9 +36,12 @@ if PROJECT_ROOT not in sys.path:
 
 import config
 import analyzer as analyzer_mod
+from analysis_config import AnalysisConfig
 from image_generator import ImageGenerator, AIWordSelector
-from utils import load_json
-from personal_analyzer import PersonalAnalyzer
+from message_table import load_message_table
+from message_filter import MessageFilter
+from personal_analyzer import PersonalAnalyzer, load_personal_data
+from utils import DecompressedSizeError, is_export_file
 
 from backend.db_service import DatabaseService
 from backend.json_storage import JSONStorageService
@@ -87,7 +90,9 @@ SECURITY_HEADER_REFERRER_POLICY = os.getenv('SECURITY_HEADER_REFERRER_POLICY', '
 SECURITY_HEADER_HSTS = os.getenv('SECURITY_HEADER_HSTS', '')
 
 # 文件验证配置
-ALLOWED_FILE_EXTENSIONS = os.getenv('ALLOWED_FILE_EXTENSIONS', 'json').split(',')
+ALLOWED_FILE_EXTENSIONS = os.getenv('ALLOWED_FILE_EXTENSIONS', 'json,jsonl,ndjson').split(',')
+# 允许在上述扩展名之后再带的压缩后缀（如 .json.gz），加载时流式解压
+ALLOWED_COMPRESSION_EXTENSIONS = os.getenv('ALLOWED_COMPRESSION_EXTENSIONS', 'gz,zst').split(',')
 LOCAL_JSON_DIR = os.getenv('LOCAL_JSON_DIR', os.path.join(PROJECT_ROOT, "local_json"))
 LOCAL_JSON_DIR = os.path.abspath(LOCAL_JSON_DIR)
 
@@ -224,6 +229,16 @@ else:
         logger.error(f"存储服务初始化失败: {e}")
         db_service = None
 
+# 导入时加载分词词典和停用词，不等到第一次上传；
+# 在 gunicorn 下 gunicorn.conf.py 已在 master 进程 fork 之前加载（不导入本模块），这里直接返回
+warmup_config = AnalysisConfig.from_module(config)
+if warmup_config.TOKENIZER_WARMUP:
+    try:
+        warm_seconds = analyzer_mod.warm_up(warmup_config)
+        logger.info(f"🔥 分词词典预热完成 ({warm_seconds:.2f}s)")
+    except Exception as e:
+        logger.warning(f"⚠️ 分词词典预热失败，将在首次分析时加载: {e}")
+
 
 def generate_ai_comments(selected_word_objects: List[Dict]) -> Dict[str, str]:
     # 使用OpenAI API为每个热词生成犀利的AI锐评
@@ -281,11 +296,10 @@ def get_csrf_token():
 
 
 def allowed_file(filename):
-    """检查文件类型是否允许（根据配置）"""
-    if not filename or '.' not in filename:
+    """检查文件类型是否允许（根据配置），可带压缩后缀，如 export.json.gz"""
+    if not filename:
         return False
-    ext = filename.rsplit('.', 1)[1].lower()
-    return ext in ALLOWED_FILE_EXTENSIONS
+    return is_export_file(filename, ALLOWED_FILE_EXTENSIONS, ALLOWED_COMPRESSION_EXTENSIONS)
 
 
 def parse_bool(value):
@@ -353,22 +367,25 @@ def analyze_chat_file(
     end_date: str = None,
     cleanup_source: bool = False
 ):
+    # 每个请求一份配置快照：时间范围不写入共享的 config 模块，同一进程中并发的分析互不影响
+    analysis_config = AnalysisConfig.from_module(
+        config,
+        MESSAGE_START_DATE=start_date or None,
+        MESSAGE_END_DATE=end_date or None,
+    )
     if start_date:
-        config.MESSAGE_START_DATE = start_date
         logger.info(f"Set message start date filter: {start_date}")
-    else:
-        config.MESSAGE_START_DATE = None
-
     if end_date:
-        config.MESSAGE_END_DATE = end_date
         logger.info(f"Set message end date filter: {end_date}")
-    else:
-        config.MESSAGE_END_DATE = None
 
     try:
-        # Stream JSON to avoid memory spikes.
-        data = load_json(source_path)
-        analyzer = analyzer_mod.ChatAnalyzer(data, use_stopwords=use_stopwords)
+        # 加载为列式消息表：再次分析同一个服务器端导出时直接打开解析缓存，不再解析 JSON；
+        # 上传的是请求结束即删除的临时文件，不写入缓存。
+        # 指定时间范围时，范围外的消息（以及机器人消息）在解析时即丢弃，已缓存的导出除外
+        message_filter = MessageFilter.from_config(analysis_config) if (start_date or end_date) else None
+        data = load_message_table(source_path, message_filter=message_filter, config=analysis_config,
+                                  use_cache=not cleanup_source)
+        analyzer = analyzer_mod.ChatAnalyzer(data, use_stopwords=use_stopwords, config=analysis_config)
         analyzer.analyze()
         report = analyzer.export_json()
 
@@ -453,6 +470,11 @@ def analyze_chat_file(
             "available_words": all_words,
             "stopwords_enabled": use_stopwords
         })
+    except DecompressedSizeError as exc:
+        logger.warning(f"analyze_chat_file rejected: {exc}")
+        if cleanup_source:
+            cleanup_temp_files(source_path)
+        return jsonify({"error": str(exc)}), 413
     except Exception as exc:
         import traceback
         error_trace = traceback.format_exc()
@@ -536,8 +558,10 @@ def generate_personal_report_from_local():
     report_id = str(uuid.uuid4())
 
     try:
-        data = load_json(str(source_path))
-        analyzer = PersonalAnalyzer(data, target_name, use_stopwords=use_stopwords)
+        # 完整的表只解析一遍并写入解析缓存，见 load_personal_data
+        analysis_config = AnalysisConfig.from_module(config)
+        data = load_personal_data(str(source_path), target_name, config=analysis_config)
+        analyzer = PersonalAnalyzer(data, target_name, use_stopwords=use_stopwords, config=analysis_config)
         analyzer.analyze()
         report = analyzer.export_json()
 
@@ -584,6 +608,8 @@ def upload_and_analyze():
 
     if not allowed_file(file.filename):
         allowed_exts = ', '.join(ALLOWED_FILE_EXTENSIONS)
+        if ALLOWED_COMPRESSION_EXTENSIONS:
+            allowed_exts += f" (可压缩为 {', '.join(ALLOWED_COMPRESSION_EXTENSIONS)})"
         return jsonify({"error": f"只允许上传以下类型文件: {allowed_exts}"}), 400
 
     # 使用 secure_filename 防止路径遍历攻击（根据配置）
@@ -665,10 +691,12 @@ def generate_personal_report():
         
         try:
             # 加载JSON数据
-            data = load_json(temp_path)
+            analysis_config = AnalysisConfig.from_module(config)
+            # 临时文件处理完即删除，不写入解析缓存
+            data = load_personal_data(temp_path, target_name, config=analysis_config, use_cache=False)
             
             # 创建个人分析器
-            analyzer = PersonalAnalyzer(data, target_name, use_stopwords=use_stopwords)
+            analyzer = PersonalAnalyzer(data, target_name, use_stopwords=use_stopwords, config=analysis_config)
             analyzer.analyze()
             report = analyzer.export_json()
             
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+批量分析：一个目录下的全部导出文件
+
+每个导出文件（.json / .ndjson / .jsonl，可带 .gz / .zst 压缩后缀）分析后在输出目录下各自的子目录中写入
+分析结果 JSON（<群名>_分析结果.json）、HTML 报告和 PNG 图片，全程不需要交互（自动选取前 10 个热词）。
+
+多个导出在进程池中并行：按文件大小从大到小调度，最大的几个先开始，避免最后只剩一个大文件在跑。
+增量分析的状态按群名保存（analyzer.state_path_for），同一个群的多个导出按修改时间先后在同一个子进程中依次分析，
+不会有两个进程同时读写同一个状态文件。没有群名的导出无法对应到群，单独成组并整体分析，不读写状态。
+主进程先加载分词词典和停用词（analyzer.warm_up），fork 出的子进程以写时复制共享；
+spawn 启动的子进程在初始化时各自加载（有预构建的词典缓存时很快）。
+并行时每个分析内部的解析 / 分词改为串行，子进程只输出警告和错误，进度由主进程汇总输出。
+
+用法:
+    python batch.py [目录] [--output runtime_outputs/batch] [--workers 0] [--no-image] [--incremental]
+
+目录默认取环境变量 LOCAL_JSON_DIR（与后端的服务器文件目录相同），未设置时为 local_json。
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import analyzer as analyzer_mod
+from analysis_config import resolve_config
+from message_table import load_message_table
+from utils import sanitize_filename, read_chat_name, is_export_file
+from logger import get_logger
+
+logger = get_logger('batch')
+
+# 本工具写出的分析结果，输出目录位于输入目录之内时不当作导出文件
+_RESULT_SUFFIX = '_分析结果.json'
+
+
+def find_exports(directory):
+    """目录（递归）下的导出文件，按文件大小从大到小排列"""
+    exports = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if is_export_file(name) and not name.endswith(_RESULT_SUFFIX):
+                exports.append(os.path.join(root, name))
+    return sorted(exports, key=os.path.getsize, reverse=True)
+
+
+def output_dir_for(path, directory, output):
+    """导出文件对应的输出子目录：相对输入目录的路径去掉扩展名，同名群的报告互不覆盖"""
+    relative = os.path.relpath(path, directory)
+    stem = relative.split(os.sep)
+    stem[-1] = stem[-1].split('.', 1)[0] or stem[-1]
+    return os.path.join(output, *(sanitize_filename(part) for part in stem))
+
+
+def _init_worker(config, quiet):
+    """子进程初始化：加载分词词典和停用词（fork 启动时已从主进程继承，直接返回）"""
+    if quiet:
+        logging.disable(logging.INFO)
+    analyzer_mod.warm_up(config)
+
+
+def analyze_export(task):
+    """
+    分析一个导出文件并写出报告
+
+    Args:
+        task: (导出文件路径, 输出目录, AnalysisConfig, use_stopwords, 是否生成图片, 是否增量分析)
+
+    Returns:
+        dict：path、chat_name、messages、bytes、seconds、outputs（写出的文件），失败时带 error
+    """
+    path, out_dir, config, use_stopwords, generate_image, incremental = task
+    start = time.perf_counter()
+    result = {'path': path, 'chat_name': None, 'messages': 0, 'bytes': os.path.getsize(path), 'outputs': []}
+    try:
+        data = load_message_table(path, config=config)
+        if incremental and not analyzer_mod.has_chat_name(data['chatInfo'].get('name')):
+            logger.warning(f"⚠️ 导出没有群名，不做增量分析: {path}")
+            incremental = False
+        if incremental:
+            # 状态文件按群名放在 ANALYSIS_STATE_DIR 下
+            analyzer = analyzer_mod.analyze_incremental(data, None, use_stopwords, config)
+        else:
+            analyzer = analyzer_mod.ChatAnalyzer(data, use_stopwords=use_stopwords, config=config)
+            analyzer.analyze()
+        report = analyzer.export_json()
+        result['chat_name'] = report['chatName']
+        result['messages'] = report['messageCount']
+
+        os.makedirs(out_dir, exist_ok=True)
+        json_path = os.path.join(out_dir, f"{sanitize_filename(report['chatName'])}{_RESULT_SUFFIX}")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        result['outputs'].append(json_path)
+
+        # 报告生成依赖 jinja2 / playwright，放在用到时再导入
+        from image_generator import ImageGenerator
+        html_path, img_path = ImageGenerator(json_path=json_path, output_dir=out_dir).generate(
+            non_interactive=True, generate_image=generate_image)
+        result['outputs'].extend(p for p in (html_path, img_path) if p)
+        if not html_path:
+            result['error'] = '报告生成失败（没有热词）'
+        elif generate_image and not img_path:
+            result['error'] = '图片生成失败'
+    except Exception as e:
+        logger.error(f"❌ 分析失败: {path}, 错误: {e}", exc_info=True)
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def analyze_group(tasks):
+    """在同一个进程中依次分析 tasks（同一个群的导出），返回各自的结果"""
+    return [analyze_export(task) for task in tasks]
+
+
+def group_exports(exports):
+    """
+    增量分析时按群名把导出分组：组内按修改时间从旧到新（新消息按顺序追加到状态），
+    各组按文件总大小从大到小排列。没有群名或读不出群名的导出单独成组。
+    """
+    groups = {}
+    for path in exports:
+        try:
+            chat_name = read_chat_name(path)
+        except Exception as e:
+            logger.warning(f"⚠️ 读取群名失败: {path}, 错误: {e}")
+            chat_name = None
+        key = ('name', chat_name) if analyzer_mod.has_chat_name(chat_name) else ('path', path)
+        groups.setdefault(key, []).append(path)
+    ordered = [sorted(paths, key=lambda p: (os.path.getmtime(p), p)) for paths in groups.values()]
+    return sorted(ordered, key=lambda paths: sum(map(os.path.getsize, paths)), reverse=True)
+
+
+def run_batch(exports, directory, output, workers=1, config=None, use_stopwords=None,
+              generate_image=True, incremental=False):
+    """
+    分析 exports（建议按文件大小从大到小排列）
+
+    增量分析时同一个群的导出归为一组，在同一个进程中依次分析（见 group_exports），各组之间并行。
+
+    Returns:
+        (results, workers)：各文件的结果（analyze_export 的返回值，按完成顺序）和实际使用的进程数
+    """
+    config = resolve_config(config)
+    groups = group_exports(exports) if incremental else [[path] for path in exports]
+    workers = max(1, min(workers, len(groups)))
+    if workers > 1:
+        # 多个分析并行时，单个分析内部不再开进程
+        config = config.replace(PARSE_WORKERS=1, SEGMENT_WORKERS=1)
+    tasks = [[(path, output_dir_for(path, directory, output), config, use_stopwords, generate_image, incremental)
+              for path in paths] for paths in groups]
+
+    # 主进程先加载词典，fork 出的子进程直接继承；冻结后垃圾回收不再触碰这些对象，内存页保持共享
+    warm_seconds = analyzer_mod.warm_up(config)
+    logger.info(f"🔥 分词词典预热完成 ({warm_seconds:.2f}s)")
+
+    results = []
+
+    def record(result):
+        results.append(result)
+        label = result['chat_name'] or os.path.basename(result['path'])
+        if result.get('error'):
+            logger.warning(f"⚠️ [{len(results)}/{len(exports)}] {label}: {result['error']}")
+        else:
+            logger.info(f"✅ [{len(results)}/{len(exports)}] {label}: {result['messages']} 条消息, "
+                        f"{result['seconds']:.1f}s")
+
+    if workers == 1:
+        for group in tasks:
+            for task in group:
+                record(analyze_export(task))
+        return results, workers
+
+    gc.freeze()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config, True)) as pool:
+            # 按提交顺序取任务：大文件（组）先开始
+            futures = [pool.submit(analyze_group, group) for group in tasks]
+            for future in as_completed(futures):
+                for result in future.result():
+                    record(result)
+    finally:
+        gc.unfreeze()
+    return results, workers
+
+
+def print_summary(results, wall_seconds, workers):
+    """吞吐量汇总"""
+    succeeded = [r for r in results if not r.get('error')]
+    failed = [r for r in results if r.get('error')]
+    messages = sum(r['messages'] for r in results)
+    size_mb = sum(r['bytes'] for r in results) / 1024 / 1024
+    busy = sum(r['seconds'] for r in results)
+    wall_seconds = max(wall_seconds, 1e-9)
+
+    print("=" * 60)
+    print(f"批量分析完成: {len(succeeded)} 个成功, {len(failed)} 个失败, {workers} 个进程")
+    print(f"消息: {messages} 条, 文件: {size_mb:.1f} MB, 总耗时 {wall_seconds:.1f}s")
+    print(f"吞吐量: {messages / wall_seconds:.0f} 条/s, {size_mb / wall_seconds:.2f} MB/s, "
+          f"{len(results) / wall_seconds * 60:.1f} 个/分钟")
+    print(f"并行效率: 各文件耗时合计 {busy:.1f}s, 加速比 {busy / wall_seconds:.1f}x")
+    if results:
+        slowest = max(results, key=lambda r: r['seconds'])
+        print(f"最慢: {slowest['chat_name'] or slowest['path']} ({slowest['seconds']:.1f}s)")
+    for r in failed:
+        print(f"失败: {r['path']}: {r['error']}")
+    print("=" * 60)
+
+
+def main():
+    config = resolve_config()
+    parser = argparse.ArgumentParser(description='批量分析目录下的全部导出文件')
+    parser.add_argument('directory', nargs='?', default=os.getenv('LOCAL_JSON_DIR', 'local_json'),
+                        help='导出文件目录（默认环境变量 LOCAL_JSON_DIR，未设置时为 local_json）')
+    parser.add_argument('--output', default=config.BATCH_OUTPUT_DIR,
+                        help='输出目录（默认读取配置 BATCH_OUTPUT_DIR）')
+    parser.add_argument('--workers', type=int, default=config.BATCH_WORKERS,
+                        help='并行进程数，0 表示使用全部 CPU 核心（默认读取配置 BATCH_WORKERS）')
+    parser.add_argument('--no-image', action='store_true', help='只生成分析结果 JSON 和 HTML，不生成图片')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量分析：只处理比上次更新的消息（状态按群保存在 ANALYSIS_STATE_DIR）')
+    stopwords = parser.add_mutually_exclusive_group()
+    stopwords.add_argument('--stopwords', dest='use_stopwords', action='store_true', default=None,
+                           help='使用停用词（默认读取配置 USE_STOPWORDS）')
+    stopwords.add_argument('--no-stopwords', dest='use_stopwords', action='store_false', help='不使用停用词')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        logger.error(f"❌ 目录不存在: {args.directory}")
+        return 1
+    exports = find_exports(args.directory)
+    if not exports:
+        logger.error(f"❌ 未找到导出文件: {args.directory}")
+        return 1
+
+    generate_image = (not args.no_image and config.ENABLE_IMAGE_EXPORT
+                      and config.IMAGE_GENERATION_MODE != 'never')
+    workers = args.workers or os.cpu_count() or 1
+    logger.info(f"📂 {args.directory}: {len(exports)} 个导出文件, "
+                f"{sum(map(os.path.getsize, exports)) / 1024 / 1024:.1f} MB")
+
+    start = time.perf_counter()
+    results, workers = run_batch(exports, args.directory, args.output, workers=workers,
+                                 config=config, use_stopwords=args.use_stopwords,
+                                 generate_image=generate_image, incremental=args.incremental)
+    print_summary(results, time.perf_counter() - start, workers)
+    return 1 if any(r.get('error') for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
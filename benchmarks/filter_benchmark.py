@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+消息过滤基准测试
+在合成的 MessageTable 上对比逐条判定的过滤（原 ChatAnalyzer._is_bot_message 及同样写法的文本规则）
+与 message_filter.FilterPipeline 的整列求值，并校验两者的保留掩码完全一致。
+逐条判定的耗时为一遍的耗时；原 ChatAnalyzer 每条消息判定两次（收集发送者信息和处理消息时各一次）
+
+用法:
+    python benchmarks/filter_benchmark.py [--messages 1000000] [--bot-uins 200] [--repeat 3]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from message_filter import FilterPipeline
+from message_table import MessageTable
+from benchmarks.synthetic_export import iter_synthetic_messages
+
+_KEYWORDS = ('广告', '加群', '代练', '兼职', '刷单', '原神启动', '蚌埠住了', '典中典')
+_PATTERNS = (r'https?://', r'\d{6,}')
+
+
+def legacy_keep(rows, filter_bots, bot_uins, keywords=(), patterns=(), min_text_length=0):
+    """逐条判定：机器人部分与原 _is_bot_message 相同，文本规则按同样的写法逐条检查"""
+    patterns = [re.compile(pattern) for pattern in patterns]
+    keep = []
+    for sub_msg_type, sender, text in rows:
+        if filter_bots and (sub_msg_type in [577, 65] or (bot_uins and sender and sender in bot_uins)):
+            keep.append(False)
+        elif text and (any(keyword in text for keyword in keywords)
+                       or any(pattern.search(text) for pattern in patterns)
+                       or (min_text_length and len(text.strip()) < min_text_length)):
+            keep.append(False)
+        else:
+            keep.append(True)
+    return np.array(keep, dtype=bool)
+
+
+def _best_of(repeat, func):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='消息过滤基准测试')
+    parser.add_argument('--messages', type=int, default=1000000, help='消息条数')
+    parser.add_argument('--users', type=int, default=2000, help='发送者人数')
+    parser.add_argument('--bot-uins', type=int, default=200, help='配置为机器人的发送者个数（BOT_UINS）')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数（取最快一次）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = MessageTable.from_messages(list(iter_synthetic_messages(args.messages, n_users=args.users, seed=args.seed)))
+    all_rows = np.arange(len(table))
+    # 逐条判定用到的字段预先取出，只计判定本身的耗时
+    rows = [(row.sub_msg_type, row.sender, row.text) for row in table.iter_rows(all_rows)]
+    print(f'消息: {len(table)} 条, 生成耗时 {time.perf_counter() - start:.1f}s')
+
+    bot_uins = frozenset(random.Random(args.seed).sample([str(100000 + i) for i in range(args.users)], args.bot_uins))
+    cases = (
+        ('机器人', {}),
+        ('机器人+文本', {'keywords': _KEYWORDS, 'patterns': _PATTERNS, 'min_text_length': 2}),
+    )
+
+    consistent = True
+    print(f'{"规则":<10}{"实现":<8}{"耗时(s)":>10}{"消息/s":>14}')
+    for label, text_rules in cases:
+        legacy_seconds, expected = _best_of(args.repeat, lambda: legacy_keep(rows, True, bot_uins, **text_rules))
+        pipeline = FilterPipeline(filter_bots=True, bot_uins=bot_uins, **text_rules)
+        pipeline_seconds, (keep, dropped) = _best_of(args.repeat, lambda: pipeline.evaluate(table, all_rows))
+        same = np.array_equal(keep, expected)
+        consistent &= same
+        print(f'{label:<10}{"逐条判定":<8}{legacy_seconds:>10.3f}{len(rows) / legacy_seconds:>14.0f}')
+        print(f'{label:<10}{"整列求值":<8}{pipeline_seconds:>10.3f}{len(rows) / pipeline_seconds:>14.0f}')
+        print(f'加速比: {legacy_seconds / pipeline_seconds:.1f}x, 过滤 {dict(dropped)}, '
+              f'结果{"一致" if same else "不一致"}')
+    return 0 if consistent else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+加载器基准测试
+对每个可用的 ijson 后端运行 utils.load_json，输出 MB/s 与 消息/s
+指定 --workers 时改为对比不同进程数下的并行解析（使用最快的后端）
+
+用法:
+    python benchmarks/loader_benchmark.py [export.json] [--messages 200000] [--repeat 3]
+    python benchmarks/loader_benchmark.py [export.json] --workers 1 2 4 8
+不指定文件时会生成一份合成导出文件
+"""
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from utils import load_json, _IJSON_BACKEND_PREFERENCE
+from benchmarks.synthetic_export import write_synthetic_export
+
+
+def available_backends():
+    import ijson
+    names = []
+    for name in _IJSON_BACKEND_PREFERENCE:
+        try:
+            ijson.get_backend(name)
+        except Exception:
+            continue
+        names.append(name)
+    return names
+
+
+def bench_backend(path, backend, repeat, workers=1):
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    best = None
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = load_json(path, backend=backend, workers=workers)
+        elapsed = time.perf_counter() - start
+        count = len(data['messages'])
+        del data
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        'backend': backend,
+        'workers': workers,
+        'seconds': best,
+        'mb_per_s': size_mb / best,
+        'msgs_per_s': count / best,
+        'messages': count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='load_json 后端基准测试')
+    parser.add_argument('path', nargs='?', help='导出文件路径（缺省时生成合成数据）')
+    parser.add_argument('--messages', type=int, default=200000, help='合成数据的消息条数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个后端重复次数（取最快一次）')
+    parser.add_argument('--backends', nargs='*', help='只测试指定后端')
+    parser.add_argument('--workers', type=int, nargs='*', help='对比并行解析的进程数，例如 1 2 4 8')
+    args = parser.parse_args()
+
+    tmp_path = None
+    path = args.path
+    if not path:
+        fd, tmp_path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        write_synthetic_export(tmp_path, args.messages)
+        path = tmp_path
+
+    try:
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f'文件: {path} ({size_mb:.1f} MB)')
+        if args.workers:
+            backend = (args.backends or available_backends())[0]
+            print(f"后端: {backend}")
+            print(f"{'进程数':<8}{'耗时(s)':>10}{'MB/s':>10}{'加速比':>10}")
+            base = None
+            for workers in args.workers:
+                r = bench_backend(path, backend, args.repeat, workers=workers)
+                base = base or r['seconds']
+                print(f"{workers:<8}{r['seconds']:>10.2f}{r['mb_per_s']:>10.1f}{base / r['seconds']:>10.2f}")
+            return
+        print(f"{'后端':<12}{'耗时(s)':>10}{'MB/s':>10}{'消息/s':>14}")
+        for backend in args.backends or available_backends():
+            r = bench_backend(path, backend, args.repeat)
+            print(f"{r['backend']:<12}{r['seconds']:>10.2f}{r['mb_per_s']:>10.1f}{r['msgs_per_s']:>14,.0f}")
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+if __name__ == '__main__':
+    main()
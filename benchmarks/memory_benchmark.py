@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+消息存储内存基准测试
+在独立子进程中分别加载为 dict 列表（load_json）和列式 MessageTable（load_message_table），
+输出各自的峰值 RSS
+
+用法:
+    python benchmarks/memory_benchmark.py [export.json] [--messages 1000000]
+不指定文件时会生成一份合成导出文件
+"""
+
+import os
+import sys
+import time
+import json
+import resource
+import tempfile
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic_export import write_synthetic_export
+
+MODES = ('list', 'table')
+
+
+def _peak_rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB，macOS 下为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_mode(path, mode):
+    """在当前进程中加载一次，返回 {'mode', 'seconds', 'messages', 'peak_rss_mb'}"""
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'list':
+        from utils import load_json
+        data = load_json(path)
+    else:
+        from message_table import load_message_table
+        data = load_message_table(path)
+    elapsed = time.perf_counter() - start
+    return {
+        'mode': mode,
+        'seconds': elapsed,
+        'messages': len(data['messages']),
+        'peak_rss_mb': _peak_rss_mb(),
+        'baseline_rss_mb': baseline,
+    }
+
+
+def measure(path, mode):
+    """在子进程中测量，避免前一次加载的峰值影响结果"""
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), path, '--child', mode],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dict 列表与 MessageTable 的峰值内存对比')
+    parser.add_argument('path', nargs='?', help='导出文件路径（缺省时生成合成数据）')
+    parser.add_argument('--messages', type=int, default=1000000, help='合成数据的消息条数')
+    parser.add_argument('--modes', nargs='*', default=list(MODES), choices=MODES)
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # 子进程只输出一行 JSON，日志走 stderr
+        print(json.dumps(run_mode(args.path, args.child)))
+        return
+
+    tmp_path = None
+    path = args.path
+    if not path:
+        fd, tmp_path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        write_synthetic_export(tmp_path, args.messages)
+        path = tmp_path
+
+    try:
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f'文件: {path} ({size_mb:.1f} MB)')
+        print(f"{'存储':<8}{'消息数':>12}{'耗时(s)':>10}{'峰值RSS(MB)':>14}{'增量(MB)':>12}")
+        for mode in args.modes:
+            r = measure(path, mode)
+            delta = r['peak_rss_mb'] - r['baseline_rss_mb']
+            print(f"{r['mode']:<8}{r['messages']:>12,}{r['seconds']:>10.1f}{r['peak_rss_mb']:>14.0f}{delta:>12.0f}")
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+新词打分基准测试
+在合成的候选集上对比逐词计算邻接熵 / 切分 PMI 的循环与 ngrams.select_new_words 的向量化实现，
+并校验两者选出的新词完全一致
+
+用法:
+    python benchmarks/new_word_benchmark.py [--candidates 1000000] [--repeat 3]
+"""
+
+import os
+import sys
+import math
+import time
+import argparse
+from collections import Counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from utils import calculate_entropy
+from ngrams import NgramStats, select_new_words
+
+# 各长度候选所占比例
+_LENGTH_SHARES = {2: 0.15, 3: 0.25, 4: 0.3, 5: 0.3}
+
+
+def _unique_rows(chars):
+    keys = np.ascontiguousarray(chars).view(np.dtype((np.void, chars.itemsize * chars.shape[1]))).ravel()
+    _, index = np.unique(keys, return_index=True)
+    return chars[np.sort(index)]
+
+
+def _neighbors(rng, n_words):
+    sizes = 1 + rng.poisson(3, n_words)
+    offsets = np.zeros(n_words + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    return offsets, rng.integers(1, 30, int(offsets[-1])).astype(np.int64)
+
+
+def make_candidates(n_candidates, min_freq=20, seed=0):
+    """
+    生成合成候选集（NgramStats）
+
+    2、3 字候选为随机字组合，4、5 字候选由已有的 2、3 字候选拼接，保证存在可计算 PMI 的切分；
+    频次服从长尾分布，邻字种类数服从泊松分布
+    """
+    rng = np.random.default_rng(seed)
+    alphabet = np.arange(0x4e00, 0x4e00 + 3000, dtype=np.int32)
+    levels = {}
+    for length in (2, 3):
+        count = int(n_candidates * _LENGTH_SHARES[length])
+        levels[length] = _unique_rows(alphabet[rng.integers(0, len(alphabet), (count, length))])
+    for length, parts in ((4, ((2, 2),)), (5, ((2, 3), (3, 2)))):
+        count = int(n_candidates * _LENGTH_SHARES[length])
+        rows = []
+        for left, right in parts:
+            share = count // len(parts)
+            rows.append(np.hstack([levels[left][rng.integers(0, len(levels[left]), share)],
+                                   levels[right][rng.integers(0, len(levels[right]), share)]]))
+        levels[length] = _unique_rows(np.vstack(rows))
+
+    words = []
+    for length in sorted(levels):
+        text = levels[length].astype('<i4').tobytes().decode('utf-32-le')
+        words.extend(text[i:i + length] for i in range(0, len(text), length))
+    freqs = (min_freq * (1 + rng.pareto(1.2, len(words)))).astype(np.int64)
+    total_chars = int(freqs.sum()) * 10
+    return NgramStats(words, freqs, _neighbors(rng, len(words)), _neighbors(rng, len(words)), total_chars)
+
+
+def legacy_select(ngram_freq, left_neighbors, right_neighbors, total_chars, entropy_threshold, pmi_threshold):
+    """原先 ChatAnalyzer._discover_new_words 中的逐词循环"""
+    selected = []
+    for word, freq in ngram_freq.items():
+        left_ent = calculate_entropy(left_neighbors[word])
+        right_ent = calculate_entropy(right_neighbors[word])
+        min_ent = min(left_ent, right_ent)
+        if min_ent < entropy_threshold:
+            continue
+
+        min_pmi = float('inf')
+        for i in range(1, len(word)):
+            left_freq = ngram_freq.get(word[:i], 0)
+            right_freq = ngram_freq.get(word[i:], 0)
+            if left_freq > 0 and right_freq > 0:
+                pmi = math.log2((freq * total_chars) / (left_freq * right_freq + 1e-10))
+                min_pmi = min(min_pmi, pmi)
+
+        if min_pmi == float('inf'):
+            min_pmi = 0
+
+        if min_pmi < pmi_threshold:
+            continue
+
+        selected.append(word)
+    return selected
+
+
+def _to_counters(stats, offsets, counts):
+    counts = counts.tolist()
+    bounds = offsets.tolist()
+    return {word: Counter(dict(enumerate(counts[bounds[i]:bounds[i + 1]]))) for i, word in enumerate(stats.words)}
+
+
+def _best_of(repeat, func):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='新词打分基准测试')
+    parser.add_argument('--candidates', type=int, default=1000000, help='候选 n-gram 个数')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数（取最快一次）')
+    parser.add_argument('--entropy-threshold', type=float, default=0.5, help='邻接熵阈值')
+    parser.add_argument('--pmi-threshold', type=float, default=2.0, help='PMI 阈值')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args()
+
+    stats = make_candidates(args.candidates, seed=args.seed)
+    print(f'候选: {len(stats)} 个, 邻字组合: {len(stats.left_counts) + len(stats.right_counts)} 个')
+
+    ngram_freq = stats.freq_map()
+    left_neighbors = _to_counters(stats, stats.left_offsets, stats.left_counts)
+    right_neighbors = _to_counters(stats, stats.right_offsets, stats.right_counts)
+    legacy_seconds, expected = _best_of(args.repeat, lambda: legacy_select(
+        ngram_freq, left_neighbors, right_neighbors, stats.total_chars, args.entropy_threshold, args.pmi_threshold))
+    del left_neighbors, right_neighbors
+
+    vector_seconds, selected = _best_of(args.repeat, lambda: select_new_words(
+        stats, args.entropy_threshold, args.pmi_threshold))
+
+    print(f'{"实现":<8}{"耗时(s)":>10}{"候选/s":>14}')
+    print(f'{"逐词循环":<8}{legacy_seconds:>10.3f}{len(stats) / legacy_seconds:>14.0f}')
+    print(f'{"向量化":<8}{vector_seconds:>10.3f}{len(stats) / vector_seconds:>14.0f}')
+    print(f'加速比: {legacy_seconds / vector_seconds:.1f}x, 入选 {len(selected)} 个, '
+          f'结果{"一致" if selected == expected else "不一致"}')
+    return 0 if selected == expected else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
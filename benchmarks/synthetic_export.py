@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+合成测试数据生成器
+生成与 qq-chat-exporter 导出格式一致的群聊 JSON，用于性能基准测试
+
+用法:
+    python benchmarks/synthetic_export.py out.json --messages 1000000
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+from datetime import datetime, timezone, timedelta
+
+# 常见短语，组合后能触发新词发现和词组合并
+_PHRASES = [
+    '哈哈哈', '笑死我了', '今天吃什么', '下班了吗', '原神启动', '绝绝子', '太离谱了',
+    '有没有人打游戏', '明天早八', '好困啊', '这个好看', '我觉得可以', '确实', '草',
+    '蚌埠住了', '家人们谁懂啊', '周末去哪玩', '老板发工资了', '摸鱼中', '晚安',
+    '早上好', '这波血赚', '学不动了', '考试周救命', '奶茶续命', '破防了', '666',
+    '真的假的', '有一说一', '我超', '典中典', '急了急了', '好耶', '?', '。。。',
+]
+_EXTRA_CHARS = '的了是我你他她在有个这那就都也要会说去来看想吃喝玩乐学好坏大小多少'
+_STICKERS = ['[动画表情]', '[表情]', '[doge]', '[狗头]']
+_EMOJIS = ['😂', '🤣', '👍', '🙏', '😭']
+
+
+def _random_text(rng):
+    parts = [rng.choice(_PHRASES) for _ in range(rng.randint(1, 3))]
+    if rng.random() < 0.3:
+        parts.append(''.join(rng.choice(_EXTRA_CHARS) for _ in range(rng.randint(2, 8))))
+    if rng.random() < 0.05:
+        parts.append(rng.choice(_EMOJIS))
+    sep = rng.choice(['', '，', ' ', '！'])
+    return sep.join(parts)
+
+
+def iter_synthetic_messages(n_messages, n_users=200, seed=42, start=None):
+    """逐条生成合成消息（dict），格式与导出文件中的 messages 元素一致"""
+    rng = random.Random(seed)
+    start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+    users = [(str(100000 + i), f'群友{i}') for i in range(n_users)]
+    # 少量高频用户，贴近真实群聊的长尾分布
+    weights = [1.0 / (i + 1) for i in range(n_users)]
+    bot_uin = str(99999)
+    span = 365 * 86400
+    recent = []
+
+    for idx in range(n_messages):
+        msg_id = str(7300000000000000000 + idx * 7)
+        offset = int(idx * span / max(n_messages, 1)) + rng.randint(0, 59)
+        ts = (start + timedelta(seconds=offset, milliseconds=rng.randint(0, 999)))
+        timestamp = ts.strftime('%Y-%m-%dT%H:%M:%S.') + f'{ts.microsecond // 1000:03d}Z'
+
+        is_bot = rng.random() < 0.01
+        if is_bot:
+            uin, name = bot_uin, 'Q群管家'
+        else:
+            uin, name = rng.choices(users, weights)[0]
+
+        text = _random_text(rng)
+        elements = []
+        content = {'text': text}
+
+        roll = rng.random()
+        if roll < 0.06:
+            target_uin, target_name = rng.choice(users)
+            at_text = f'@{target_name}'
+            elements.append({
+                'elementType': 1, 'elementId': '',
+                'textElement': {'content': at_text, 'atType': 2, 'atUid': target_uin, 'atTinyId': '', 'atNtUid': 'u_x'}
+            })
+            content['text'] = f'{at_text} {text}'
+            content['mentions'] = [{'uid': target_uin, 'name': target_name}]
+        elif roll < 0.12 and recent:
+            ref_id, ref_uin = rng.choice(recent)
+            use_sender = rng.random() < 0.5
+            elements.append({
+                'elementType': 7, 'elementId': '',
+                'replyElement': {
+                    'replayMsgSeq': '1', 'replayMsgId': '0' if rng.random() < 0.5 else ref_id,
+                    'senderUid': ref_uin if use_sender else '0',
+                    'sourceMsgIdInRecords': ref_id,
+                }
+            })
+            content['reply'] = {'referencedMessageId': ref_id}
+        elif roll < 0.13 and idx + 5 < n_messages:
+            # 引用尚未出现的消息（前向引用）
+            ref_id = str(7300000000000000000 + (idx + 3) * 7)
+            elements.append({
+                'elementType': 7, 'elementId': '',
+                'replyElement': {'replayMsgId': ref_id, 'senderUid': '0', 'sourceMsgIdInRecords': '0'}
+            })
+
+        elements.append({
+            'elementType': 1, 'elementId': '',
+            'textElement': {'content': text, 'atType': 0, 'atUid': '0', 'atTinyId': '', 'atNtUid': ''}
+        })
+
+        roll = rng.random()
+        if roll < 0.05:
+            elements.append({'elementType': 2, 'picElement': {'summary': '', 'fileName': f'{idx}.jpg', 'picWidth': 100}})
+            content['resources'] = [{'type': 'image', 'filename': f'{idx}.jpg', 'size': 1024}]
+        elif roll < 0.10:
+            elements.append({'elementType': 2, 'picElement': {'summary': rng.choice(_STICKERS), 'fileName': f'{idx}.gif'}})
+        elif roll < 0.11:
+            elements.append({'elementType': 10, 'arkElement': {'bytesData': '{"app":"com.tencent.structmsg"}'}})
+        elif roll < 0.115:
+            elements.append({'elementType': 16, 'multiForwardMsgElement': {'xmlContent': '<msg/>', 'resId': 'abc'}})
+            content['multiForward'] = {'resId': 'abc'}
+        elif roll < 0.12:
+            content['text'] = f'{text} https://example.com/{idx}'
+            elements.append({'elementType': 1, 'textElement': {'content': f' https://example.com/{idx}', 'atType': 0}})
+        if rng.random() < 0.03:
+            content['emojis'] = [{'id': '178', 'name': '斜眼笑', 'type': 'face'}]
+
+        message = {
+            'id': msg_id,
+            'messageId': msg_id,
+            'seq': str(idx + 1),
+            'timestamp': timestamp,
+            'time': ts.astimezone(timezone(timedelta(hours=8))).strftime('%Y-%m-%d %H:%M:%S'),
+            'sender': {'uid': f'u_{uin}', 'uin': uin, 'name': name},
+            'type': 'type_1',
+            'content': content,
+            'recalled': False,
+            'system': False,
+            'rawMessage': {
+                'msgId': msg_id,
+                'msgType': 2,
+                'subMsgType': 577 if is_bot else 1,
+                'sendMemberName': name if rng.random() < 0.5 else '',
+                'elements': elements,
+            },
+        }
+        if not is_bot:
+            recent.append((msg_id, uin))
+            if len(recent) > 50:
+                recent.pop(0)
+        yield message
+
+
+def write_synthetic_export(path, n_messages, n_users=200, seed=42, indent=None):
+    """写出合成导出文件，返回文件大小（字节）"""
+    header = {
+        'metadata': {'name': 'QQChatExporter V4', 'version': '4.0.0'},
+        'chatInfo': {'name': '合成测试群', 'type': 'group', 'selfUin': '100000'},
+        'statistics': {'totalMessages': n_messages},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        head = json.dumps(header, ensure_ascii=False, indent=indent)
+        f.write(head[:-1].rstrip() + ',\n"messages": [\n')
+        for i, msg in enumerate(iter_synthetic_messages(n_messages, n_users, seed)):
+            if i:
+                f.write(',\n')
+            f.write(json.dumps(msg, ensure_ascii=False, indent=indent))
+        f.write('\n],\n"exportOptions": {"includeResourceLinks": true}\n}\n')
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成群聊导出文件')
+    parser.add_argument('output', help='输出文件路径')
+    parser.add_argument('--messages', type=int, default=100000, help='消息条数')
+    parser.add_argument('--users', type=int, default=200, help='群成员数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    size = write_synthetic_export(args.output, args.messages, args.users, args.seed)
+    print(f'已生成 {args.messages} 条消息 -> {args.output} ({size / 1024 / 1024:.1f} MB)')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
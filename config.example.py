@@ -56,6 +56,12 @@ ENTROPY_THRESHOLD = 0.5
 # 推荐值：10-30
 NEW_WORD_MIN_FREQ = 20
 
+# 近似新词发现（千万级消息的超大导出使用）
+# 开启后用有界内存的重频摘要筛选候选 n-gram，内存占用约为 NEW_WORD_MEMORY_MB（MB），
+# 出现次数远高于阈值的新词不受影响，接近阈值的可能遗漏，日志中会报告预计召回率
+NEW_WORD_APPROXIMATE = False
+NEW_WORD_MEMORY_MB = 1024
+
 
 # ============================================
 # 词组合并参数
@@ -134,6 +140,9 @@ CONTRIBUTOR_TOP_N = 10
 # 每个热词显示的示例消息数量
 SAMPLE_COUNT = 10
 
+# 示例消息抽样的随机种子：相同的种子和聊天记录得到相同的报告，设为 None 则每次随机
+SAMPLE_SEED = 0
+
 
 # ============================================
 # 时间分析配置
@@ -167,6 +176,95 @@ FILTER_BOT_MESSAGES = True
 # 例如: BOT_UINS = ['1234567890', '0987654321']
 BOT_UINS = []
 
+# 视为机器人消息的 subMsgType
+BOT_SUB_MSG_TYPES = [577, 65]
+
+# ============================================
+# 消息过滤规则
+# ============================================
+# 命中规则的消息与机器人消息一样不参与统计（仍计入消息总数）
+
+# 屏蔽关键词：消息文本包含任一关键词即过滤
+# 例如: BLOCK_KEYWORDS = ['签到', '打卡']
+BLOCK_KEYWORDS = []
+
+# 屏蔽正则：消息文本匹配任一正则（re.search）即过滤
+# 例如: BLOCK_PATTERNS = [r'^/\w+']  # 以 / 开头的指令
+BLOCK_PATTERNS = []
+
+# 最短文本长度：文本去除首尾空白后少于该字数的消息被过滤；没有文本的消息（纯图片等）不受影响
+# 0 表示不限制
+MIN_TEXT_LENGTH = 0
+
+# ============================================
+# 解析
+# ============================================
+
+# 并行解析的进程数
+# 1：串行解析（默认）
+# 0：使用全部 CPU 核心
+# 大于 1 时，超过 32MB 的导出文件会在 messages 元素之间切分后交给多个进程解析，结果与串行一致
+PARSE_WORKERS = 1
+
+# 压缩导出文件（gzip / zstd）解压后的大小上限，单位 MB，超出时停止解析并报错
+# 上传大小限制（MAX_UPLOAD_SIZE_MB）只约束压缩后的字节，高压缩比的文件解压后可能膨胀成百上千倍
+# None：上传大小上限的 10 倍（环境变量 MAX_UPLOAD_SIZE_MB，默认 1024MB）；0 表示不限制
+MAX_DECOMPRESSED_SIZE_MB = None
+
+# 并行分词的进程数（群聊分析）
+# 1：串行分词（默认）
+# 0：使用全部 CPU 核心
+# 大于 1 时，有效文本超过 2 万条的群聊会按顺序分片交给多个进程分词统计，结果与串行一致
+SEGMENT_WORKERS = 1
+
+# 分词缓存容量（按清理后文本缓存分词结果的条数）
+# 复读、"哈哈哈" 等重复文本只分词一次；0 表示不缓存
+SEGMENT_CACHE_SIZE = 100000
+
+# 分词词典预构建缓存（python tokenizer_cache.py 生成，构建 Docker 镜像时自动生成）
+# 进程启动时直接加载前缀词典和停用词，比从 jieba 词典文件构建快约 3 倍；
+# 文件不存在或与当前 jieba / 词典不符时照常构建；留空表示不使用
+TOKENIZER_CACHE_FILE = 'resources/tokenizer.cache'
+
+# 服务启动时预热分词词典和停用词（gunicorn 在主进程中加载一次，见 gunicorn.conf.py；开发服务器在导入时加载）
+# False：每个 worker 在第一次分析时加载
+TOKENIZER_WARMUP = True
+
+# ============================================
+# 解析缓存
+# ============================================
+
+# 是否启用解析缓存
+# 同一导出文件（按内容哈希识别）再次分析时直接映射缓存，跳过 JSON 解析
+PARSE_CACHE_ENABLED = True
+
+# 缓存目录
+PARSE_CACHE_DIR = 'runtime_outputs/parse_cache'
+
+# 缓存总大小上限，单位 MB，超出后按最近使用时间淘汰（默认 2048MB）
+PARSE_CACHE_MAX_MB = 2048
+
+# ============================================
+# 增量分析
+# ============================================
+
+# 分析状态目录（analyzer.analyze_incremental）
+# 每个群保存一份第一轮遍历的结果和新词发现的 n-gram 索引；新的导出到来时只处理比上次更新的消息，
+# 结果与对全部消息整体分析一致。时间范围、过滤规则、时段配置有变化时自动整体重新分析
+ANALYSIS_STATE_DIR = 'runtime_outputs/analysis_state'
+
+# ============================================
+# 批量分析（python batch.py）
+# ============================================
+
+# 并行分析的进程数：多个导出文件各占一个进程，按文件大小从大到小调度
+# 0：使用全部 CPU 核心（默认）；1：逐个串行分析
+# 每个进程同时持有一个群的完整分析，内存不足时调小
+BATCH_WORKERS = 0
+
+# 输出目录：每个导出文件一个子目录，内含分析结果 JSON、HTML 报告和 PNG 图片
+BATCH_OUTPUT_DIR = 'runtime_outputs/batch'
+
 # ============================================
 # AI 功能配置（可选）
 # ============================================
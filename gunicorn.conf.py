@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn 配置：在主进程中预热分词词典
+
+主进程在 when_ready 中只加载分词词典和停用词（analyzer.warm_up），不导入 backend.app：
+存储服务、数据库连接和限流器在各 worker 导入应用时各自初始化，不会在 fork 之间共享连接或文件句柄。
+预热后冻结垃圾回收，fork 出的 worker 以写时复制共享词典的内存页；worker 导入应用时的预热直接返回。
+
+用法（Dockerfile 的默认启动命令）:
+    python -m gunicorn -c gunicorn.conf.py backend.app:app
+"""
+
+import gc
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def when_ready(server):
+    if PROJECT_ROOT not in sys.path:
+        sys.path.insert(0, PROJECT_ROOT)
+    import analyzer
+    from analysis_config import AnalysisConfig
+
+    config = AnalysisConfig.from_module()
+    if not config.TOKENIZER_WARMUP:
+        return
+    try:
+        seconds = analyzer.warm_up(config)
+    except Exception as e:
+        server.log.warning(f"⚠️ 分词词典预热失败，各 worker 将在首次分析时加载: {e}")
+        return
+    gc.freeze()
+    server.log.info(f"🔥 分词词典预热完成 ({seconds:.2f}s)，worker 共享")
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+加载时的消息过滤（谓词下推）
+
+MessageFilter 描述分析真正需要的消息：时间范围、机器人过滤、发送者集合。
+传给 load_json / iter_messages / load_message_table 后，消息在解析完成时立即判定（时间范围按批整列判定），
+被拒绝的消息不会进入消息列表或 MessageTable，一个月的报告不必物化五年的消息。
+
+发送者过滤可选"引用模式"（keep_references=True）：不在集合中的发送者的消息不丢弃，
+而是缩减为只含消息ID、时间、发送者名称、@ 与回复元素的引用桩，
+个人报告仍能据此解析名称、回复目标、回复间隔以及别人对目标用户的 @ 和回复。
+
+过滤只是优化：ChatAnalyzer / PersonalAnalyzer 仍会按同样的规则自行过滤，
+被丢弃的条数记录在 dropped 中，ChatAnalyzer 据此保持消息总数等统计与不过滤时一致。
+
+FilterPipeline 是分析阶段的过滤规则（机器人、屏蔽关键词 / 正则、最短文本长度），
+每次分析编译一次，对 MessageTable 整列求值得到保留掩码，之后各阶段只处理保留的行。
+"""
+
+import re
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+from itertools import compress, islice
+
+import numpy as np
+
+from analysis_config import AnalysisConfig, resolve_config
+from logger import get_logger
+from message_table import NO_TIME, datetime_to_ms, decode_timestamps, timestamp_to_ms
+
+logger = get_logger(__name__)
+
+_LOCAL_TZ = timezone(timedelta(hours=8))
+# 按时间范围过滤时每批解码的时间戳条数
+_TIME_BATCH = 8192
+_DROP_REASONS = (('time', '时间范围外'), ('bot', '机器人'), ('sender', '其他发送者'), ('reference', '缩减为引用'))
+# FilterPipeline 的规则，按判定顺序排列（命中多条规则时计入第一条）
+RULE_LABELS = (('bot', '机器人'), ('keyword', '屏蔽关键词'), ('pattern', '屏蔽正则'), ('length', '文本过短'))
+
+
+def parse_date_bound(date_str, end_of_day=False):
+    """
+    把 'YYYY-MM-DD' 解析为 UTC+8 当天的起点（或 end_of_day 时的终点）
+
+    格式错误时抛出 ValueError
+    """
+    dt = datetime.strptime(date_str, '%Y-%m-%d')
+    if end_of_day:
+        dt = dt.replace(hour=23, minute=59, second=59, microsecond=999999)
+    else:
+        dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return dt.replace(tzinfo=_LOCAL_TZ)
+
+
+class MessageFilter:
+    """
+    消息过滤条件
+
+    Args:
+        start_ms / end_ms: 时间范围（毫秒级 epoch，闭区间）；任一端设置时缺失时间戳的消息被丢弃
+        filter_bots: 是否丢弃机器人消息（subMsgType 在 bot_sub_msg_types 中，或发送者在 bot_uins 中）
+        bot_uins: 机器人 UIN 列表
+        bot_sub_msg_types: 视为机器人消息的 subMsgType
+        senders: 只保留这些发送者的消息；None 表示不按发送者过滤
+        keep_references: 与 senders 配合，其他发送者的消息缩减为引用桩而不是丢弃
+    """
+
+    def __init__(self, start_ms=None, end_ms=None, filter_bots=False, bot_uins=(),
+                 senders=None, keep_references=False,
+                 bot_sub_msg_types=AnalysisConfig._field_defaults['BOT_SUB_MSG_TYPES']):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.filter_bots = filter_bots
+        self.bot_uins = frozenset(str(uin) for uin in bot_uins or ())
+        self.bot_sub_msg_types = frozenset(bot_sub_msg_types)
+        self.senders = frozenset(str(uin) for uin in senders) if senders is not None else None
+        self.keep_references = keep_references
+        # 按原因统计被丢弃的条数：time / bot / sender；被缩减为引用桩的计入 reference
+        self.dropped = Counter()
+
+    @classmethod
+    def from_config(cls, cfg=None, **kwargs):
+        """
+        按配置构建：MESSAGE_START_DATE / MESSAGE_END_DATE、FILTER_BOT_MESSAGES、BOT_UINS / BOT_SUB_MSG_TYPES，
+        与 ChatAnalyzer 的过滤规则一致；日期格式错误时忽略该端（ChatAnalyzer 会记录警告）
+        """
+        cfg = resolve_config(cfg)
+        start_ms = end_ms = None
+        if cfg.MESSAGE_START_DATE:
+            try:
+                start_ms = datetime_to_ms(parse_date_bound(cfg.MESSAGE_START_DATE))
+            except ValueError:
+                pass
+        if cfg.MESSAGE_END_DATE:
+            try:
+                end_ms = datetime_to_ms(parse_date_bound(cfg.MESSAGE_END_DATE, end_of_day=True))
+            except ValueError:
+                pass
+        kwargs.setdefault('filter_bots', cfg.FILTER_BOT_MESSAGES)
+        kwargs.setdefault('bot_uins', cfg.BOT_UINS)
+        kwargs.setdefault('bot_sub_msg_types', cfg.BOT_SUB_MSG_TYPES)
+        return cls(start_ms=start_ms, end_ms=end_ms, **kwargs)
+
+    @property
+    def is_noop(self):
+        return not self.has_time_range and not self.filter_bots and self.senders is None
+
+    @property
+    def has_time_range(self):
+        return self.start_ms is not None or self.end_ms is not None
+
+    def apply(self, message):
+        """判定一条消息：返回原消息、引用桩，或 None（丢弃）"""
+        if self.has_time_range and not self._in_time_range(timestamp_to_ms(message.get('timestamp', ''))):
+            self.dropped['time'] += 1
+            return None
+        return self._apply_sender_rules(message)
+
+    def _in_time_range(self, ts):
+        return not (ts == NO_TIME or (self.start_ms is not None and ts < self.start_ms)
+                    or (self.end_ms is not None and ts > self.end_ms))
+
+    def _apply_sender_rules(self, message):
+        """机器人与发送者规则"""
+        if self.filter_bots or self.senders is not None:
+            uin = (message.get('sender') or {}).get('uin')
+            uin = str(uin) if uin else ''
+
+            if self.filter_bots:
+                sub_msg_type = (message.get('rawMessage') or {}).get('subMsgType', 0) or 0
+                if sub_msg_type in self.bot_sub_msg_types or (uin and uin in self.bot_uins):
+                    self.dropped['bot'] += 1
+                    return None
+
+            if self.senders is not None and uin not in self.senders:
+                if self.keep_references:
+                    self.dropped['reference'] += 1
+                    return _reference_stub(message)
+                self.dropped['sender'] += 1
+                return None
+
+        return message
+
+    def filter(self, messages):
+        """
+        逐条过滤消息迭代器
+
+        有时间范围时按批取出时间戳，用 decode_timestamps 整批解码后整列比较，
+        不再逐条 fromisoformat（结果与逐条调用 apply 相同）。
+        """
+        if not self.has_time_range:
+            apply = self._apply_sender_rules
+            for message in messages:
+                message = apply(message)
+                if message is not None:
+                    yield message
+            return
+
+        messages = iter(messages)
+        while True:
+            batch = list(islice(messages, _TIME_BATCH))
+            if not batch:
+                return
+            ts = decode_timestamps([message.get('timestamp', '') for message in batch])
+            in_range = ts != NO_TIME
+            if self.start_ms is not None:
+                in_range &= ts >= self.start_ms
+            if self.end_ms is not None:
+                in_range &= ts <= self.end_ms
+            dropped = len(batch) - int(np.count_nonzero(in_range))
+            if dropped:
+                self.dropped['time'] += dropped
+            kept = compress(batch, in_range.tolist())
+            if not self.filter_bots and self.senders is None:
+                yield from kept
+                continue
+            for message in kept:
+                message = self._apply_sender_rules(message)
+                if message is not None:
+                    yield message
+
+    def merge_dropped(self, dropped):
+        """合并其他进程中同一过滤条件的丢弃计数"""
+        self.dropped.update(dropped)
+
+    def log_summary(self, kept_count):
+        if not self.dropped:
+            return
+        details = ', '.join(f"{label} {self.dropped[key]}" for key, label in _DROP_REASONS if self.dropped[key])
+        logger.info(f"🔎 加载时过滤: 保留 {kept_count} 条 ({details})")
+
+
+class FilterPipeline:
+    """
+    分析阶段的消息过滤规则，构建时编译一次
+
+    对 MessageTable 的若干行整列求值：机器人规则只比较 subMsgType 和发送者 id 两列，
+    文本规则（关键词、正则、最短长度）只在配置了时才取出文本，且只检查尚未被过滤的行。
+
+    Args:
+        filter_bots: 是否启用机器人规则
+        bot_uins: 机器人 UIN
+        bot_sub_msg_types: 视为机器人消息的 subMsgType
+        keywords: 屏蔽关键词，文本包含任一即过滤
+        patterns: 屏蔽正则（字符串或已编译的正则），re.search 命中任一即过滤
+        min_text_length: 文本去除首尾空白后少于该字数即过滤（没有文本的消息不受影响），0 表示不限制
+    """
+
+    def __init__(self, filter_bots=True, bot_uins=(),
+                 bot_sub_msg_types=AnalysisConfig._field_defaults['BOT_SUB_MSG_TYPES'],
+                 keywords=(), patterns=(), min_text_length=0):
+        self.filter_bots = filter_bots
+        self.bot_uins = frozenset(str(uin) for uin in bot_uins or ())
+        self.bot_sub_msg_types = np.array(sorted(bot_sub_msg_types), dtype=np.int32)
+        keywords = [keyword for keyword in keywords if keyword]
+        # 关键词合并为一个交替正则，一次扫描判定全部关键词
+        self.keyword_pattern = re.compile('|'.join(map(re.escape, keywords))) if keywords else None
+        self.patterns = tuple(re.compile(pattern) for pattern in patterns)
+        self.min_text_length = max(0, int(min_text_length or 0))
+
+    @classmethod
+    def from_config(cls, cfg):
+        """按配置构建：FILTER_BOT_MESSAGES、BOT_UINS、BOT_SUB_MSG_TYPES、BLOCK_KEYWORDS、BLOCK_PATTERNS、MIN_TEXT_LENGTH"""
+        return cls(
+            filter_bots=cfg.FILTER_BOT_MESSAGES,
+            bot_uins=cfg.BOT_UINS,
+            bot_sub_msg_types=cfg.BOT_SUB_MSG_TYPES,
+            keywords=cfg.BLOCK_KEYWORDS,
+            patterns=cfg.BLOCK_PATTERNS,
+            min_text_length=cfg.MIN_TEXT_LENGTH,
+        )
+
+    @property
+    def has_text_rules(self):
+        return self.keyword_pattern is not None or bool(self.patterns) or self.min_text_length > 0
+
+    def evaluate(self, table, rows):
+        """
+        对 table 的 rows 行求值
+
+        Returns:
+            (keep, dropped)：与 rows 等长的保留掩码，以及按规则统计的过滤条数（Counter）
+        """
+        keep = np.ones(len(rows), dtype=bool)
+        dropped = Counter()
+        if not len(rows):
+            return keep, dropped
+
+        if self.filter_bots:
+            bot = np.isin(table.sub_msg_types[rows], self.bot_sub_msg_types)
+            bot_ids = [table.uin_ids[uin] for uin in self.bot_uins if uin in table.uin_ids]
+            if bot_ids:
+                bot |= np.isin(table.sender_ids[rows], bot_ids)
+            keep &= ~bot
+            dropped['bot'] = int(np.count_nonzero(bot))
+
+        if self.has_text_rules:
+            candidates = np.flatnonzero(keep & (table.text_offsets[rows + 1] > table.text_offsets[rows]))
+            self._apply_text_rules(table, rows, candidates, keep, dropped)
+        return keep, +dropped
+
+    def _apply_text_rules(self, table, rows, candidates, keep, dropped):
+        """
+        文本规则：candidates（rows 中的下标）的文本只解码一次，
+        各规则依次整列检查仍未被过滤的文本，命中的行从 keep 中去掉
+        """
+        buf = table.text_buffer
+        starts = table.text_offsets[rows[candidates]].tolist()
+        ends = table.text_offsets[rows[candidates] + 1].tolist()
+        texts = [str(buf[start:end], 'utf-8') for start, end in zip(starts, ends)]
+        indices = candidates.tolist()
+
+        rules = []
+        if self.keyword_pattern is not None:
+            rules.append(('keyword', self.keyword_pattern.search))
+        rules.extend(('pattern', pattern.search) for pattern in self.patterns)
+        if self.min_text_length:
+            min_length = self.min_text_length
+            rules.append(('length', lambda text: len(text.strip()) < min_length))
+
+        for rule, matches in rules:
+            hits = [matches(text) for text in texts]
+            if not any(hits):
+                continue
+            for i, hit in zip(indices, hits):
+                if hit:
+                    keep[i] = False
+                    dropped[rule] += 1
+            texts = [text for text, hit in zip(texts, hits) if not hit]
+            indices = [i for i, hit in zip(indices, hits) if not hit]
+
+
+def _reference_stub(message):
+    """只保留消息ID、时间、发送者名称、@ 与回复元素（@ 不含文本）"""
+    stub = {}
+    for key in ('messageId', 'timestamp', 'sender'):
+        if key in message:
+            stub[key] = message[key]
+
+    raw = message.get('rawMessage') or {}
+    stub_raw = {}
+    for key in ('subMsgType', 'sendMemberName'):
+        if key in raw:
+            stub_raw[key] = raw[key]
+    elements = []
+    for elem in raw.get('elements') or []:
+        elem_type = elem.get('elementType')
+        kept = {}
+        text_elem = elem.get('textElement')
+        if text_elem:
+            at_type = text_elem.get('atType', 0) or 0
+            at_uid = text_elem.get('atUid', '')
+            if at_type > 0 or (at_uid and str(at_uid) != '0'):
+                kept['textElement'] = {'atType': at_type, 'atUid': at_uid}
+        if elem_type == 7:
+            kept['replyElement'] = elem.get('replyElement') or {}
+        if kept:
+            kept['elementType'] = elem_type
+            elements.append(kept)
+    if elements:
+        stub_raw['elements'] = elements
+    if stub_raw:
+        stub['rawMessage'] = stub_raw
+    return stub
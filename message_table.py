@@ -0,0 +1,699 @@
+# -*- coding: utf-8 -*-
+"""
+列式消息存储
+
+把 load_json 产出的嵌套 dict 消息压缩为一组定长列：
+- 时间戳：int64 毫秒级 epoch
+- 发送者 / 被@者 / 被回复者：共用一个 uin 字符串池，列中只存稠密 id
+- 文本：全部消息共用一个 UTF-8 缓冲区，按偏移量切片
+- elements：在构建时归纳为每条消息的摘要（图片数、表情包数、链接/转发标记），
+  @ 与回复元素以 CSR（偏移量 + 扁平数组）形式存储；回复目标在建表时一并解析（reply_target_ids）
+
+ChatAnalyzer 与 PersonalAnalyzer 直接读取这些列，不再遍历原始 dict。
+"""
+
+import re
+from array import array
+from collections import namedtuple
+from datetime import date, datetime, timezone, timedelta
+
+import numpy as np
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 缺失或无法解析的时间戳
+NO_TIME = np.iinfo(np.int64).min
+
+# flags 位
+FLAG_LINK = 1       # 文本元素含 URL 或链接卡片
+FLAG_FORWARD = 2    # 合并转发
+
+_URL_PATTERN = re.compile(r'https?://')
+_INT64_MAX = 2 ** 63 - 1
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_MS = timedelta(milliseconds=1)
+# 统计口径统一使用东八区
+LOCAL_TZ = timezone(timedelta(hours=8))
+_LOCAL_OFFSET_MS = 8 * 3600 * 1000
+_DAY_MS = 24 * 3600 * 1000
+_EPOCH_DATE = date(1970, 1, 1)
+
+# 批量解码时间戳的快速路径：QQChatExporter 的固定格式 YYYY-MM-DDTHH:MM:SS.fffZ
+_FIXED_TS_LEN = 24
+_FIXED_TS_SEP_POS = np.array([4, 7, 10, 13, 16, 19, 23])
+_FIXED_TS_SEP_CHARS = np.frombuffer(b'--T::.Z', dtype=np.uint8)
+_FIXED_TS_DIGITS = np.setdiff1d(np.arange(_FIXED_TS_LEN), _FIXED_TS_SEP_POS)
+_MONTH_DAYS = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+# 构建器每攒够这么多条时间戳批量解码一次
+_TS_BATCH = 8192
+
+# 表结构版本：列或归纳规则变化时递增，解析缓存据此失效
+TABLE_FORMAT_VERSION = 2
+
+# 列名与 dtype（构建器中对应 array 的 typecode 为 q / i / B）
+COLUMNS = (
+    ('timestamps', np.int64),
+    ('sender_ids', np.int32),
+    ('name_ids', np.int32),
+    ('member_name_ids', np.int32),
+    ('msg_keys', np.int64),
+    ('sub_msg_types', np.int32),
+    ('content_emoji_counts', np.int32),
+    ('image_counts', np.int32),
+    ('sticker_counts', np.int32),
+    ('flags', np.uint8),
+    ('text_offsets', np.int64),
+    ('at_offsets', np.int64),
+    ('at_types', np.int32),
+    ('at_uid_ids', np.int32),
+    ('at_text_ids', np.int32),
+    ('at_in_text', np.uint8),
+    ('reply_offsets', np.int64),
+    ('reply_sender_ids', np.int32),
+    ('reply_source_keys', np.int64),
+    ('reply_replay_keys', np.int64),
+    ('reply_target_ids', np.int32),
+)
+
+# iter_rows 产出的单行视图；sender 为 uin 字符串（缺失时为 None），name / member_name / text 缺失时为 ''
+MessageRow = namedtuple('MessageRow', [
+    'row', 'timestamp', 'sender_id', 'sender', 'name', 'member_name', 'msg_key', 'sub_msg_type',
+    'text', 'emoji_count', 'image_count', 'sticker_count', 'flags', 'ats', 'replies',
+])
+# 带 @ 信息的 textElement；in_text 表示该元素 elementType == 1
+AtEntry = namedtuple('AtEntry', ['at_type', 'uid', 'content', 'in_text'])
+# 回复元素；source_key / replay_key 为编码后的消息键（-1 表示缺失），
+# target 为解析出的被回复者 uin（见 resolve_reply_targets，无法解析时为 ''）
+ReplyEntry = namedtuple('ReplyEntry', ['sender_uid', 'source_key', 'replay_key', 'target'])
+
+
+def datetime_to_ms(dt):
+    """datetime 转毫秒级 epoch（向下取整）"""
+    if dt.tzinfo is None:
+        # 与 parse_datetime 一致：无时区信息时按本地时间处理
+        dt = dt.astimezone()
+    return (dt - _EPOCH) // _ONE_MS
+
+
+def ms_to_datetime(ms, tz=LOCAL_TZ):
+    """毫秒级 epoch 转为指定时区的 datetime"""
+    return (_EPOCH + timedelta(milliseconds=ms)).astimezone(tz)
+
+
+def local_hour(ms):
+    """毫秒级 epoch 对应的东八区小时（也可直接作用于 int64 数组）"""
+    return (ms + _LOCAL_OFFSET_MS) // 3600000 % 24
+
+
+def local_day(ms):
+    """毫秒级 epoch 对应的东八区日序号（1970-01-01 为 0，也可作用于数组）"""
+    return (ms + _LOCAL_OFFSET_MS) // _DAY_MS
+
+
+def local_weekday(ms):
+    """毫秒级 epoch 对应的东八区星期（周一为 0，也可作用于数组）"""
+    return (local_day(ms) + 3) % 7
+
+
+def day_to_date(day):
+    """local_day 的日序号转为 date"""
+    return _EPOCH_DATE + timedelta(days=int(day))
+
+
+def count_first_seen(values):
+    """
+    统计数组中各值的出现次数，按首次出现的顺序返回 (值列表, 次数列表)
+
+    按这个顺序累加到 Counter，键的插入顺序与逐条累加时一致（most_common 并列时的先后不变）
+    """
+    values = np.asarray(values)
+    if not len(values):
+        return [], []
+    uniq, first, counts = np.unique(values, return_index=True, return_counts=True)
+    order = np.argsort(first, kind='stable')
+    return uniq[order].tolist(), counts[order].tolist()
+
+
+def timestamp_to_ms(ts):
+    """ISO 8601 时间字符串转毫秒级 epoch；无法解析时返回 NO_TIME"""
+    if not ts:
+        return NO_TIME
+    try:
+        dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+    except (ValueError, TypeError, AttributeError):
+        return NO_TIME
+    return datetime_to_ms(dt)
+
+
+def decode_timestamps(values):
+    """
+    批量把时间戳字符串解码为毫秒级 epoch 的 int64 数组，结果与逐个调用 timestamp_to_ms 一致
+
+    固定格式 YYYY-MM-DDTHH:MM:SS.fffZ 拼成字节矩阵后整批用 NumPy 算术解码；
+    其他格式、非法日期和非字符串逐个回退到 timestamp_to_ms。
+    """
+    n = len(values)
+    out = np.full(n, NO_TIME, dtype=np.int64)
+    try:
+        lengths = np.fromiter(map(len, values), dtype=np.int64, count=n)
+    except TypeError:
+        # 混有数字 / None 等非字符串（标准加载得到的原始消息），全部逐个解码
+        lengths = np.zeros(n, dtype=np.int64)
+    fixed = np.flatnonzero(lengths == _FIXED_TS_LEN)
+    if len(fixed):
+        try:
+            strings = values if len(fixed) == n else [values[i] for i in fixed.tolist()]
+            # 非 ASCII 字符替换为 '?'，保证每行恰好 24 字节，并在下面的校验中落选
+            raw = ''.join(strings).encode('ascii', 'replace')
+        except TypeError:
+            raw = b''
+        if len(raw) == len(fixed) * _FIXED_TS_LEN:
+            ms, ok = _decode_fixed_timestamps(np.frombuffer(raw, dtype=np.uint8).reshape(-1, _FIXED_TS_LEN))
+            out[fixed[ok]] = ms[ok]
+            lengths[fixed[ok]] = -1
+    for i in np.flatnonzero(lengths != -1).tolist():
+        out[i] = timestamp_to_ms(values[i])
+    return out
+
+
+def _decode_fixed_timestamps(mat):
+    """解码 (n, 24) 的字节矩阵，返回 (毫秒数组, 有效掩码)"""
+    ok = (mat[:, _FIXED_TS_SEP_POS] == _FIXED_TS_SEP_CHARS).all(axis=1)
+    digits = mat - np.uint8(ord('0'))   # 非数字字符在 uint8 下回绕为大于 9 的值
+    ok &= (digits[:, _FIXED_TS_DIGITS] <= 9).all(axis=1)
+
+    def field(start, stop):
+        return digits[:, start:stop].astype(np.int64) @ (10 ** np.arange(stop - start - 1, -1, -1))
+
+    year, month, day = field(0, 4), field(5, 7), field(8, 10)
+    hour, minute, second, milli = field(11, 13), field(14, 16), field(17, 19), field(20, 23)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = _MONTH_DAYS[np.clip(month, 0, 12)] + ((month == 2) & leap)
+    ok &= ((year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+           & (hour <= 23) & (minute <= 59) & (second <= 59))
+
+    # 公历日期转 epoch 日序号（days_from_civil）
+    y = year - (month <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    days = era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+    return days * _DAY_MS + hour * 3600000 + minute * 60000 + second * 1000 + milli, ok
+
+
+def _numeric_msg_key(msg_id):
+    """规范十进制数字（无前导零且不超过 int64）的消息 ID 直接作为键，否则返回 None"""
+    if msg_id.isdigit() and (msg_id[0] != '0' or msg_id == '0') and len(msg_id) <= 19:
+        value = int(msg_id)
+        if value <= _INT64_MAX:
+            return value
+    return None
+
+
+class _StringPool:
+    """字符串驻留池：相同字符串只存一份，列中存稠密 id"""
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def intern(self, value):
+        idx = self.index.get(value)
+        if idx is None:
+            idx = len(self.values)
+            self.index[value] = idx
+            self.values.append(value)
+        return idx
+
+
+def resolve_reply_targets(columns, uin_ids):
+    """
+    解析每个回复元素的被回复者，返回 uin id 数组（-1 表示无法解析）
+
+    优先用回复元素的 senderUid（缺失或为 '0' 时不用）；否则按 sourceMsgIdInRecords
+    （缺失时用 replayMsgId）在本表有发送者的消息中查找，消息 ID 重复时取最后一条。
+    流式分析的分块小表只在块内查找。
+
+    Args:
+        columns: 列名 -> 数组，需含 sender_ids、msg_keys 和 reply_* 列
+        uin_ids: uin 字符串 -> id
+    """
+    sender_ids = columns['reply_sender_ids']
+    valid = sender_ids >= 0
+    zero_id = uin_ids.get('0')
+    if zero_id is not None:
+        valid &= sender_ids != zero_id
+    targets = sender_ids.astype(np.int32)
+    if not valid.all():
+        has_sender = columns['sender_ids'] >= 0
+        index = MessageKeyIndex(columns['msg_keys'][has_sender], columns['sender_ids'][has_sender])
+        source = columns['reply_source_keys'][~valid]
+        ref_keys = np.where(source != -1, source, columns['reply_replay_keys'][~valid])
+        targets[~valid] = index.lookup(ref_keys)
+    return targets
+
+
+class MessageTableBuilder:
+    """逐条追加 dict 消息，构建 MessageTable"""
+
+    def __init__(self, shared=None):
+        if shared is not None:
+            # 分块构建时沿用上一块的字符串池，各块的 id 与消息键保持一致
+            self.uins = shared.uins
+            self.names = shared.names
+            self.extra_msg_ids = shared.extra_msg_ids
+        else:
+            self.uins = _StringPool()
+            self.names = _StringPool()
+            # 非纯数字的消息 ID 映射为负数键（-1 表示缺失）
+            self.extra_msg_ids = {}
+
+        self.timestamps = array('q')
+        # 待批量解码的时间戳字符串
+        self._pending_timestamps = []
+        self.sender_ids = array('i')
+        self.name_ids = array('i')
+        self.member_name_ids = array('i')
+        self.msg_keys = array('q')
+        self.sub_msg_types = array('i')
+        self.content_emoji_counts = array('i')
+        self.image_counts = array('i')
+        self.sticker_counts = array('i')
+        self.flags = array('B')
+
+        self.text_offsets = array('q', [0])
+        self.text_buffer = bytearray()
+
+        self.at_offsets = array('q', [0])
+        self.at_types = array('i')
+        self.at_uid_ids = array('i')
+        self.at_text_ids = array('i')
+        self.at_in_text = array('B')
+
+        self.reply_offsets = array('q', [0])
+        self.reply_sender_ids = array('i')
+        self.reply_source_keys = array('q')
+        self.reply_replay_keys = array('q')
+
+    def msg_key(self, msg_id):
+        """消息 ID 编码为 int64 键：规范十进制数字直接转换，其余分配负数键，缺失为 -1"""
+        if not msg_id:
+            return -1
+        msg_id = str(msg_id)
+        key = _numeric_msg_key(msg_id)
+        if key is not None:
+            return key
+        key = self.extra_msg_ids.get(msg_id)
+        if key is None:
+            key = -2 - len(self.extra_msg_ids)
+            self.extra_msg_ids[msg_id] = key
+        return key
+
+    def _uin_id(self, uin):
+        return self.uins.intern(str(uin)) if uin else -1
+
+    def _name_id(self, name):
+        name = (name or '').strip()
+        return self.names.intern(name) if name else -1
+
+    def append(self, msg):
+        sender = msg.get('sender') or {}
+        content = msg.get('content')
+        if not isinstance(content, dict):
+            content = {}
+        raw = msg.get('rawMessage') or {}
+
+        self._pending_timestamps.append(msg.get('timestamp', ''))
+        if len(self._pending_timestamps) >= _TS_BATCH:
+            self._flush_timestamps()
+        self.sender_ids.append(self._uin_id(sender.get('uin')))
+        self.name_ids.append(self._name_id(sender.get('name')))
+        self.member_name_ids.append(self._name_id(raw.get('sendMemberName')))
+        self.msg_keys.append(self.msg_key(msg.get('messageId')))
+        self.sub_msg_types.append(raw.get('subMsgType', 0) or 0)
+        self.content_emoji_counts.append(len(content.get('emojis') or []))
+
+        text = content.get('text') or ''
+        self.text_buffer += text.encode('utf-8')
+        self.text_offsets.append(len(self.text_buffer))
+
+        image_count = 0
+        sticker_count = 0
+        flags = 0
+        for elem in raw.get('elements') or []:
+            elem_type = elem.get('elementType')
+
+            text_elem = elem.get('textElement')
+            if text_elem:
+                at_type = text_elem.get('atType', 0) or 0
+                at_uid = text_elem.get('atUid', '')
+                at_uid_str = str(at_uid) if at_uid else ''
+                if at_type > 0 or (at_uid_str and at_uid_str != '0'):
+                    self.at_types.append(at_type)
+                    self.at_uid_ids.append(self.uins.intern(at_uid_str) if at_uid_str else -1)
+                    at_text = text_elem.get('content', '')
+                    self.at_text_ids.append(self.names.intern(at_text) if at_text else -1)
+                    self.at_in_text.append(1 if elem_type == 1 else 0)
+                if elem_type == 1 and _URL_PATTERN.search(text_elem.get('content', '') or ''):
+                    flags |= FLAG_LINK
+
+            if elem_type == 2:  # 图片元素
+                summary = (elem.get('picElement') or {}).get('summary', '')
+                # 判断是否为表情包（summary格式为 [表情名称]）
+                if summary and summary.startswith('[') and summary.endswith(']'):
+                    sticker_count += 1
+                else:
+                    image_count += 1
+            elif elem_type == 10:  # 链接元素
+                flags |= FLAG_LINK
+            elif elem_type == 16 and 'multiForwardMsgElement' in elem:  # 合并转发元素
+                flags |= FLAG_FORWARD
+            elif elem_type == 7:  # 回复元素
+                reply_elem = elem.get('replyElement') or {}
+                self.reply_sender_ids.append(self._uin_id(reply_elem.get('senderUid')))
+                self.reply_source_keys.append(self.msg_key(reply_elem.get('sourceMsgIdInRecords')))
+                self.reply_replay_keys.append(self.msg_key(reply_elem.get('replayMsgId')))
+
+        self.image_counts.append(image_count)
+        self.sticker_counts.append(sticker_count)
+        self.flags.append(flags)
+        self.at_offsets.append(len(self.at_types))
+        self.reply_offsets.append(len(self.reply_sender_ids))
+
+    def _flush_timestamps(self):
+        if self._pending_timestamps:
+            self.timestamps.frombytes(decode_timestamps(self._pending_timestamps).tobytes())
+            self._pending_timestamps = []
+
+    def __len__(self):
+        return len(self.sender_ids)
+
+    def build(self):
+        self._flush_timestamps()
+        columns = {name: np.frombuffer(getattr(self, name), dtype=dtype)
+                   for name, dtype in COLUMNS if name != 'reply_target_ids'}
+        columns['reply_target_ids'] = resolve_reply_targets(columns, self.uins.index)
+        return MessageTable(columns, self.text_buffer, self.uins.values, self.names.values,
+                            self.extra_msg_ids, uin_ids=self.uins.index)
+
+
+class MessageTable:
+    """
+    列式消息表，列均为 NumPy 数组
+
+    构建时零拷贝引用 MessageTableBuilder 中的 array 缓冲区；从解析缓存打开时直接映射文件。
+    text_buffer 可以是 bytearray 或 memoryview。
+    """
+
+    def __init__(self, columns, text_buffer, uins, names, extra_msg_ids, uin_ids=None):
+        for name, _ in COLUMNS:
+            setattr(self, name, columns[name])
+        self.text_buffer = text_buffer
+        self.uins = uins
+        self.uin_ids = uin_ids if uin_ids is not None else {uin: i for i, uin in enumerate(uins)}
+        self.names = names
+        self.extra_msg_ids = extra_msg_ids
+
+    @classmethod
+    def from_messages(cls, messages):
+        builder = MessageTableBuilder()
+        for msg in messages:
+            builder.append(msg)
+        return builder.build()
+
+    @classmethod
+    def iter_chunks(cls, messages, chunk_size=50000):
+        """把消息迭代器切成若干个小表，供流式分析使用（各小表共用字符串池）"""
+        builder = MessageTableBuilder()
+        for msg in messages:
+            builder.append(msg)
+            if len(builder) >= chunk_size:
+                yield builder.build()
+                builder = MessageTableBuilder(shared=builder)
+        if len(builder):
+            yield builder.build()
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        按顺序拼接多个独立构建的表（如并行解析的各段）
+
+        各表的字符串池与非数字消息键各不相同，拼接时重新驻留并映射 id 列。
+        """
+        uins = _StringPool()
+        names = _StringPool()
+        extra_msg_ids = {}
+        parts = {name: [] for name, _ in COLUMNS}
+        text_buffer = bytearray()
+        bases = {'text_offsets': 0, 'at_offsets': 0, 'reply_offsets': 0}
+
+        for table in tables:
+            # 末尾追加 -1，使 -1（缺失）经映射后仍为 -1
+            uin_map = np.array([uins.intern(u) for u in table.uins] + [-1], dtype=np.int32)
+            name_map = np.array([names.intern(n) for n in table.names] + [-1], dtype=np.int32)
+            key_map = np.zeros(len(table.extra_msg_ids), dtype=np.int64)
+            for msg_id, key in table.extra_msg_ids.items():
+                new_key = extra_msg_ids.get(msg_id)
+                if new_key is None:
+                    new_key = -2 - len(extra_msg_ids)
+                    extra_msg_ids[msg_id] = new_key
+                key_map[-2 - key] = new_key
+
+            for name, _ in COLUMNS:
+                col = getattr(table, name)
+                if name == 'reply_target_ids':
+                    # 回复可能引用其他段的消息，拼接后整体重新解析
+                    continue
+                if name in ('sender_ids', 'at_uid_ids', 'reply_sender_ids'):
+                    col = uin_map[col]
+                elif name in ('name_ids', 'member_name_ids', 'at_text_ids'):
+                    col = name_map[col]
+                elif name in ('msg_keys', 'reply_source_keys', 'reply_replay_keys'):
+                    extra = col <= -2
+                    if extra.any():
+                        col = col.copy()
+                        col[extra] = key_map[-2 - col[extra]]
+                elif name in bases:
+                    # 偏移量列去掉开头的 0 并加上前面各表的累计长度
+                    col = col[1:] + bases[name]
+                    bases[name] += int(getattr(table, name)[-1])
+                parts[name].append(col)
+            text_buffer += table.text_buffer
+
+        columns = {}
+        for name, dtype in COLUMNS:
+            if name == 'reply_target_ids':
+                continue
+            if name in bases:
+                parts[name].insert(0, np.zeros(1, dtype=dtype))
+            columns[name] = np.concatenate(parts[name]).astype(dtype, copy=False) if parts[name] else np.zeros(0, dtype=dtype)
+        columns['reply_target_ids'] = resolve_reply_targets(columns, uins.index)
+        return cls(columns, text_buffer, uins.values, names.values, extra_msg_ids, uin_ids=uins.index)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def nbytes(self):
+        """列与字符串池占用的大致字节数"""
+        total = len(self.text_buffer)
+        total += sum(getattr(self, name).nbytes for name, _ in COLUMNS)
+        total += sum(len(s) * 2 + 50 for s in self.uins) + sum(len(s) * 2 + 50 for s in self.names)
+        return total
+
+    def text(self, row):
+        start = self.text_offsets[row]
+        end = self.text_offsets[row + 1]
+        if start == end:
+            return ''
+        return str(self.text_buffer[start:end], 'utf-8')
+
+    def iter_rows(self, rows=None, batch_size=8192):
+        """
+        按行号顺序产出 MessageRow
+
+        Args:
+            rows: 行号数组，None 表示全部行
+            batch_size: 每批从列中取出的行数
+        """
+        if rows is None:
+            rows = np.arange(len(self))
+        uins = self.uins
+        names = self.names
+        at_types = self.at_types.tolist()
+        at_uids = self.at_uid_ids.tolist()
+        at_texts = self.at_text_ids.tolist()
+        at_in_text = self.at_in_text.tolist()
+        reply_senders = self.reply_sender_ids.tolist()
+        reply_sources = self.reply_source_keys.tolist()
+        reply_replays = self.reply_replay_keys.tolist()
+        reply_targets = self.reply_target_ids.tolist()
+        buf = self.text_buffer
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            text_starts = self.text_offsets[batch].tolist()
+            text_ends = self.text_offsets[batch + 1].tolist()
+            at_starts = self.at_offsets[batch].tolist()
+            at_ends = self.at_offsets[batch + 1].tolist()
+            reply_starts = self.reply_offsets[batch].tolist()
+            reply_ends = self.reply_offsets[batch + 1].tolist()
+            columns = zip(
+                batch.tolist(),
+                self.timestamps[batch].tolist(),
+                self.sender_ids[batch].tolist(),
+                self.name_ids[batch].tolist(),
+                self.member_name_ids[batch].tolist(),
+                self.msg_keys[batch].tolist(),
+                self.sub_msg_types[batch].tolist(),
+                self.content_emoji_counts[batch].tolist(),
+                self.image_counts[batch].tolist(),
+                self.sticker_counts[batch].tolist(),
+                self.flags[batch].tolist(),
+            )
+            for i, (row, ts, sender_id, name_id, member_id, msg_key, sub_msg_type,
+                    emoji_count, image_count, sticker_count, flags) in enumerate(columns):
+                ats = ()
+                if at_starts[i] != at_ends[i]:
+                    ats = tuple(
+                        AtEntry(at_types[j],
+                                uins[at_uids[j]] if at_uids[j] >= 0 else '',
+                                names[at_texts[j]] if at_texts[j] >= 0 else '',
+                                at_in_text[j] == 1)
+                        for j in range(at_starts[i], at_ends[i])
+                    )
+                replies = ()
+                if reply_starts[i] != reply_ends[i]:
+                    replies = tuple(
+                        ReplyEntry(uins[reply_senders[j]] if reply_senders[j] >= 0 else '',
+                                   reply_sources[j], reply_replays[j],
+                                   uins[reply_targets[j]] if reply_targets[j] >= 0 else '')
+                        for j in range(reply_starts[i], reply_ends[i])
+                    )
+                yield MessageRow(
+                    row, ts, sender_id,
+                    uins[sender_id] if sender_id >= 0 else None,
+                    names[name_id] if name_id >= 0 else '',
+                    names[member_id] if member_id >= 0 else '',
+                    msg_key, sub_msg_type,
+                    str(buf[text_starts[i]:text_ends[i]], 'utf-8'),
+                    emoji_count, image_count, sticker_count, flags, ats, replies,
+                )
+
+    def msg_key(self, msg_id):
+        """按构建时的规则编码消息 ID；表中不存在的非数字 ID 返回 None"""
+        if not msg_id:
+            return -1
+        msg_id = str(msg_id)
+        key = _numeric_msg_key(msg_id)
+        if key is not None:
+            return key
+        return self.extra_msg_ids.get(msg_id)
+
+    def time_mask(self, start_ms=None, end_ms=None):
+        """时间范围过滤掩码（闭区间，缺失时间戳的行为 False）"""
+        mask = self.timestamps != NO_TIME
+        if start_ms is not None:
+            mask &= self.timestamps >= start_ms
+        if end_ms is not None:
+            mask &= self.timestamps <= end_ms
+        return mask
+
+
+class MessageKeyIndex:
+    """
+    消息键 -> 整数值（发送者 id、行号、时间戳等）的排序索引，
+    用 numpy searchsorted 查找，替代以消息 ID 字符串为键的大 dict
+    """
+
+    def __init__(self, keys, values, keep='last'):
+        keys = np.asarray(keys, dtype=np.int64)
+        values = np.asarray(values, dtype=np.int64)
+        valid = keys != -1
+        keys = keys[valid]
+        values = values[valid]
+        # 稳定排序后按 keep 规则去重：keep='last' 与 dict 逐条覆盖的语义一致，keep='first' 对应顺序查找首个匹配
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        values = values[order]
+        if len(keys):
+            if keep == 'last':
+                unique = np.append(keys[1:] != keys[:-1], True)
+            else:
+                unique = np.insert(keys[1:] != keys[:-1], 0, True)
+            keys = keys[unique]
+            values = values[unique]
+        self.keys = keys
+        self.values = values
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys, default=-1):
+        """批量查找，未命中的位置填 default"""
+        keys = np.asarray(keys, dtype=np.int64)
+        if not len(self.keys) or not len(keys):
+            return np.full(len(keys), default, dtype=np.int64)
+        pos = np.searchsorted(self.keys, keys)
+        pos = np.minimum(pos, len(self.keys) - 1)
+        hit = (self.keys[pos] == keys) & (keys != -1)
+        return np.where(hit, self.values[pos], default)
+
+    def get(self, key, default=-1):
+        if key is None or key == -1 or not len(self.keys):
+            return default
+        pos = int(np.searchsorted(self.keys, key))
+        if pos < len(self.keys) and self.keys[pos] == key:
+            return int(self.values[pos])
+        return default
+
+
+def load_message_table(filepath, backend=None, use_cache=True, workers=None, message_filter=None, config=None):
+    """
+    流式解析导出文件并直接构建 MessageTable，不物化 dict 消息列表
+
+    启用解析缓存（PARSE_CACHE_ENABLED）时，同一内容的文件第二次打开直接映射缓存文件，跳过 JSON 解析。
+    workers > 1（默认读取配置 PARSE_WORKERS）时大文件按段并行解析，见 parallel_loader。
+
+    message_filter（见 message_filter.MessageFilter）在解析时丢弃不需要的消息，结果中以 messageFilter 附带。
+    缓存命中时直接返回映射的完整表（各列按需换入内存，分析器会自行过滤），此时结果中没有 messageFilter；
+    过滤后的表不写入缓存。
+
+    config 为可选的 AnalysisConfig，提供 PARSE_WORKERS 和解析缓存配置；None 时读取 config 模块。
+
+    Returns:
+        与 load_json 相同形状的 dict，但 messages 为 MessageTable
+    """
+    from utils import iter_messages
+    from parse_cache import get_parse_cache
+    from parallel_loader import load_parallel, resolve_workers
+
+    if workers is None and config is not None:
+        workers = config.PARSE_WORKERS
+    cache = get_parse_cache(config) if use_cache else None
+    if cache is not None:
+        cached = cache.get(filepath)
+        if cached is not None:
+            return cached
+
+    if message_filter is not None and message_filter.is_noop:
+        message_filter = None
+
+    parallel = load_parallel(filepath, resolve_workers(workers), backend, as_table=True,
+                             message_filter=message_filter)
+    if parallel is not None:
+        table, chat_info = parallel
+    else:
+        chat_info = {}
+        table = MessageTable.from_messages(iter_messages(filepath, chat_info, backend, message_filter))
+    logger.debug(f"列式消息表: {len(table)} 条, 约 {table.nbytes / 1024 / 1024:.1f} MB")
+
+    if message_filter is not None:
+        message_filter.log_summary(len(table))
+        return {'messages': table, 'chatInfo': chat_info, 'messageFilter': message_filter}
+
+    if cache is not None:
+        cache.put(filepath, table, chat_info)
+    return {'messages': table, 'chatInfo': chat_info}
@@ -0,0 +1,789 @@
+# -*- coding: utf-8 -*-
+"""
+新词发现的 n-gram 统计
+
+旧实现先把所有 2~5 字 n-gram 及其左右邻字全部放进 Counter，再按 NEW_WORD_MIN_FREQ 过滤，
+一年的大群能占用十几 GB 内存。这里分两遍：
+
+1. 计数：所有句子拼成一个码点数组，按长度逐级统计。n-gram 用精确的整数键表示
+   （长度 n-1 的前缀在上一级的编号 * 基数 + 最后一个字），频次达不到阈值的前缀不会再向后扩展
+   （n-gram 的出现次数不超过其前缀），每级只保留达到阈值的 n-gram。
+2. 邻字：每一级筛出后，只为达到阈值的 n-gram 统计左右邻字分布。
+
+文本按批编码为码点数组，切分字符由查找表映射为分隔符；同一遍扫描可顺带统计单字独立性（char_stats）。
+结果与逐句枚举完全一致。统计结果按词平铺为数组（NgramStats），邻字次数按首次出现的顺序排列，
+与逐个出现累加到 Counter 时的插入顺序相同（信息熵按同样的顺序求和）。
+
+select_new_words 在这些数组上向量化地计算左右邻接熵和最小切分 PMI，判定与逐词计算完全一致。
+"""
+
+import re
+import math
+
+import numpy as np
+
+from segmenter import find_texts_containing
+from utils import SingleCharStats, all_code_points, calculate_entropy, iter_text_codes
+
+_SENTENCE_SPLIT_PATTERN = re.compile(r'[，。！？、；：""''（）\s\n\r,\.!?\(\)]')
+
+# 句子之间的分隔符：换行本身就是切分字符，不会出现在句子中
+_SEPARATOR = ord('\n')
+# 句首 / 句尾的邻字标记，取 Unicode 范围之外的值
+_BOS = 0x110000
+_EOS = 0x110001
+_BASE = 0x110002
+_split_table = None
+
+
+def _sentence_breaks():
+    """码点 -> 是否为句子切分字符的查找表，与 _SENTENCE_SPLIT_PATTERN 一致，首次调用时构建"""
+    global _split_table
+    if _split_table is None:
+        table = np.zeros(0x110000, dtype=bool)
+        table[[m.start() for m in _SENTENCE_SPLIT_PATTERN.finditer(all_code_points())]] = True
+        _split_table = table
+    return _split_table
+
+
+def _sentence_codes(codes, lengths):
+    """
+    把一批文本的码点（iter_text_codes 的结果）转为以分隔符切开句子的码点数组
+
+    切分字符和文本边界都变为分隔符。切分字符包含全部空白，句子无需再 strip；
+    不足 2 个字的句子留在数组中不影响 n-gram 和邻字（两侧都是分隔符），只是不计入总字数。
+
+    Returns:
+        (码点数组, 不少于 2 个字的句子的总字数)
+    """
+    starts = np.zeros(len(lengths), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    sentences = np.where(_sentence_breaks()[codes], np.int32(_SEPARATOR), codes)
+    sentences = np.append(np.insert(sentences, starts[1:], _SEPARATOR), np.int32(_SEPARATOR))
+
+    # 各句长度：相邻分隔符之间的字数
+    separators = np.flatnonzero(sentences == _SEPARATOR)
+    runs = np.diff(separators, prepend=-1) - 1
+    total_chars = int(runs[runs >= 2].sum())
+    return sentences, total_chars
+
+
+def _iter_code_batches(texts, char_stats=None):
+    """
+    按批返回 (句子码点数组, 该批在全部码点中的起始位置, 该批句子总字数)
+
+    批与批之间在文本边界处断开；传入 char_stats（utils.SingleCharStats）时在同一遍扫描中统计单字独立性。
+    """
+    offset = 0
+    for codes, lengths in iter_text_codes(texts):
+        if char_stats is not None:
+            char_stats.update(codes, lengths)
+        sentences, total_chars = _sentence_codes(codes, lengths)
+        yield sentences, offset, total_chars
+        offset += len(sentences)
+
+
+def _encode_sentences(texts, char_stats=None):
+    """把所有句子以分隔符拼接为码点数组，返回 (码点数组, 句子总字数)"""
+    parts = []
+    total_chars = 0
+    for sentences, _, batch_chars in _iter_code_batches(texts, char_stats):
+        parts.append(sentences)
+        total_chars += batch_chars
+    if not parts:
+        return np.zeros(0, dtype=np.int32), 0
+    return np.concatenate(parts), total_chars
+
+
+class NgramStats:
+    """
+    达到频次阈值的 n-gram 及其左右邻字分布，按词平铺为数组
+
+    words[i] 的频次为 freqs[i]；左邻字的各项次数为 left_counts[left_offsets[i]:left_offsets[i + 1]]，
+    按首次出现的顺序排列，右邻字同理。句首 / 句尾各算作一种邻字。
+    left / right 可以带第三项：与各项次数对应的邻字码点（句首 / 句尾为 _BOS / _EOS），合并统计时使用。
+    """
+
+    def __init__(self, words, freqs, left, right, total_chars):
+        self.words = words
+        self.freqs = freqs
+        self.left_offsets, self.left_counts = left[:2]
+        self.right_offsets, self.right_counts = right[:2]
+        self.left_neighbors = left[2] if len(left) > 2 else None
+        self.right_neighbors = right[2] if len(right) > 2 else None
+        self.total_chars = total_chars
+
+    def __len__(self):
+        return len(self.words)
+
+    def freq_map(self):
+        """{n-gram: 频次}"""
+        return dict(zip(self.words, self.freqs.tolist()))
+
+    def neighbor_pairs(self, side):
+        """
+        某一侧的邻字平铺为 (词编号, 首次出现的次序, 次数, 邻字码点)，
+        次序为在平铺数组中的位置，组内递增
+        """
+        offsets, counts, neighbors = ((self.left_offsets, self.left_counts, self.left_neighbors) if side == 'left'
+                                      else (self.right_offsets, self.right_counts, self.right_neighbors))
+        word_ids = np.repeat(np.arange(len(self.words), dtype=np.int64), np.diff(offsets))
+        return word_ids, np.arange(len(counts), dtype=np.int64), counts, neighbors
+
+    def subset(self, mask):
+        """只保留 mask 为 True 的词；mask 也可以是词的下标数组，结果按下标的顺序排列"""
+        mask = np.asarray(mask)
+        index = np.flatnonzero(mask) if mask.dtype == bool else mask
+        sides = []
+        for side in ('left', 'right'):
+            word_ids, first, counts, neighbors = self.neighbor_pairs(side)
+            remap = np.full(len(self.words), -1, dtype=np.int64)
+            remap[index] = np.arange(len(index))
+            keep = remap[word_ids] >= 0
+            sides.append(_group_neighbors(remap[word_ids[keep]], first[keep], counts[keep], neighbors[keep], len(index)))
+        return NgramStats([self.words[i] for i in index.tolist()], self.freqs[index], *sides, self.total_chars)
+
+
+def _group_neighbors(word_ids, first, counts, neighbors, n_words):
+    """
+    把 (词编号, 首次出现位置, 次数, 邻字) 的邻字组合按词分组，组内按首次出现的顺序排列
+
+    Returns:
+        (offsets, counts, neighbors)：第 i 个词的邻字次数为 counts[offsets[i]:offsets[i + 1]]
+    """
+    order = np.lexsort((first, word_ids))
+    offsets = np.zeros(n_words + 1, dtype=np.int64)
+    np.cumsum(np.bincount(word_ids, minlength=n_words), out=offsets[1:])
+    return offsets, counts[order].astype(np.int64), neighbors[order].astype(np.int64)
+
+
+def _build_stats(levels, total_chars):
+    """
+    合并各长度的统计结果
+
+    Args:
+        levels: [(words, freqs, left_pairs, right_pairs)]，邻字组合为该级内的 (词编号, 首次出现位置, 次数, 邻字)
+    """
+    words = []
+    freqs = []
+    sides = ([], [])
+    base = 0
+    for level_words, level_freqs, *pairs in levels:
+        words.extend(level_words)
+        freqs.append(level_freqs)
+        for side, (ids, first, counts, neighbors) in zip(sides, pairs):
+            side.append((ids + base, first, counts, neighbors))
+        base += len(level_words)
+
+    def grouped(parts):
+        if not parts:
+            return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return _group_neighbors(*(np.concatenate([part[k] for part in parts]) for k in range(4)), base)
+
+    freqs = np.concatenate(freqs).astype(np.int64) if freqs else np.zeros(0, dtype=np.int64)
+    return NgramStats(words, freqs, grouped(sides[0]), grouped(sides[1]), total_chars)
+
+
+def _split_pairs(keys, first, counts):
+    """邻字组合键拆出词编号和邻字"""
+    return keys // _BASE, first, counts, keys % _BASE
+
+
+def count_ngrams(texts, min_freq, max_n=5, char_stats=None):
+    """
+    统计 2~max_n 字 n-gram 中频次不低于 min_freq 的，以及它们的左右邻字
+
+    Args:
+        texts: 清理后的文本
+        min_freq: 频次阈值（NEW_WORD_MIN_FREQ）
+        max_n: 最长的 n-gram
+        char_stats: utils.SingleCharStats；传入时在编码文本的同一遍扫描中统计单字独立性
+
+    Returns:
+        NgramStats，只含达到阈值的 n-gram
+    """
+    codes, total_chars = _encode_sentences(texts, char_stats)
+    size = len(codes)
+    levels = []
+    min_freq = max(int(min_freq), 1)
+
+    is_sep = codes == _SEPARATOR
+    # 上一级的编号：第 1 级即字符本身，分隔符处为 -1
+    prefix_ids = np.where(is_sep, -1, codes)
+    for n in range(2, max_n + 1):
+        span = size - n + 1
+        if span <= 0:
+            break
+        # 以 pos 开头的 n-gram：前缀达到阈值且最后一个字仍在同一句内
+        positions = np.flatnonzero((prefix_ids[:span] >= 0) & ~is_sep[n - 1:])
+        if not len(positions):
+            break
+        keys = prefix_ids[positions].astype(np.int64) * _BASE + codes[positions + n - 1]
+        _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+        del keys
+        keep = counts >= min_freq
+        if not keep.any():
+            break
+        survivor_ids = np.where(keep, np.cumsum(keep) - 1, -1).astype(np.int32)
+        # 达到阈值的 n-gram（编号即在 keep 中的序号）：从首次出现的位置取出文本
+        words = [''.join(map(chr, codes[pos:pos + n].tolist())) for pos in positions[first[keep]].tolist()]
+        level_freqs = counts[keep]
+        prefix_ids = np.full(span, -1, dtype=np.int32)
+        prefix_ids[positions] = survivor_ids[inverse.ravel()]
+        del inverse, positions, first
+
+        # 邻字：只看达到阈值的 n-gram 的出现位置
+        occurrences = np.flatnonzero(prefix_ids >= 0)
+        occurrence_ids = prefix_ids[occurrences].astype(np.int64)
+        left = np.full(len(occurrences), _BOS, dtype=np.int64)
+        has_left = occurrences > 0
+        left[has_left] = codes[occurrences[has_left] - 1]
+        left[left == _SEPARATOR] = _BOS
+        right = np.full(len(occurrences), _EOS, dtype=np.int64)
+        has_right = occurrences + n < size
+        right[has_right] = codes[occurrences[has_right] + n]
+        right[right == _SEPARATOR] = _EOS
+        sides = []
+        for neighbors in (left, right):
+            uniq, pair_first, pair_counts = np.unique(occurrence_ids * _BASE + neighbors,
+                                                      return_index=True, return_counts=True)
+            sides.append(_split_pairs(uniq, pair_first, pair_counts))
+        levels.append((words, level_freqs, *sides))
+
+    return _build_stats(levels, total_chars)
+
+
+# ============================================
+# 候选词打分：邻接熵与切分 PMI
+# ============================================
+
+# 与阈值的差在此范围内的词改用逐词公式复核
+_THRESHOLD_TOLERANCE = 1e-9
+# Unicode 码点的位数
+_CODE_BITS = 21
+
+
+def _entropies(offsets, counts):
+    """各词邻字分布的信息熵，逐项求和的顺序与 calculate_entropy 相同"""
+    n_words = len(offsets) - 1
+    owners = np.repeat(np.arange(n_words), np.diff(offsets))
+    cumulative = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=cumulative[1:])
+    totals = cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+    p = counts / totals[owners]
+    # bincount 按下标顺序逐项累加
+    return -np.bincount(owners, weights=p * np.log2(p), minlength=n_words)
+
+
+def _exact_product(a, b):
+    """整数相乘后转为浮点数；可能溢出 int64 时按 Python 整数计算（与逐词计算的舍入一致）"""
+    if len(a) and int(a.max()) * int(np.max(b)) >= 2 ** 63:
+        return (a.astype(object) * np.asarray(b).astype(object)).astype(np.float64)
+    return (a * b).astype(np.float64)
+
+
+def _row_keys(chars):
+    """
+    每行码点的排序 / 查找键：不超过 3 个字时按 21 位一字拼成 int64，
+    更长的把整行视为一个定长字节串（比较较慢）
+    """
+    chars = np.ascontiguousarray(chars, dtype=np.int32)
+    width = chars.shape[1]
+    if width * _CODE_BITS < 64:
+        keys = np.zeros(len(chars), dtype=np.int64)
+        for j in range(width):
+            keys = (keys << _CODE_BITS) | chars[:, j]
+        return keys
+    return chars.view(np.dtype((np.void, chars.itemsize * width))).ravel()
+
+
+def _min_split_pmi(stats):
+    """
+    各词所有切分方式（两部分都是达标 n-gram）中的最小 PMI，没有可用切分的为 0
+
+    按词长分组，把词展开为码点矩阵；切分出的两部分在同长度 n-gram 的有序键表中二分查找频次。
+    """
+    words = stats.words
+    lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    groups = {}
+    for length in np.unique(lengths).tolist():
+        index = np.flatnonzero(lengths == length)
+        text = ''.join([words[i] for i in index.tolist()])
+        chars = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.int32).reshape(-1, length)
+        groups[length] = (index, chars)
+
+    tables = {}
+
+    def lookup(chars):
+        length = chars.shape[1]
+        if length not in tables:
+            index, group_chars = groups[length]
+            keys = _row_keys(group_chars)
+            order = np.argsort(keys)
+            tables[length] = (keys[order], stats.freqs[index[order]])
+        keys, freqs = tables[length]
+        query = _row_keys(chars)
+        pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        return np.where(keys[pos] == query, freqs[pos], 0)
+
+    min_pmi = np.full(len(words), np.inf)
+    for length, (index, chars) in groups.items():
+        # 某一部分的长度没有达标 n-gram 时，这种切分的频次必为 0
+        splits = [i for i in range(1, length) if i in groups and length - i in groups]
+        if not splits:
+            continue
+        numerator = _exact_product(stats.freqs[index], stats.total_chars)
+        group_min = np.full(len(index), np.inf)
+        for i in splits:
+            left_freq = lookup(chars[:, :i])
+            right_freq = lookup(chars[:, i:])
+            valid = (left_freq > 0) & (right_freq > 0)
+            pmi = np.log2(numerator[valid] / (_exact_product(left_freq[valid], right_freq[valid]) + 1e-10))
+            group_min[valid] = np.minimum(group_min[valid], pmi)
+        min_pmi[index] = group_min
+    min_pmi[np.isinf(min_pmi)] = 0
+    return min_pmi
+
+
+def _exact_scores(stats, i, freq_of):
+    """逐词计算第 i 个词的 (最小邻接熵, 最小切分 PMI)"""
+    word = stats.words[i]
+    freq = int(stats.freqs[i])
+    entropies = []
+    for offsets, counts in ((stats.left_offsets, stats.left_counts), (stats.right_offsets, stats.right_counts)):
+        entropies.append(calculate_entropy(dict(enumerate(counts[offsets[i]:offsets[i + 1]].tolist()))))
+    min_pmi = float('inf')
+    for k in range(1, len(word)):
+        left_freq = freq_of.get(word[:k], 0)
+        right_freq = freq_of.get(word[k:], 0)
+        if left_freq > 0 and right_freq > 0:
+            pmi = math.log2((freq * stats.total_chars) / (left_freq * right_freq + 1e-10))
+            min_pmi = min(min_pmi, pmi)
+    if min_pmi == float('inf'):
+        min_pmi = 0
+    return min(entropies), min_pmi
+
+
+def _near(values, threshold):
+    return np.abs(values - threshold) <= _THRESHOLD_TOLERANCE * max(1.0, abs(threshold))
+
+
+def select_new_words(stats, entropy_threshold, pmi_threshold):
+    """
+    按左右邻接熵的较小值和最小切分 PMI 筛选新词
+
+    全部候选一次性向量化计算。np.log2 与 math.log2 偶有 1 ulp 的差异，
+    落在阈值附近的词改用逐词公式复核，因此结果与逐词计算完全一致。
+
+    Returns:
+        入选的词，按 stats.words 中的顺序
+    """
+    if not len(stats):
+        return []
+    min_ent = np.minimum(_entropies(stats.left_offsets, stats.left_counts),
+                         _entropies(stats.right_offsets, stats.right_counts))
+    min_pmi = _min_split_pmi(stats)
+    passed = (min_ent >= entropy_threshold) & (min_pmi >= pmi_threshold)
+
+    borderline = np.flatnonzero(_near(min_ent, entropy_threshold) | _near(min_pmi, pmi_threshold))
+    if len(borderline):
+        freq_of = stats.freq_map()
+        for i in borderline.tolist():
+            ent, pmi = _exact_scores(stats, i, freq_of)
+            passed[i] = ent >= entropy_threshold and pmi >= pmi_threshold
+    return [stats.words[i] for i in np.flatnonzero(passed).tolist()]
+
+
+# ============================================
+# 近似模式：有界内存的重频 n-gram 统计
+# ============================================
+
+# 滚动哈希的乘数（64 位奇数）
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# 摘要合并时每个条目（键、计数及临时数组）约占用的字节数
+_SUMMARY_ENTRY_BYTES = 48
+# 第二遍累积的邻字组合超过该条数时合并一次
+_PAIR_COMPACT_SIZE = 4 * 1024 * 1024
+
+
+def _batch_ngram_keys(codes, max_n):
+    """
+    一批码点中各长度 n-gram 的 64 位哈希键
+
+    Returns:
+        {n: (起始位置数组, 键数组)}，只含不跨句子的 n-gram
+    """
+    size = len(codes)
+    sep_cum = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(codes == _SEPARATOR, out=sep_cum[1:])
+    values = codes.astype(np.uint64) + np.uint64(1)
+    result = {}
+    hashes = values.copy()
+    for n in range(2, max_n + 1):
+        span = size - n + 1
+        if span <= 0:
+            break
+        hashes = hashes[:span] * _HASH_MULTIPLIER + values[n - 1:]
+        positions = np.flatnonzero(sep_cum[n:] == sep_cum[:span])
+        result[n] = (positions, hashes[positions])
+    return result
+
+
+def _sum_by_key(keys, counts):
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    return uniq, np.bincount(inverse.ravel(), weights=counts, minlength=len(uniq)).astype(np.int64)
+
+
+class _HeavyHitters:
+    """
+    Misra-Gries 重频摘要（可合并版本）
+
+    每批先精确计数再并入摘要；条目数超过 capacity 时，所有计数减去第 capacity+1 大的计数并丢弃非正的。
+    估计值最多少计 error_bound 次：不在摘要中的键真实频次不超过 error_bound。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(int(capacity), 1)
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.error_bound = 0
+
+    def update(self, keys):
+        uniq, counts = np.unique(keys, return_counts=True)
+        keys, counts = _sum_by_key(np.concatenate([self.keys, uniq]), np.concatenate([self.counts, counts]))
+        if len(keys) > self.capacity:
+            cut = np.partition(counts, len(counts) - self.capacity - 1)[len(counts) - self.capacity - 1]
+            counts = counts - cut
+            keep = counts > 0
+            keys, counts = keys[keep], counts[keep]
+            self.error_bound += int(cut)
+        self.keys, self.counts = keys, counts
+
+    def candidates(self, min_freq):
+        """真实频次可能达到 min_freq 的键（已排序）"""
+        return self.keys[self.counts + self.error_bound >= min_freq]
+
+
+def _estimate_missing(freqs, min_freq, error_bound, outside_mass):
+    """
+    估计被遗漏的达标 n-gram 个数，返回 (估计值, 上界)
+
+    频次高于 error_bound 的 n-gram 一定在候选中；频次在 [min_freq, error_bound] 之间的可能遗漏。
+    上界：候选以外的出现总次数 outside_mass 中，每个遗漏的 n-gram 至少占 min_freq 次。
+    估计值：按频次高于 error_bound 的部分拟合幂律 C(f) ∝ f^-α（C(f) 为频次 ≥ f 的 n-gram 数），
+    外推频次 ≥ min_freq 的期望个数；无法拟合时取上界。
+    """
+    if error_bound < min_freq:
+        return 0, 0
+    freqs = np.sort(np.asarray(freqs))
+    upper = outside_mass // min_freq
+    f1 = error_bound + 1
+    points = [(f, len(freqs) - np.searchsorted(freqs, f)) for f in f1 * np.sqrt(2) ** np.arange(5)]
+    points = [(f, c) for f, c in points if c > 0]
+    if len(points) >= 2:
+        slope = np.polyfit(np.log([f for f, _ in points]), np.log([c for _, c in points]), 1)[0]
+        if slope < 0:
+            expected = points[0][1] * (f1 / min_freq) ** -slope
+            return min(max(expected - len(freqs), 0), upper), upper
+    return upper, upper
+
+
+def count_ngrams_approx(texts, min_freq, max_n=5, memory_mb=1024, char_stats=None):
+    """
+    近似模式的 count_ngrams：两遍流式扫描，内存不随文本总量增长
+
+    1. 每种长度维护一个 Misra-Gries 重频摘要（容量由 memory_mb 决定），筛出候选 n-gram
+    2. 再扫描一遍，只为候选精确统计频次和左右邻字，频次达不到阈值的丢弃
+
+    n-gram 以 64 位哈希区分；频次高于摘要误差上界的 n-gram 保证召回，结果中不会有频次不足的。
+    传入 char_stats（utils.SingleCharStats）时在第一遍扫描中统计单字独立性。
+
+    Returns:
+        (NgramStats, report)：report 含各长度的误差上界 error_bounds、候选数 candidates，
+        以及相对精确模式的估计召回率 expected_recall 和召回率下界 recall_lower_bound
+    """
+    min_freq = max(int(min_freq), 1)
+    levels = list(range(2, max_n + 1))
+    capacity = memory_mb * 1024 * 1024 // (_SUMMARY_ENTRY_BYTES * max(len(levels), 1))
+
+    # 第一遍：重频摘要
+    summaries = {n: _HeavyHitters(capacity) for n in levels}
+    occurrences = dict.fromkeys(levels, 0)
+    total_chars = 0
+    for codes, _, batch_chars in _iter_code_batches(texts, char_stats):
+        total_chars += batch_chars
+        for n, (_, keys) in _batch_ngram_keys(codes, max_n).items():
+            summaries[n].update(keys)
+            occurrences[n] += len(keys)
+    candidates = {n: summaries[n].candidates(min_freq) for n in levels}
+
+    # 第二遍：候选的精确频次与邻字
+    counted = _count_candidates(texts, candidates, max_n)
+
+    results = []
+    found = 0
+    expected_missing = 0
+    max_missing = 0
+    for n in levels:
+        level_freqs, level_words, *level_pairs = counted[n]
+        survivor = level_freqs >= min_freq
+        survivor_ids = np.cumsum(survivor) - 1
+        sides = []
+        for side_pairs in level_pairs:
+            word_ids, first, counts, neighbors = _split_pairs(*side_pairs)
+            keep = survivor[word_ids]
+            sides.append((survivor_ids[word_ids[keep]], first[keep], counts[keep], neighbors[keep]))
+        results.append(([level_words[i] for i in np.flatnonzero(survivor).tolist()], level_freqs[survivor], *sides))
+        found += int(np.count_nonzero(survivor))
+        expected, upper = _estimate_missing(level_freqs[survivor], min_freq, summaries[n].error_bound,
+                                            occurrences[n] - int(level_freqs.sum()))
+        expected_missing += expected
+        max_missing += upper
+
+    report = {
+        'error_bounds': {n: summaries[n].error_bound for n in levels},
+        'candidates': sum(len(candidates[n]) for n in levels),
+        'expected_recall': found / (found + expected_missing) if found else 1.0,
+        'recall_lower_bound': found / (found + max_missing) if found else 1.0,
+    }
+    return _build_stats(results, total_chars), report
+
+
+def _count_candidates(texts, candidates, max_n=5):
+    """
+    扫描 texts，精确统计候选 n-gram 的频次、文本（首次出现处）和左右邻字
+
+    Args:
+        candidates: {n: 已排序的 64 位哈希键数组}（与 _batch_ngram_keys 的键相同）
+
+    Returns:
+        {n: (freqs, words, left_pairs, right_pairs)}：与候选一一对应，未出现的候选 words 为 None；
+        邻字组合为 (词编号 * _BASE + 邻字, 首次出现位置, 次数)
+    """
+    levels = sorted(candidates)
+    freqs = {n: np.zeros(len(candidates[n]), dtype=np.int64) for n in levels}
+    words = {n: [None] * len(candidates[n]) for n in levels}
+    pairs = {(n, side): [] for n in levels for side in ('left', 'right')}
+    for codes, offset, _ in _iter_code_batches(texts):
+        size = len(codes)
+        for n, (positions, keys) in _batch_ngram_keys(codes, max_n).items():
+            cand = candidates.get(n)
+            if cand is None or not len(cand):
+                continue
+            index = np.minimum(np.searchsorted(cand, keys), len(cand) - 1)
+            hit = cand[index] == keys
+            positions, index = positions[hit], index[hit]
+            freqs[n] += np.bincount(index, minlength=len(cand))
+            # 首次出现时取出文本
+            level_words = words[n]
+            seen_index, seen_first = np.unique(index, return_index=True)
+            for i, pos in zip(seen_index.tolist(), positions[seen_first].tolist()):
+                if level_words[i] is None:
+                    level_words[i] = ''.join(map(chr, codes[pos:pos + n].tolist()))
+
+            left = np.full(len(positions), _BOS, dtype=np.int64)
+            has_left = positions > 0
+            left[has_left] = codes[positions[has_left] - 1]
+            left[left == _SEPARATOR] = _BOS
+            right = np.full(len(positions), _EOS, dtype=np.int64)
+            has_right = positions + n < size
+            right[has_right] = codes[positions[has_right] + n]
+            right[right == _SEPARATOR] = _EOS
+            for side, neighbors in (('left', left), ('right', right)):
+                pair_keys = index.astype(np.int64) * _BASE + neighbors
+                uniq, first, counts = np.unique(pair_keys, return_index=True, return_counts=True)
+                accumulated = pairs[(n, side)]
+                accumulated.append((uniq, first + offset, counts))
+                if sum(len(part[0]) for part in accumulated) > _PAIR_COMPACT_SIZE:
+                    pairs[(n, side)] = [_compact_pairs(accumulated)]
+
+    empty = (np.zeros(0, dtype=np.int64),) * 3
+    return {
+        n: (freqs[n], words[n], *(_compact_pairs(pairs[(n, side)]) if pairs[(n, side)] else empty
+                                  for side in ('left', 'right')))
+        for n in levels
+    }
+
+
+def _compact_pairs(parts):
+    """合并各批的 (邻字组合键, 首次出现位置, 次数)"""
+    keys = np.concatenate([part[0] for part in parts])
+    first = np.concatenate([part[1] for part in parts])
+    counts = np.concatenate([part[2] for part in parts])
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    merged_first = np.full(len(uniq), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(merged_first, inverse, first)
+    merged_counts = np.bincount(inverse, weights=counts, minlength=len(uniq)).astype(np.int64)
+    return uniq, merged_first, merged_counts
+
+
+# ============================================
+# 增量模式：加入新文本时只扫描新文本
+# ============================================
+
+# 索引保存的 n-gram 的频次下限相对频次阈值的比例
+_WATCH_RATIO = 0.25
+# 需要重新统计的旧文本超过旧文本总数的该比例时，改为整体重建
+_REBUILD_RATIO = 0.5
+
+
+def _word_keys(words):
+    """各词的 64 位哈希键，与 _batch_ngram_keys 的键相同"""
+    keys = np.zeros(len(words), dtype=np.uint64)
+    lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    for n in np.unique(lengths).tolist():
+        index = np.flatnonzero(lengths == n)
+        joined = ''.join([words[i] for i in index.tolist()]).encode('utf-32-le', 'surrogatepass')
+        values = np.frombuffer(joined, dtype=np.uint32).reshape(-1, n).astype(np.uint64) + np.uint64(1)
+        hashes = values[:, 0].copy()
+        for j in range(1, n):
+            hashes = hashes * _HASH_MULTIPLIER + values[:, j]
+        keys[index] = hashes
+    return keys
+
+
+class NgramIndex:
+    """
+    可增量更新的 n-gram 统计
+
+    对已统计的前 covered 条文本，保存频次不低于 watch_freq（频次阈值的 _WATCH_RATIO）的 n-gram 的
+    精确频次和左右邻字，以及上界 bound：其余 n-gram 在这些文本中的频次都小于 bound。单字独立性一并保存。
+
+    update 加入新文本时只扫描新文本：
+    1. 统计新文本中所有 n-gram 的频次（哈希计数）
+    2. 已保存的 n-gram 直接累加频次和邻字；未保存的总频次不超过 bound - 1 + 新频次，
+       只有可能达到阈值的才需要精确的旧频次，为此只重新统计包含它们的旧文本（通常很少）
+    3. 其余未保存的 n-gram 不再追踪，bound 增加它们在新文本中的最大频次
+
+    达到阈值的 n-gram、频次、邻字分布（包括首次出现的顺序）与对全部文本 count_ngrams 完全一致。
+    bound 随更新增大，需要重新统计的旧文本随之增多，超过一半或阈值低于 bound 时整体重建。
+    n-gram 以 64 位哈希区分（同近似模式）。
+    """
+
+    def __init__(self, stats, bound, covered, char_stats, watch_freq, max_n=5):
+        self.stats = stats
+        self.keys = _word_keys(stats.words)
+        self.bound = bound
+        self.covered = covered
+        self.char_stats = char_stats
+        self.watch_freq = watch_freq
+        self.max_n = max_n
+
+    @classmethod
+    def build(cls, texts, min_freq, max_n=5):
+        """对 texts 整体统计，min_freq 为频次阈值"""
+        watch_freq = max(int(int(min_freq) * _WATCH_RATIO), 1)
+        char_stats = SingleCharStats()
+        stats = count_ngrams(texts, watch_freq, max_n, char_stats=char_stats)
+        return cls(stats, watch_freq, len(texts), char_stats, watch_freq, max_n)
+
+    def select(self, min_freq):
+        """频次不低于 min_freq 的 n-gram（min_freq 不低于 bound）"""
+        return self.stats.subset(self.stats.freqs >= min_freq)
+
+    def update(self, texts, min_freq):
+        """
+        加入新文本
+
+        Args:
+            texts: 全部文本；前 covered 条须与已统计的文本相同，其后为新文本
+            min_freq: 频次阈值（NEW_WORD_MIN_FREQ）
+
+        Returns:
+            (更新后的 NgramIndex, 频次不低于 min_freq 的 NgramStats, report)：report 含
+            重新统计旧频次的 n-gram 数 resolved、重新扫描的旧文本条数 rescanned、是否整体重建 rebuilt
+        """
+        min_freq = max(int(min_freq), 1)
+        if not self.covered or self.covered > len(texts) or min_freq < self.bound:
+            return self._rebuild(texts, min_freq)
+        old_texts, new_texts = texts[:self.covered], texts[self.covered:]
+        if not new_texts:
+            return self, self.select(min_freq), {'resolved': 0, 'rescanned': 0, 'rebuilt': False}
+        levels = range(2, self.max_n + 1)
+        char_stats = self.char_stats.copy()
+
+        # 新文本中各 n-gram 的频次
+        parts = {n: [] for n in levels}
+        new_chars = 0
+        for codes, _, batch_chars in _iter_code_batches(new_texts, char_stats):
+            new_chars += batch_chars
+            for n, (_, keys) in _batch_ngram_keys(codes, self.max_n).items():
+                parts[n].append(np.unique(keys, return_counts=True))
+
+        # 候选：已保存的 n-gram，以及总频次可能达到阈值、需要精确旧频次的未保存 n-gram
+        lengths = np.fromiter(map(len, self.stats.words), dtype=np.int64, count=len(self.stats))
+        candidates = {}
+        resolve = {}
+        growth = 0
+        for n in levels:
+            if parts[n]:
+                keys, counts = _sum_by_key(np.concatenate([part[0] for part in parts[n]]),
+                                           np.concatenate([part[1] for part in parts[n]]))
+            else:
+                keys, counts = np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+            watched = np.unique(self.keys[lengths == n])
+            unwatched = ~np.isin(keys, watched, assume_unique=True)
+            need = unwatched & (counts > min_freq - self.bound)
+            rest = unwatched & ~need
+            if rest.any():
+                growth = max(growth, int(counts[rest].max()))
+            resolve[n] = keys[need]
+            candidates[n] = np.union1d(watched, resolve[n])
+        del parts
+        counted_new = _count_candidates(new_texts, candidates, self.max_n)
+
+        # 需要精确旧频次的 n-gram：只重新统计包含它们的旧文本
+        resolve_at = {n: np.searchsorted(candidates[n], resolve[n]) for n in levels}
+        resolve_words = {n: [counted_new[n][1][i] for i in resolve_at[n].tolist()] for n in levels}
+        rows = find_texts_containing(old_texts, [word for n in levels for word in resolve_words[n]])
+        if len(rows) > _REBUILD_RATIO * len(old_texts):
+            return self._rebuild(texts, min_freq)
+        counted_old = _count_candidates([old_texts[i] for i in rows], resolve, self.max_n)
+
+        # 合并：已保存的词编号不变，重新统计的词接在后面；旧文本中的邻字先于新文本中的
+        words = list(self.stats.words)
+        freqs = [self.stats.freqs.copy()]
+        old_pairs = {'left': [], 'right': []}
+        new_pairs = {'left': [], 'right': []}
+        for side in old_pairs:
+            word_ids, first, counts, neighbors = self.stats.neighbor_pairs(side)
+            old_pairs[side].append((word_ids * _BASE + neighbors, first, counts))
+        for n in levels:
+            level_freqs, _, *level_pairs = counted_new[n]
+            resolved_freqs, _, *resolved_pairs = counted_old[n]
+            watched_ids = np.flatnonzero(lengths == n)
+            watched_at = np.searchsorted(candidates[n], self.keys[watched_ids])
+            merged_ids = np.zeros(len(candidates[n]), dtype=np.int64)
+            merged_ids[watched_at] = watched_ids
+            resolved_ids = np.arange(len(words), len(words) + len(resolve[n]), dtype=np.int64)
+            merged_ids[resolve_at[n]] = resolved_ids
+            words.extend(resolve_words[n])
+            freqs[0][watched_ids] += level_freqs[watched_at]
+            freqs.append(resolved_freqs + level_freqs[resolve_at[n]])
+            for side, (keys, first, counts) in zip(('left', 'right'), resolved_pairs):
+                old_pairs[side].append((resolved_ids[keys // _BASE] * _BASE + keys % _BASE, first, counts))
+            for side, (keys, first, counts) in zip(('left', 'right'), level_pairs):
+                new_pairs[side].append((merged_ids[keys // _BASE] * _BASE + keys % _BASE, first, counts))
+        freqs = np.concatenate(freqs)
+
+        sides = []
+        for side in ('left', 'right'):
+            old_first = np.concatenate([part[1] for part in old_pairs[side]])
+            shift = int(old_first.max()) + 1 if len(old_first) else 0
+            merged = _compact_pairs(old_pairs[side] + [(keys, first + shift, counts)
+                                                       for keys, first, counts in new_pairs[side]])
+            sides.append(_group_neighbors(*_split_pairs(*merged), len(words)))
+        stats = NgramStats(words, freqs, *sides, self.stats.total_chars + new_chars)
+
+        # 与 count_ngrams 相同的词序：按长度，同长度按码点序
+        keep = np.flatnonzero(freqs >= self.watch_freq).tolist()
+        keep.sort(key=lambda i: (len(words[i]), words[i]))
+        index = NgramIndex(stats.subset(np.array(keep, dtype=np.int64)), self.bound + growth, len(texts),
+                           char_stats, self.watch_freq, self.max_n)
+        report = {'resolved': sum(len(resolve[n]) for n in levels), 'rescanned': len(rows), 'rebuilt': False}
+        return index, index.select(min_freq), report
+
+    def _rebuild(self, texts, min_freq):
+        index = NgramIndex.build(texts, min_freq, self.max_n)
+        return index, index.select(min_freq), {'resolved': 0, 'rescanned': len(texts), 'rebuilt': True}
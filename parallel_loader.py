@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+并行分块解析
+
+mmap 导出文件，在 messages 数组的顶层元素之间寻找切分点，把各段字节范围交给进程池解析。
+每个进程对自己的范围（包装成一个 JSON 数组）运行与 load_json 相同的表驱动解析器，
+因此产出的精简消息与串行加载完全一致，按段顺序拼接即可保持消息顺序。
+
+切分点的正确性不靠猜测：第 0 段从 messages 数组的真实起点开始，
+每一段都必须恰好被解析为若干个完整的 JSON 值，任何一段解析失败都说明切分点落在了元素内部，
+此时整体回退到串行加载。
+
+NDJSON 导出直接在换行处切分。压缩文件无法随机访问，总是串行解析。
+"""
+
+import io
+import os
+import re
+import json
+import mmap
+import codecs
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis_config import resolve_config
+from logger import get_logger
+from utils import (
+    get_ijson_backend,
+    detect_compression,
+    detect_export_format,
+    _ExportStreamParser,
+    _parse_events,
+    _IJSON_BUF_SIZE,
+)
+
+logger = get_logger(__name__)
+
+_WHITESPACE = b' \t\r\n'
+_UTF8_BOM = codecs.BOM_UTF8
+# 头部 / 尾部窗口：找不到 messages 数组的边界时逐步扩大
+_HEAD_WINDOWS = (64 * 1024, 1024 * 1024, 16 * 1024 * 1024)
+_TAIL_WINDOWS = (64 * 1024, 1024 * 1024, 16 * 1024 * 1024)
+# 文件小于该值时并行的进程开销不划算
+_MIN_PARALLEL_BYTES = 32 * 1024 * 1024
+# 每段至少这么大
+_MIN_CHUNK_BYTES = 8 * 1024 * 1024
+# 校验候选切分点时最多解码的字节数（应大于单条消息）
+_PROBE_BYTES = 1024 * 1024
+# 每个切分目标最多尝试的候选数，超过则放弃该切分点
+_MAX_PROBES = 64
+
+
+class SplitError(ValueError):
+    """无法安全切分 messages 数组"""
+
+
+def resolve_workers(workers=None):
+    """
+    解析进程数：None 时读取配置 PARSE_WORKERS（默认 1，即串行），0 表示使用全部 CPU 核心
+    """
+    if workers is None:
+        workers = resolve_config().PARSE_WORKERS
+    if not workers:
+        workers = os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def _skip_ws(s, idx):
+    while idx < len(s) and s[idx] in ' \t\r\n':
+        idx += 1
+    return idx
+
+
+def _find_messages_array(mm, start):
+    """
+    从文件头解析顶层对象的成员，直到 "messages" 键，返回其 '[' 的字节偏移
+
+    只解码头部窗口；messages 之前的成员必须完整落在窗口内，否则扩大窗口重试。
+    """
+    decoder = json.JSONDecoder()
+    for window in _HEAD_WINDOWS:
+        # 增量解码器会保留窗口末尾被截断的多字节字符
+        head = codecs.getincrementaldecoder('utf-8')().decode(mm[start:start + window], final=False)
+        try:
+            idx = _skip_ws(head, 0)
+            if head[idx:idx + 1] != '{':
+                raise SplitError("顶层不是 JSON 对象")
+            idx += 1
+            while True:
+                idx = _skip_ws(head, idx)
+                key, idx = decoder.raw_decode(head, idx)
+                idx = _skip_ws(head, idx)
+                if head[idx:idx + 1] != ':':
+                    raise SplitError("顶层对象格式错误")
+                idx = _skip_ws(head, idx + 1)
+                if key == 'messages':
+                    if head[idx:idx + 1] != '[':
+                        raise SplitError("messages 不是数组")
+                    return start + len(head[:idx].encode('utf-8'))
+                _, idx = decoder.raw_decode(head, idx)
+                idx = _skip_ws(head, idx)
+                if head[idx:idx + 1] != ',':
+                    raise SplitError("顶层对象中没有 messages")
+                idx += 1
+        except (json.JSONDecodeError, IndexError):
+            if start + window >= len(mm):
+                break
+            continue
+    raise SplitError("在文件头部找不到 messages 数组")
+
+
+def _find_array_end(mm, first_item):
+    """
+    在文件尾部窗口中寻找 messages 数组的结束 ']'
+
+    候选位置之后的内容必须能作为顶层对象的剩余部分解析；最左侧满足条件的候选即为数组结尾
+    （更靠左的 ']' 属于最后一条消息内部，其后还有未闭合的结构）。
+    """
+    size = len(mm)
+    for window in _TAIL_WINDOWS:
+        lo = max(first_item, size - window)
+        pos = mm.find(b']', lo)
+        while pos != -1:
+            try:
+                json.loads(b'{"m":[]' + mm[pos + 1:])
+                return pos
+            except ValueError:
+                pos = mm.find(b']', pos + 1)
+        if lo == first_item:
+            break
+    raise SplitError("在文件尾部找不到 messages 数组的结尾")
+
+
+def _looks_like_message(mm, pos):
+    """候选位置能解码出一条带 timestamp / sender 的消息对象，且其后紧跟 ',' 或 ']'"""
+    text = codecs.getincrementaldecoder('utf-8')().decode(mm[pos:pos + _PROBE_BYTES], final=False)
+    try:
+        obj, end = json.JSONDecoder().raw_decode(text)
+    except ValueError:
+        return False
+    if not isinstance(obj, dict) or 'timestamp' not in obj or 'sender' not in obj:
+        return False
+    return text[end:].lstrip()[:1] in (',', ']')
+
+
+def plan_chunks(mm, n_chunks):
+    """
+    计算切分方案
+
+    Returns:
+        (ranges, chat_info)：ranges 为各段 [start, stop) 字节范围，均以消息对象的 '{' 开头；
+        chat_info 来自去掉 messages 后的"骨架"对象
+    """
+    start = len(_UTF8_BOM) if mm[:len(_UTF8_BOM)] == _UTF8_BOM else 0
+    array_open = _find_messages_array(mm, start)
+
+    first_item = array_open + 1
+    while first_item < len(mm) and mm[first_item] in _WHITESPACE:
+        first_item += 1
+    if mm[first_item:first_item + 1] != b'{':
+        raise SplitError("messages 为空或首个元素不是对象")
+    array_end = _find_array_end(mm, first_item)
+
+    # 骨架：messages 置空后解析整个顶层对象，取出 chatInfo
+    skeleton = json.loads(mm[start:array_open + 1] + mm[array_end:])
+    chat_info = {}
+    name = (skeleton.get('chatInfo') or {}).get('name')
+    if isinstance(name, str):
+        chat_info['name'] = name
+
+    # 缩进格式下元素之间的分隔符与 '[' 和首个元素之间的空白一致，能直接排除嵌套对象；
+    # 紧凑格式只能按 ',{' 搜索，再逐个试解码排除嵌套对象中的候选
+    indent = mm[array_open + 1:first_item]
+    if b'\n' in indent:
+        separator = re.compile(re.escape(b',' + indent + b'{'))
+    else:
+        separator = re.compile(rb',\s*\{')
+    span = array_end - first_item
+    starts = [first_item]
+    for i in range(1, n_chunks):
+        pos = max(first_item + span * i // n_chunks, starts[-1] + 1)
+        for _ in range(_MAX_PROBES):
+            match = separator.search(mm, pos, array_end)
+            if match is None:
+                break
+            candidate = match.end() - 1
+            if _looks_like_message(mm, candidate):
+                starts.append(candidate)
+                break
+            pos = match.end()
+    stops = starts[1:] + [array_end]
+    return list(zip(starts, stops)), chat_info
+
+
+def plan_ndjson_chunks(mm, n_chunks):
+    """NDJSON 按行切分：每段从某一行的行首开始"""
+    size = len(mm)
+    start = len(_UTF8_BOM) if mm[:len(_UTF8_BOM)] == _UTF8_BOM else 0
+    starts = [start]
+    for i in range(1, n_chunks):
+        pos = mm.find(b'\n', max(start + (size - start) * i // n_chunks, starts[-1]))
+        if pos == -1 or pos + 1 >= size:
+            break
+        if pos + 1 > starts[-1]:
+            starts.append(pos + 1)
+    stops = starts[1:] + [size]
+    return list(zip(starts, stops))
+
+
+def _parse_range(args):
+    """
+    子进程：把 [start, stop) 包装成 JSON 数组并用表驱动解析器解析
+
+    返回 (消息列表或 MessageTable, 过滤器丢弃计数)
+    """
+    filepath, start, stop, backend, as_table, message_filter, export_format = args
+    with open(filepath, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            body = mm[start:stop].rstrip(_WHITESPACE)
+        finally:
+            mm.close()
+
+    if export_format == 'ndjson':
+        parser = _ExportStreamParser(items_prefix='')
+        events = _parse_events(get_ijson_backend(backend), io.BytesIO(body), export_format)
+    else:
+        # 非最后一段以 ',' + 空白结尾
+        if body.endswith(b','):
+            body = body[:-1]
+        parser = _ExportStreamParser(items_prefix='item')
+        events = get_ijson_backend(backend).parse(io.BytesIO(b'[' + body + b']'), buf_size=_IJSON_BUF_SIZE)
+    messages = parser.iter_messages(events)
+    dropped = {}
+    if message_filter is not None:
+        messages = message_filter.filter(messages)
+        dropped = message_filter.dropped
+    if as_table:
+        from message_table import MessageTable
+        part = MessageTable.from_messages(messages)
+    else:
+        part = list(messages)
+    return part, dict(dropped), parser.chat_info
+
+
+def load_parallel(filepath, workers, backend=None, as_table=False, message_filter=None):
+    """
+    并行解析导出文件
+
+    Args:
+        filepath: 导出文件路径
+        workers: 进程数
+        backend: ijson 后端名称
+        as_table: 为 True 时各进程直接构建 MessageTable 并合并（进程间只传输紧凑的列数据）
+        message_filter: 可选的 MessageFilter，各进程在解析时过滤，丢弃计数汇总回该对象
+
+    Returns:
+        (messages, chat_info)；messages 为消息列表或 MessageTable。
+        文件过小、无法安全切分或任一段解析失败时返回 None，由调用方回退到串行加载
+    """
+    size = os.path.getsize(filepath)
+    if workers <= 1 or size < _MIN_PARALLEL_BYTES:
+        return None
+    try:
+        get_ijson_backend(backend)
+    except ImportError:
+        return None
+    if detect_compression(filepath):
+        return None
+
+    n_chunks = max(1, min(workers, size // _MIN_CHUNK_BYTES))
+    try:
+        export_format = detect_export_format(filepath)
+        with open(filepath, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if export_format == 'ndjson':
+                    # 群信息行可能在任意位置，由各段解析时收集
+                    ranges, chat_info = plan_ndjson_chunks(mm, n_chunks), {}
+                else:
+                    ranges, chat_info = plan_chunks(mm, n_chunks)
+            finally:
+                mm.close()
+    except (SplitError, ValueError, OSError) as e:
+        logger.warning(f"⚠️ 无法切分 messages 数组，改用串行解析: {e}")
+        return None
+    if len(ranges) < 2:
+        return None
+
+    logger.info(f"📖 并行解析: {len(ranges)} 段, {min(workers, len(ranges))} 个进程")
+    tasks = [(filepath, start, stop, backend, as_table, message_filter, export_format) for start, stop in ranges]
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+            parts = list(pool.map(_parse_range, tasks))
+    except Exception as e:
+        # 任何一段不是完整的 JSON 值序列都说明切分点不在元素边界上
+        logger.warning(f"⚠️ 分段解析失败，改用串行解析: {e}")
+        return None
+
+    for _, dropped, part_info in parts:
+        if message_filter is not None:
+            message_filter.merge_dropped(dropped)
+        if export_format == 'ndjson':
+            chat_info.update(part_info)
+    if as_table:
+        from message_table import MessageTable
+        messages = MessageTable.concat([part for part, _, _ in parts])
+    else:
+        messages = [msg for part, _, _ in parts for msg in part]
+
+    if not chat_info.get('name'):
+        chat_info['name'] = '未知群聊'
+    logger.info(f"✅ 并行读取 {len(messages)} 条消息, 群聊: {chat_info['name']}")
+    return messages, chat_info
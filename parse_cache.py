@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+解析缓存
+
+以导出文件内容的 SHA-256 为键，把解析得到的 MessageTable 保存为可 mmap 的二进制文件
+（默认位于 runtime_outputs/parse_cache）。再次分析同一份导出时直接映射各列，跳过 JSON 解析。
+
+文件格式：
+    8 字节魔数 | 8 字节头部长度（小端）| JSON 头部 | 按 64 字节对齐的各列原始数据 | 文本缓冲区
+
+为避免每次都对大文件重新计算哈希，(路径, 大小, mtime, inode) -> 哈希 的对应关系记录在 index.json 中。
+缓存总大小超过上限时，按最近使用时间（命中时刷新 mtime）淘汰最旧的条目。
+
+用法:
+    python parse_cache.py export.json     # 预先解析并写入缓存
+    python parse_cache.py --list          # 查看缓存条目
+    python parse_cache.py --clear         # 清空缓存
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import hashlib
+import argparse
+
+import numpy as np
+
+from analysis_config import resolve_config
+from logger import get_logger
+from message_table import MessageTable, COLUMNS, TABLE_FORMAT_VERSION
+from utils import atomic_write
+
+logger = get_logger(__name__)
+
+_MAGIC = b'QQMTBL\x00\x01'
+_ALIGN = 64
+_HASH_CHUNK = 4 * 1024 * 1024
+_ENTRY_SUFFIX = '.mtbl'
+_INDEX_NAME = 'index.json'
+# index.json 中最多保留的 路径 -> 哈希 记录数
+_MAX_INDEX_ENTRIES = 512
+
+_parse_cache = None
+
+
+def _align(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def file_digest(filepath):
+    """计算文件内容的 SHA-256"""
+    h = hashlib.sha256()
+    buf = bytearray(_HASH_CHUNK)
+    view = memoryview(buf)
+    with open(filepath, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def write_table(path, table, chat_info, source_digest):
+    """把 MessageTable 写为缓存文件（先写临时文件再原子替换）"""
+    sections = [(name, getattr(table, name)) for name, _ in COLUMNS]
+    sections.append(('text', table.text_buffer))
+
+    layout = []
+    offset = 0
+    for name, data in sections:
+        nbytes = memoryview(data).nbytes
+        layout.append([name, offset, nbytes])
+        offset = _align(offset + nbytes)
+
+    header = json.dumps({
+        'format': TABLE_FORMAT_VERSION,
+        'source': source_digest,
+        'length': len(table),
+        'chat_info': chat_info,
+        'uins': table.uins,
+        'names': table.names,
+        'extra_msg_ids': table.extra_msg_ids,
+        'sections': layout,
+    }, ensure_ascii=False).encode('utf-8')
+    data_start = _align(len(_MAGIC) + 8 + len(header))
+
+    with atomic_write(path) as f:
+        f.write(_MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for (name, data), (_, section_offset, nbytes) in zip(sections, layout):
+            f.seek(data_start + section_offset)
+            f.write(memoryview(data).cast('B'))
+        f.truncate(data_start + offset)
+
+
+def read_table(path):
+    """
+    映射缓存文件，返回 (MessageTable, chat_info, 头部)；格式或版本不符时返回 None
+
+    各列为指向 mmap 的只读数组，不复制数据。
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < len(_MAGIC) + 8:
+            return None
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:len(_MAGIC)] != _MAGIC:
+        mm.close()
+        return None
+    header_len = int.from_bytes(mm[len(_MAGIC):len(_MAGIC) + 8], 'little')
+    header_start = len(_MAGIC) + 8
+    header = json.loads(mm[header_start:header_start + header_len].decode('utf-8'))
+    if header.get('format') != TABLE_FORMAT_VERSION:
+        mm.close()
+        return None
+
+    data_start = _align(header_start + header_len)
+    sections = {name: (offset, nbytes) for name, offset, nbytes in header['sections']}
+    columns = {}
+    for name, dtype in COLUMNS:
+        offset, nbytes = sections[name]
+        columns[name] = np.frombuffer(mm, dtype=dtype, count=nbytes // np.dtype(dtype).itemsize,
+                                      offset=data_start + offset)
+    offset, nbytes = sections['text']
+    text_buffer = memoryview(mm)[data_start + offset:data_start + offset + nbytes]
+
+    table = MessageTable(columns, text_buffer, header['uins'], header['names'], header['extra_msg_ids'])
+    return table, header['chat_info'], header
+
+
+class ParseCache:
+    """按内容哈希寻址的解析缓存，总大小超过 max_bytes 时按 LRU 淘汰"""
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, digest):
+        return os.path.join(self.cache_dir, digest + _ENTRY_SUFFIX)
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, _INDEX_NAME)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        if len(index) > _MAX_INDEX_ENTRIES:
+            # dict 保持插入顺序，丢弃最早的记录
+            index = dict(list(index.items())[-_MAX_INDEX_ENTRIES:])
+        try:
+            with atomic_write(self._index_path(), 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+        except OSError as e:
+            logger.debug(f"写入解析缓存索引失败: {e}")
+
+    def digest(self, filepath):
+        """返回文件内容哈希；文件大小、mtime、inode 未变时直接复用上次计算的结果"""
+        st = os.stat(filepath)
+        key = os.path.realpath(filepath)
+        stamp = [st.st_size, st.st_mtime_ns, st.st_ino]
+        index = self._load_index()
+        entry = index.get(key)
+        if entry and entry.get('stamp') == stamp:
+            return entry['digest']
+
+        start = time.perf_counter()
+        digest = file_digest(filepath)
+        logger.debug(f"计算文件哈希: {os.path.basename(filepath)} ({time.perf_counter() - start:.2f}s)")
+        index.pop(key, None)
+        index[key] = {'stamp': stamp, 'digest': digest}
+        self._save_index(index)
+        return digest
+
+    def get(self, filepath):
+        """命中时返回与 load_json 形状相同的 dict（messages 为 MessageTable），否则返回 None"""
+        start = time.perf_counter()
+        try:
+            digest = self.digest(filepath)
+            path = self._entry_path(digest)
+            if not os.path.exists(path):
+                return None
+            result = read_table(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ 读取解析缓存失败，重新解析: {e}")
+            return None
+        if result is None:
+            return None
+
+        table, chat_info, _ = result
+        # 刷新 mtime，作为 LRU 的最近使用时间
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        logger.info(f"⚡ 命中解析缓存: {len(table)} 条消息 ({(time.perf_counter() - start) * 1000:.0f}ms)")
+        return {'messages': table, 'chatInfo': chat_info}
+
+    def put(self, filepath, table, chat_info):
+        """写入缓存并按需淘汰；写入失败只记录日志，不影响分析"""
+        try:
+            digest = self.digest(filepath)
+            path = self._entry_path(digest)
+            write_table(path, table, chat_info, digest)
+            size = os.path.getsize(path)
+            if size > self.max_bytes:
+                os.remove(path)
+                path = None
+                logger.info(f"解析结果 {size / 1024 / 1024:.1f} MB 超过缓存上限，未缓存")
+            else:
+                logger.debug(f"已写入解析缓存: {os.path.basename(path)} ({size / 1024 / 1024:.1f} MB)")
+            self.evict(keep=path)
+        except OSError as e:
+            logger.warning(f"⚠️ 写入解析缓存失败: {e}")
+
+    def entries(self):
+        """返回 [(路径, 大小, mtime)]，按 mtime 从旧到新排序"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(_ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        entries.sort(key=lambda e: e[2])
+        return entries
+
+    def evict(self, keep=None):
+        """淘汰最久未使用的条目，直到总大小不超过上限"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # Windows 下仍被映射的文件无法删除，留到下次
+                continue
+            total -= size
+            logger.debug(f"淘汰解析缓存: {os.path.basename(path)}")
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if os.path.exists(self._index_path()):
+            os.remove(self._index_path())
+
+
+def get_parse_cache(cfg=None):
+    """
+    按配置返回全局 ParseCache；未启用时返回 None
+
+    Args:
+        cfg: AnalysisConfig，None 时读取 config 模块
+    """
+    global _parse_cache
+    cfg = resolve_config(cfg)
+    if not cfg.PARSE_CACHE_ENABLED:
+        return None
+
+    cache_dir = cfg.PARSE_CACHE_DIR
+    if not os.path.isabs(cache_dir):
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), cache_dir)
+    max_bytes = int(cfg.PARSE_CACHE_MAX_MB * 1024 * 1024)
+
+    if _parse_cache is None or _parse_cache.cache_dir != cache_dir or _parse_cache.max_bytes != max_bytes:
+        try:
+            _parse_cache = ParseCache(cache_dir, max_bytes)
+        except OSError as e:
+            logger.warning(f"⚠️ 无法创建解析缓存目录 {cache_dir}: {e}")
+            return None
+    return _parse_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出文件解析缓存')
+    parser.add_argument('paths', nargs='*', help='要预先解析并缓存的导出文件')
+    parser.add_argument('--list', action='store_true', help='列出缓存条目')
+    parser.add_argument('--clear', action='store_true', help='清空缓存')
+    args = parser.parse_args()
+
+    cache = get_parse_cache()
+    if cache is None:
+        print('解析缓存未启用（PARSE_CACHE_ENABLED = False）')
+        return 1
+
+    if args.clear:
+        cache.clear()
+        print(f'已清空解析缓存: {cache.cache_dir}')
+
+    if args.paths:
+        from message_table import load_message_table
+        for path in args.paths:
+            start = time.perf_counter()
+            data = load_message_table(path)
+            print(f"{path}: {len(data['messages'])} 条消息 ({time.perf_counter() - start:.2f}s)")
+
+    if args.list:
+        entries = cache.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, mtime in reversed(entries):
+            used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))
+            print(f"{os.path.basename(path)[:16]}  {size / 1024 / 1024:>8.1f} MB  {used}")
+        print(f"共 {len(entries)} 个条目, {total / 1024 / 1024:.1f} MB / 上限 {cache.max_bytes / 1024 / 1024:.0f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,16 +5,27 @@
 """
 
 import re
-# 尝试导入 jieba_fast（更快），如果失败则回退到 jieba（标准版本）
-try:
-    import jieba_fast as jieba
-except ImportError:
-    import jieba
 from datetime import datetime, timezone, timedelta
 from collections import Counter, defaultdict
 from typing import Dict, List, Optional, Tuple
+import numpy as np
 from logger import get_logger
-from utils import parse_datetime, clean_text
+from utils import clean_text
+from message_table import (
+    MessageTable,
+    MessageKeyIndex,
+    NO_TIME,
+    ms_to_datetime,
+    local_hour,
+    local_day,
+    day_to_date,
+    count_first_seen,
+    load_message_table,
+)
+from message_filter import MessageFilter
+from parse_cache import get_parse_cache
+from segmenter import SegmentCache
+from analysis_config import AnalysisConfig, resolve_config
 import os
 
 logger = get_logger(__name__)
@@ -68,10 +79,106 @@ def load_stopwords_for_personal():
         return _STOPWORDS_CACHE
 
 
+def build_user_mapping(table: MessageTable) -> Dict[str, str]:
+    """构建用户UIN到名称的映射（优先最近使用的非 UIN 名称，其次群名片，兜底为 用户{uin}）"""
+    uin_to_name = {}
+    uin_names = defaultdict(list)
+    uin_member_names = {}
+
+    # 只需要发送者和名称三列，直接读 id 列，不解码文本
+    uins = table.uins
+    names = table.names
+    for uin_id, name_id, member_id in zip(table.sender_ids.tolist(),
+                                          table.name_ids.tolist(),
+                                          table.member_name_ids.tolist()):
+        if uin_id < 0:
+            continue
+        uin = uins[uin_id]
+
+        if name_id >= 0:
+            name = names[name_id]
+            if not uin_names[uin] or uin_names[uin][-1] != name:
+                uin_names[uin].append(name)
+
+        if member_id >= 0:
+            uin_member_names[uin] = names[member_id]
+
+    for uin, names in uin_names.items():
+        chosen_name = None
+        for name in reversed(names):
+            if name != str(uin):
+                chosen_name = name
+                break
+        if chosen_name is None and names:
+            chosen_name = names[-1]
+
+        if chosen_name is None and uin in uin_member_names:
+            chosen_name = uin_member_names[uin]
+
+        if chosen_name is None or chosen_name == str(uin):
+            chosen_name = f"用户{uin}"
+
+        uin_to_name[uin] = chosen_name
+    return uin_to_name
+
+
+def find_target_user(uin_to_name: Dict[str, str], target_name: str) -> Optional[str]:
+    """按名称查找用户UIN：先精确匹配，再模糊匹配（互相包含）"""
+    # 精确匹配
+    for uin, name in uin_to_name.items():
+        if name == target_name:
+            return uin
+
+    # 模糊匹配（包含）
+    for uin, name in uin_to_name.items():
+        if target_name in name or name in target_name:
+            logger.info(f"🔍 模糊匹配到用户: {name} (UIN: {uin})")
+            return uin
+
+    return None
+
+
+def load_personal_data(filepath: str, target_name: str, backend=None, workers=None, config=None,
+                       use_cache=True) -> Dict:
+    """
+    为个人报告加载导出文件
+
+    解析缓存可用时（启用且 use_cache）完整的表只解析一遍并写入 / 命中缓存，同一导出再次生成个人报告时不再解析；
+    目标用户的消息在内存中按发送者列选出。
+    不使用缓存时（临时上传的文件应传 use_cache=False）把发送者过滤下推到加载，只物化目标用户的完整消息：
+    第一遍只保留名册和引用信息（所有消息缩减为引用桩）以确定目标用户的 UIN；
+    第二遍保留该用户的完整消息，其他人的消息仍为引用桩（见 message_filter），
+    足够解析名称、回复目标与间隔、别人对目标用户的 @ 和回复。
+    名称映射随结果以 userMapping 附带，PersonalAnalyzer 直接使用。
+    config（AnalysisConfig）决定解析进程数和解析缓存，None 时读取 config 模块。
+    """
+    if use_cache and get_parse_cache(config) is not None:
+        data = load_message_table(filepath, backend=backend, workers=workers, config=config)
+        # 目标用户由 PersonalAnalyzer 查找，找不到时报错
+        data['userMapping'] = build_user_mapping(data['messages'])
+        return data
+
+    roster = load_message_table(filepath, backend=backend, workers=workers, config=config, use_cache=False,
+                                message_filter=MessageFilter(senders=(), keep_references=True))
+    user_mapping = build_user_mapping(roster['messages'])
+    target_uin = find_target_user(user_mapping, target_name)
+    if not target_uin:
+        # 找不到用户时由 PersonalAnalyzer 报错
+        roster['userMapping'] = user_mapping
+        return roster
+    del roster
+    data = load_message_table(filepath, backend=backend, workers=workers, config=config, use_cache=False,
+                              message_filter=MessageFilter(senders=[target_uin], keep_references=True))
+    # 引用桩保留了全部发送者名称，名册与第二遍的表相同
+    data['userMapping'] = user_mapping
+    return data
+
+
 class PersonalAnalyzer:
     """个人年度报告分析器"""
     
-    def __init__(self, data: Dict, target_name: str, use_stopwords: bool = False):
+    def __init__(self, data: Dict, target_name: str, use_stopwords: bool = False,
+                 config: Optional[AnalysisConfig] = None):
         """
         初始化个人分析器
         
@@ -79,9 +186,14 @@ class PersonalAnalyzer:
             data: 群聊数据（包含messages和chatInfo）
             target_name: 要分析的用户名称
             use_stopwords: 是否使用停用词库
+            config: AnalysisConfig；None 时从 config 模块解析一份快照
         """
+        self.config = resolve_config(config)
         self.data = data
         self.messages = data.get('messages', [])
+        if not isinstance(self.messages, MessageTable):
+            # 个人分析需要多次遍历，列表或惰性加载的迭代器统一转为列式存储
+            self.messages = MessageTable.from_messages(self.messages)
         self.chat_name = data.get('chatName', data.get('chatInfo', {}).get('name', '未知群聊'))
         self.target_name = target_name
         self.use_stopwords = use_stopwords
@@ -92,79 +204,37 @@ class PersonalAnalyzer:
             self.stopwords = set()
             logger.info("📚 个人报告停用词功能已禁用")
         
-        # 构建用户映射
-        self._build_user_mapping()
+        # 构建用户映射（load_personal_data 已建立时直接使用）
+        if 'userMapping' in data:
+            self.uin_to_name = data['userMapping']
+        else:
+            self._build_user_mapping()
         
         # 查找目标用户
         self.target_uin = self._find_target_user()
         if not self.target_uin:
             raise ValueError(f"未找到用户: {target_name}")
         
-        # 过滤出目标用户的消息
-        self.user_messages = [msg for msg in self.messages 
-                             if msg.get('sender', {}).get('uin') == self.target_uin]
+        # 过滤出目标用户的消息（行号）
+        self.target_id = self.messages.uin_ids[self.target_uin]
+        self.user_rows = np.flatnonzero(self.messages.sender_ids == self.target_id)
         
-        if not self.user_messages:
+        if not len(self.user_rows):
             raise ValueError(f"用户 {target_name} 在指定时间范围内没有发言")
         
         logger.info(f"📊 开始分析用户: {target_name} (UIN: {self.target_uin})")
-        logger.info(f"📝 找到 {len(self.user_messages)} 条消息")
+        logger.info(f"📝 找到 {len(self.user_rows)} 条消息")
         
         # 初始化统计变量
         self._init_stats()
     
     def _build_user_mapping(self):
         """构建用户UIN到名称的映射"""
-        self.uin_to_name = {}
-        uin_names = defaultdict(list)
-        uin_member_names = {}
-        
-        for msg in self.messages:
-            sender = msg.get('sender', {})
-            uin = sender.get('uin')
-            name = (sender.get('name') or '').strip()
-            
-            if uin and name:
-                if not uin_names[uin] or uin_names[uin][-1] != name:
-                    uin_names[uin].append(name)
-            
-            if uin:
-                raw_msg = msg.get('rawMessage', {})
-                send_member_name = raw_msg.get('sendMemberName', '').strip()
-                if send_member_name:
-                    uin_member_names[uin] = send_member_name
-        
-        for uin, names in uin_names.items():
-            chosen_name = None
-            for name in reversed(names):
-                if name != str(uin):
-                    chosen_name = name
-                    break
-            if chosen_name is None and names:
-                chosen_name = names[-1]
-            
-            if chosen_name is None and uin in uin_member_names:
-                chosen_name = uin_member_names[uin]
-            
-            if chosen_name is None or chosen_name == str(uin):
-                chosen_name = f"用户{uin}"
-            
-            self.uin_to_name[uin] = chosen_name
+        self.uin_to_name = build_user_mapping(self.messages)
     
     def _find_target_user(self) -> Optional[str]:
         """查找目标用户的UIN"""
-        # 精确匹配
-        for uin, name in self.uin_to_name.items():
-            if name == self.target_name:
-                return uin
-        
-        # 模糊匹配（包含）
-        for uin, name in self.uin_to_name.items():
-            if self.target_name in name or name in self.target_name:
-                logger.info(f"🔍 模糊匹配到用户: {name} (UIN: {uin})")
-                return uin
-        
-        return None
+        return find_target_user(self.uin_to_name, self.target_name)
     
     def _init_stats(self):
         """初始化统计变量"""
@@ -207,6 +277,8 @@ class PersonalAnalyzer:
         
         # 消息内容
         self.all_messages = []  # 存储所有消息文本
+        # 分词缓存：重复文本只切分一次，_find_consecutive_words 再次分词时直接命中
+        self._segments = SegmentCache(self.config.SEGMENT_CACHE_SIZE)
         self.long_messages = 0  # >200字的消息
         
         # 特殊消息
@@ -214,73 +286,76 @@ class PersonalAnalyzer:
         self.most_emoji_message = None  # 表情反应最多的消息
         self.chain_repeat_message = None  # 引发复读的消息
         
-        # 构建msgid到发送者的映射（用于回复分析）
-        self.msgid_to_sender = {}
-        for msg in self.messages:
-            msg_id = msg.get('messageId')
-            sender_uin = msg.get('sender', {}).get('uin')
-            if msg_id and sender_uin:
-                self.msgid_to_sender[msg_id] = sender_uin
+        # 按消息ID查找被回复消息的时间（用于回复间隔）：与顺序查找一致，取第一条匹配的消息
+        table = self.messages
+        self.msgid_to_time = MessageKeyIndex(table.msg_keys, table.timestamps, keep='first')
     
     def analyze(self):
         """执行分析"""
         logger.info("🔍 开始分析个人数据...")
-        
-        # 先遍历所有消息，统计@和回复关系（避免重复计算）
-        msg_id_to_user_msg = {msg.get('messageId'): msg for msg in self.user_messages}
-        
-        for msg in self.messages:
-            sender_uin = msg.get('sender', {}).get('uin')
-            if not sender_uin or str(sender_uin) == str(self.target_uin):
-                continue  # 跳过目标用户自己的消息
-            
-            elements = msg.get('rawMessage', {}).get('elements', [])
-            for element in elements:
-                elem_type = element.get('elementType')
-                
-                # 检查是否@了目标用户
-                if elem_type == 1:  # 文本元素
-                    text_elem = element.get('textElement', {})
-                    at_uid = text_elem.get('atUid', '')
-                    if str(at_uid) == str(self.target_uin):
-                        self.ated_count += 1
-                        self.at_by[str(sender_uin)] += 1
-                
-                # 检查是否回复了目标用户
-                elif elem_type == 7:  # 回复元素
-                    reply_elem = element.get('replyElement', {})
-                    ref_msg_id = reply_elem.get('sourceMsgIdInRecords') or reply_elem.get('replayMsgId')
-                    if ref_msg_id and ref_msg_id in msg_id_to_user_msg:
-                        self.replied_count += 1
-                        self.replied_by[str(sender_uin)] += 1
+        table = self.messages
+        uins = table.uins
+        
+        # 先统计其他人@和回复目标用户的次数（按 CSR 偏移量把元素展开到所属消息，整列计算）
+        others = (table.sender_ids >= 0) & (table.sender_ids != self.target_id)
+        
+        # 检查是否@了目标用户（仅文本元素）
+        at_owner = np.repeat(np.arange(len(table)), np.diff(table.at_offsets))
+        at_mask = (table.at_in_text == 1) & (table.at_uid_ids == self.target_id) & others[at_owner]
+        at_senders = table.sender_ids[at_owner[at_mask]].tolist()
+        self.ated_count += len(at_senders)
+        for sender_id in at_senders:
+            self.at_by[uins[sender_id]] += 1
+        
+        # 检查是否回复了目标用户：sourceMsgIdInRecords 缺失时用 replayMsgId
+        reply_owner = np.repeat(np.arange(len(table)), np.diff(table.reply_offsets))
+        ref_keys = np.where(table.reply_source_keys != -1, table.reply_source_keys, table.reply_replay_keys)
+        user_msg_keys = table.msg_keys[self.user_rows]
+        user_msg_keys = user_msg_keys[user_msg_keys != -1]
+        reply_mask = (ref_keys != -1) & np.isin(ref_keys, user_msg_keys) & others[reply_owner]
+        reply_senders = table.sender_ids[reply_owner[reply_mask]].tolist()
+        self.replied_count += len(reply_senders)
+        for sender_id in reply_senders:
+            self.replied_by[uins[sender_id]] += 1
         
         # 再遍历用户消息，统计用户自己的数据
-        # 先按时间排序用户消息，确保时间计算的准确性
-        user_messages_with_time = []
-        for msg in self.user_messages:
-            timestamp = msg.get('timestamp', '')
-            msg_dt = parse_datetime(timestamp)
-            if msg_dt:
-                user_messages_with_time.append((msg_dt, msg))
-        
-        # 按时间排序
-        user_messages_with_time.sort(key=lambda x: x[0])
+        # 先按时间排序用户消息（稳定排序），确保时间计算的准确性
+        user_times = table.timestamps[self.user_rows]
+        timed_rows = self.user_rows[user_times != NO_TIME]
+        order = np.argsort(table.timestamps[timed_rows], kind='stable')
         
-        # 更新用户消息列表为排序后的
-        self.user_messages = [msg for _, msg in user_messages_with_time]
+        # 更新用户消息为排序后的行
+        user_messages = list(table.iter_rows(timed_rows[order]))
+        self.user_rows = timed_rows[order]
         
         # 从排序后的消息中确定最早和最晚时间
-        if user_messages_with_time:
-            self.first_message_time = user_messages_with_time[0][0]
-            self.last_message_time = user_messages_with_time[-1][0]
+        if user_messages:
+            self.first_message_time = ms_to_datetime(user_messages[0].timestamp)
+            self.last_message_time = ms_to_datetime(user_messages[-1].timestamp)
             logger.info(f"📅 最早发言: {self.first_message_time.strftime('%Y-%m-%d %H:%M:%S')}")
             logger.info(f"📅 最晚发言: {self.last_message_time.strftime('%Y-%m-%d %H:%M:%S')}")
         
+        # 时间分布整列计算：消息已按时间排序，按首次出现顺序累加即与逐条统计的插入顺序一致
+        timestamps = table.timestamps[self.user_rows]
+        for day, count in zip(*count_first_seen(local_day(timestamps))):
+            # 活跃天数
+            date_str = day_to_date(day).strftime('%Y-%m-%d')
+            self.active_days.add(date_str)
+            self.daily_message_count[date_str] += count
+        
+        # 小时分布
+        hours = local_hour(timestamps)
+        for hour, count in zip(*count_first_seen(hours)):
+            self.hour_distribution[hour] += count
+        
+        # 夜猫子指数（22:00-06:00）
+        self.night_messages += int(np.count_nonzero((hours >= 22) | (hours < 6)))
+        
         prev_message_text = None
         prev_sender_uin = None
         repeat_chain = []  # 当前复读链
         
-        for i, (msg_dt, msg) in enumerate(user_messages_with_time):
+        for i, msg in enumerate(user_messages):
             # 基本统计
             self.total_messages += 1
             
@@ -288,79 +363,44 @@ class PersonalAnalyzer:
             current_msg_has_emoji = False
             current_msg_has_image = False
             
-            if msg_dt:
-                # 活跃天数
-                date_str = msg_dt.strftime('%Y-%m-%d')
-                self.active_days.add(date_str)
-                self.daily_message_count[date_str] += 1
-                
-                # 小时分布
-                hour = msg_dt.hour
-                self.hour_distribution[hour] += 1
-                
-                # 夜猫子指数（22:00-06:00）
-                if hour >= 22 or hour < 6:
-                    self.night_messages += 1
-            
             # 内容分析
-            content = msg.get('content', {})
-            text = content.get('text', '') if isinstance(content, dict) else ''
+            text = msg.text
             
             # 提取@信息
             at_contents = []
-            elements = msg.get('rawMessage', {}).get('elements', [])
-            for element in elements:
-                elem_type = element.get('elementType')
-                
-                if elem_type == 1:  # 文本元素
-                    text_elem = element.get('textElement', {})
-                    at_type = text_elem.get('atType', 0)
-                    at_uid = text_elem.get('atUid', '')
-                    at_content = text_elem.get('content', '')
-                    
-                    if at_type > 0 and at_uid and str(at_uid) != '0':
-                        self.at_count += 1
-                        at_target_uin = str(at_uid)
-                        self.at_targets[at_target_uin] += 1
-                        if at_content:
-                            at_contents.append(at_content)
-                
-                elif elem_type == 2:  # 图片元素
-                    pic_elem = element.get('picElement', {})
-                    summary = pic_elem.get('summary', '')
-                    if summary and summary.startswith('[') and summary.endswith(']'):
-                        current_msg_has_emoji = True
-                        self.message_types['emoji'] += 1
-                        self.emoji_count += 1
-                    else:
-                        current_msg_has_image = True
-                        self.message_types['image'] += 1
-                        self.image_count += 1
+            for at in msg.ats:
+                if at.in_text and at.at_type > 0 and at.uid and at.uid != '0':
+                    self.at_count += 1
+                    self.at_targets[at.uid] += 1
+                    if at.content:
+                        at_contents.append(at.content)
+            
+            # 图片元素
+            if msg.sticker_count:
+                current_msg_has_emoji = True
+                self.message_types['emoji'] += msg.sticker_count
+                self.emoji_count += msg.sticker_count
+            if msg.image_count:
+                current_msg_has_image = True
+                self.message_types['image'] += msg.image_count
+                self.image_count += msg.image_count
+            
+            # 回复元素
+            for reply in msg.replies:
+                self.reply_count += 1
+                # 被回复者在建表时已解析（senderUid，缺失时按消息ID查找）
+                target_uin = reply.target
+                ref_key = reply.source_key if reply.source_key != -1 else reply.replay_key
                 
-                elif elem_type == 7:  # 回复元素
-                    self.reply_count += 1
-                    reply_elem = element.get('replyElement', {})
-                    target_uin = reply_elem.get('senderUid')
-                    
-                    if not target_uin or target_uin == '0':
-                        ref_msg_id = reply_elem.get('sourceMsgIdInRecords') or reply_elem.get('replayMsgId')
-                        if ref_msg_id:
-                            target_uin = self.msgid_to_sender.get(ref_msg_id)
+                if target_uin and target_uin != '0' and target_uin != self.target_uin:
+                    self.reply_to[target_uin] += 1
                     
-                    if target_uin and str(target_uin) != '0' and str(target_uin) != self.target_uin:
-                        target_uin_str = str(target_uin)
-                        self.reply_to[target_uin_str] += 1
-                        
-                        # 计算回复间隔（需要找到被回复的消息时间）
-                        ref_msg_id = reply_elem.get('sourceMsgIdInRecords') or reply_elem.get('replayMsgId')
-                        if ref_msg_id:
-                            for prev_msg in self.messages:
-                                if prev_msg.get('messageId') == ref_msg_id:
-                                    prev_msg_dt = parse_datetime(prev_msg.get('timestamp', ''))
-                                    if prev_msg_dt and msg_dt:
-                                        interval = (msg_dt - prev_msg_dt).total_seconds()
-                                        self.reply_intervals[target_uin_str].append(interval)
-                                    break
+                    # 计算回复间隔（需要找到被回复的消息时间）
+                    if ref_key != -1:
+                        prev_ts = self.msgid_to_time.get(ref_key, NO_TIME)
+                        if prev_ts != NO_TIME:
+                            interval = (msg.timestamp - prev_ts) / 1000
+                            self.reply_intervals[target_uin].append(interval)
             
             # 文本处理
             cleaned = clean_text(text, at_contents)
@@ -379,11 +419,7 @@ class PersonalAnalyzer:
                     self.long_messages += 1
                 
                 # 词频分析
-                words = list(jieba.cut(cleaned))
-                for word in words:
-                    word = word.strip()
-                    if not word:
-                        continue
+                for word in self._segments.cut(cleaned):
                     if self.use_stopwords and word in self.stopwords:
                         continue
                     self.word_freq[word] += 1
@@ -400,12 +436,12 @@ class PersonalAnalyzer:
                 self.repeat_count += 1
             
             # 复读链检测（需要检查前后消息）
-            if i > 0 and i < len(user_messages_with_time) - 1:
-                prev_msg = user_messages_with_time[i-1][1]
-                next_msg = user_messages_with_time[i+1][1] if i+1 < len(user_messages_with_time) else None
+            if i > 0 and i < len(user_messages) - 1:
+                prev_msg = user_messages[i-1]
+                next_msg = user_messages[i+1] if i+1 < len(user_messages) else None
                 
-                prev_text = clean_text(prev_msg.get('content', {}).get('text', ''), [])
-                next_text = clean_text(next_msg.get('content', {}).get('text', ''), []) if next_msg else None
+                prev_text = clean_text(prev_msg.text, [])
+                next_text = clean_text(next_msg.text, []) if next_msg else None
                 
                 if cleaned and prev_text and cleaned == prev_text:
                     # 检查是否形成复读链
@@ -419,6 +455,8 @@ class PersonalAnalyzer:
             prev_message_text = cleaned if cleaned else None
             prev_sender_uin = self.target_uin
         
+        self._segments.log_stats()
+
         logger.info("✅ 个人数据分析完成")
     
     def export_json(self) -> Dict:
@@ -586,15 +624,14 @@ class PersonalAnalyzer:
         
         word_consecutive_count = Counter()
         for msg_text in self.all_messages:
-            words = list(jieba.cut(msg_text))
             prev_word = None
-            for word in words:
-                word = word.strip()
-                if not word or (self.use_stopwords and word in self.stopwords):
+            for word in self._segments.cut(msg_text):
+                if self.use_stopwords and word in self.stopwords:
                     continue
                 if word == prev_word:
                     word_consecutive_count[word] += 1
                 prev_word = word
+        self._segments.log_stats()
         
         if word_consecutive_count:
             most_consecutive_word, count = word_consecutive_count.most_common(1)[0]
@@ -0,0 +1,677 @@
+# -*- coding: utf-8 -*-
+"""
+分词与分词结果缓存
+
+ChatAnalyzer 的三处分词（首轮词频、词组合并的相邻词统计、应用新词后的重新分词）共用一份 TokenCache：
+首轮把每条文本的词（去空白后非空的）存为紧凑的 int32 词 id 数组，
+之后每次向词典加入新词，只重新切分包含这些新词的文本（Aho-Corasick 多模式匹配查找）
+和词频总数增大后最优切分路径改变的文本，其余文本沿用已有的切分结果。词频、贡献者、例句和相邻词对都直接在词 id 数组上向量化统计。
+
+分词可以交给进程池：文本按顺序切成连续的分片，各进程安装本次分析加入的新词后分词，
+主进程按分片顺序合并词表和词 id 数组（map-reduce），结果与串行完全一致。
+
+统计结果按首次出现的顺序构建：Counter 的插入顺序（决定 most_common 并列时的次序）
+和贡献者矩阵的行内顺序都与逐条处理相同。
+例句是对包含该词的文本的可复现随机抽样，以文本下标返回，由调用方只为导出的词映射回原字符串。
+
+SegmentCache 按清理后文本缓存分词结果，复读、"哈哈哈"、"?" 这类重复文本只切分一次。
+
+每次分析使用自己的 AnalysisTokenizer：新词加入分析自己的词典，进程共享的基础词典只读，
+同一进程中的分析之间互不影响。
+"""
+
+import os
+import re
+import time
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# 尝试导入 jieba_fast（更快），如果失败则回退到 jieba（标准版本）
+try:
+    import jieba_fast as jieba
+except ImportError:
+    import jieba
+
+# Aho-Corasick 多模式匹配（可选，未安装时用正则交替匹配）
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+import tokenizer_cache
+from analysis_config import resolve_config
+from logger import get_logger
+from message_table import count_first_seen
+
+logger = get_logger(__name__)
+
+_DIGIT_SYMBOL_PATTERN = re.compile(r'^[\d\W]+$')
+# 文本少于该条数时进程池的启动和传输开销不划算
+_MIN_PARALLEL_TEXTS = 20000
+
+
+def resolve_segment_workers(workers=None):
+    """
+    解析分词进程数：None 时读取配置 SEGMENT_WORKERS（默认 1，即串行），0 表示使用全部 CPU 核心
+    """
+    if workers is None:
+        workers = resolve_config().SEGMENT_WORKERS
+    if not workers:
+        workers = os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def base_tokenizer():
+    """
+    进程内共享的基础分词器（jieba 默认词典），首次调用时加载，之后只读
+
+    分析过程中加入的新词只写入各自的 AnalysisTokenizer，不会修改这份词典。
+    预构建的词典缓存（tokenizer_cache）可用时直接装入，不再从词典文件构建。
+    """
+    if not jieba.dt.initialized:
+        tokenizer_cache.install(jieba.dt)
+    jieba.dt.initialize()
+    return jieba.dt
+
+
+class AnalysisTokenizer(jieba.Tokenizer):
+    """
+    单次分析的分词器：在共享的基础词典上叠加本次分析加入的新词
+
+    词典（FREQ）写时复制：加入第一个新词之前直接引用基础词典，之后改用自己的副本
+    （只复制哈希表，词条字符串仍与基础词典共用，约十几 MB），分析结束后随分析器一起释放。
+    基础词典始终不变，因此一个进程中先后或同时进行的分析互不影响，结果与请求顺序无关。
+    """
+
+    def __init__(self, base=None):
+        base = base if base is not None else base_tokenizer()
+        super().__init__(base.dictionary)
+        # 沿用基础分词器加载后的全部状态（jieba_fast 可能有额外的属性），锁和词性表各自独立
+        lock = self.lock
+        self.__dict__.update(base.__dict__)
+        self.lock = lock
+        self.user_word_tag_tab = dict(base.user_word_tag_tab)
+        self._owns_freq = False
+
+    def add_word(self, word, freq=None, tag=None):
+        if not self._owns_freq:
+            self.FREQ = dict(self.FREQ)
+            self._owns_freq = True
+        super().add_word(word, freq, tag)
+
+
+def _dictionary_fingerprint(tokenizer):
+    """词典指纹：add_word 会改变词频总数和词条数"""
+    return getattr(tokenizer, 'total', 0), len(getattr(tokenizer, 'FREQ', ()))
+
+
+class SegmentCache:
+    """
+    分词结果缓存：清理后文本 -> 去空白后非空的词
+
+    容量有限，超出时淘汰最久未使用的条目。每次查询都比对词典指纹，
+    新词 / 合并词加入词典后缓存整体失效，不会返回旧词典下的切分结果。
+
+    Args:
+        max_size: 最多缓存的文本条数；None 时读取配置 SEGMENT_CACHE_SIZE，0 表示不缓存
+        tokenizer: 使用的分词器；None 时为共享的基础分词器
+    """
+
+    def __init__(self, max_size=None, tokenizer=None):
+        if max_size is None:
+            max_size = resolve_config().SEGMENT_CACHE_SIZE
+        self.max_size = max(0, int(max_size))
+        self.tokenizer = tokenizer if tokenizer is not None else base_tokenizer()
+        self._entries = OrderedDict()
+        self._fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+
+    def cut(self, text):
+        entries = self._entries
+        if self._fingerprint != _dictionary_fingerprint(self.tokenizer):
+            entries.clear()
+        words = entries.get(text)
+        if words is not None:
+            entries.move_to_end(text)
+            self.hits += 1
+            return words
+
+        start = time.perf_counter()
+        words = tuple(word for word in (w.strip() for w in self.tokenizer.cut(text)) if word)
+        self.miss_seconds += time.perf_counter() - start
+        self.misses += 1
+        self._fingerprint = _dictionary_fingerprint(self.tokenizer)
+        if self.max_size:
+            entries[text] = words
+            if len(entries) > self.max_size:
+                entries.popitem(last=False)
+        return words
+
+    @property
+    def stats(self):
+        return self.hits, self.misses, self.miss_seconds
+
+    def log_stats(self):
+        log_cache_stats(*self.stats)
+
+
+def log_cache_stats(hits, misses, miss_seconds):
+    """在调试日志中报告分词缓存的命中率和节省的时间（按未命中时的平均分词耗时估算）"""
+    total = hits + misses
+    if not total:
+        return
+    saved = hits * miss_seconds / misses if misses else 0.0
+    logger.debug(f"分词缓存: 命中 {hits}/{total} ({hits / total:.1%}), 约节省 {saved:.2f}s")
+
+
+# 子进程中本次分词任务的分词器，由 _init_worker 创建
+_worker_tokenizer = None
+
+
+def _init_worker(user_words):
+    """
+    子进程初始化：在基础词典上按主进程的添加顺序重放新词
+
+    基础词典从不被修改，fork / spawn / forkserver 启动的进程得到的都是同一份起点，
+    重放后与主进程的分词器完全一致。
+    """
+    global _worker_tokenizer
+    _worker_tokenizer = AnalysisTokenizer()
+    for word, freq in user_words:
+        _worker_tokenizer.add_word(word, freq=freq)
+
+
+def _segment_shard(task):
+    """子进程：分词一个分片 (文本列表, 分词缓存容量)"""
+    texts, cache_size = task
+    return _segment_texts(texts, SegmentCache(cache_size, _worker_tokenizer))
+
+
+def _segment_texts(texts, segments):
+    """分词：返回 (局部词表, 词 id 数组, 每条文本的词数, 分词缓存统计)"""
+    vocab = {}
+    ids = array('i')
+    lengths = array('i')
+    for text in texts:
+        words = segments.cut(text)
+        for word in words:
+            ids.append(vocab.setdefault(word, len(vocab)))
+        lengths.append(len(words))
+    return list(vocab), ids, lengths, segments.stats
+
+
+def _shards(items, n_shards):
+    """按顺序切成 n_shards 个连续分片"""
+    size = len(items)
+    bounds = [size * i // n_shards for i in range(n_shards + 1)]
+    return [items[lo:hi] for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+
+
+def _run_parallel(func, tasks, workers, user_words):
+    """在进程池中按顺序执行各分片；失败时返回 None，由调用方回退到串行"""
+    # 主进程先加载基础词典，fork 启动的子进程可直接继承
+    base_tokenizer()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(list(user_words),)) as pool:
+            return list(pool.map(func, tasks))
+    except Exception as e:
+        logger.warning(f"⚠️ 并行分词失败，改用串行分词: {e}")
+        return None
+
+
+def find_texts_containing(texts, words):
+    """返回包含任一词（作为子串）的文本下标"""
+    words = sorted({word for word in words if word}, key=len, reverse=True)
+    if not words:
+        return []
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for word in words:
+            automaton.add_word(word, word)
+        automaton.make_automaton()
+        return [i for i, text in enumerate(texts) if next(automaton.iter(text), None) is not None]
+    search = re.compile('|'.join(re.escape(word) for word in words)).search
+    return [i for i, text in enumerate(texts) if search(text)]
+
+
+def _best_route(tokenizer, block, total):
+    """
+    词频总数为 total 时 block 的最优切分路径：每个位置起始的词的结束下标
+
+    必须与 tokenizer.cut 实际使用的路径计算一致：jieba_fast 用自己的 C 实现（_get_DAG_and_calc），
+    打分相同时选择的路径与纯 Python 的 calc 不同（如 "大大大" 切为 大 / 大大 而非 大大 / 大）。
+    """
+    fast_functions = getattr(jieba, '_jieba_fast_functions', None)
+    if fast_functions is not None:
+        route = []
+        fast_functions._get_DAG_and_calc(tokenizer.FREQ, block, route, float(total))
+        return route[:len(block)]
+    route = {}
+    # calc 读取 tokenizer.total；分词器属于单次分析，临时改写不影响其他分析
+    current = tokenizer.total
+    tokenizer.total = total
+    try:
+        tokenizer.calc(block, tokenizer.get_DAG(block), route)
+    finally:
+        tokenizer.total = current
+    return [route[i][1] for i in range(len(block))]
+
+
+def _route_changes(tokenizer, block, old_total, new_total):
+    """词频总数由 old_total 变为 new_total 时，block 的最优切分路径是否改变"""
+    old_route = _best_route(tokenizer, block, old_total)
+    new_route = _best_route(tokenizer, block, new_total)
+    i = 0
+    while i < len(block):
+        if old_route[i] != new_route[i]:
+            return True
+        i = old_route[i] + 1
+    return False
+
+
+def find_texts_affected_by_total(texts, tokenizer, old_total, skip=()):
+    """
+    返回词频总数由 old_total 变为 tokenizer.total 后切分会改变的文本下标（跳过 skip 中的下标）
+
+    jieba 为切分路径上的每个词减去 log(total)，add_word 增大 total 后词数更少的路径可能胜出
+    （如 "管理方面" 由 "管理 / 方面" 变为一个词），不含新词的文本也会受影响。
+    这些文本的 DAG 和词频都没有变化，HMM 只作用于路径上连续的单字，因此路径不变则切分结果不变：
+    对每个汉字块用分词器实际使用的路径计算在新旧 total 下各求一次最优路径，路径不同的文本需要重新切分。
+    相同的文本只判断一次。
+    """
+    new_total = tokenizer.total
+    skip = set(skip)
+    verdicts = {}
+    affected = []
+    for i, text in enumerate(texts):
+        if i in skip:
+            continue
+        changed = verdicts.get(text)
+        if changed is None:
+            changed = any(_route_changes(tokenizer, block, old_total, new_total)
+                          for block in jieba.re_han_default.split(text)
+                          if block and jieba.re_han_default.match(block))
+            verdicts[text] = changed
+        if changed:
+            affected.append(i)
+    return affected
+
+
+class WordContributions:
+    """
+    词 × 发送者的出现次数，稀疏矩阵（按词分行的 CSR）
+
+    每行的列（发送者）按 (词, 发送者) 组合首次出现的顺序排列，
+    top 的结果与逐条累加的 Counter.most_common 完全一致（并列时先出现的在前）。
+    """
+
+    def __init__(self, words=(), uins=(), word_ids=None, user_ids=None, counts=None, first=None):
+        """
+        Args:
+            words: 词表，word_ids 为其中的下标
+            uins: 发送者表，user_ids 为其中的下标
+            word_ids, user_ids, counts: 各 (词, 发送者) 组合及其次数（COO）
+            first: 各组合首次出现的位置，决定行内顺序
+        """
+        self.uins = list(uins)
+        if word_ids is None or not len(word_ids):
+            word_ids = user_ids = counts = first = np.zeros(0, dtype=np.int64)
+        order = np.lexsort((first, word_ids))
+        row_ids, row_starts = np.unique(word_ids[order], return_index=True)
+        self.rows = {words[word_id]: row for row, word_id in enumerate(row_ids.tolist())}
+        self.row_words = [words[word_id] for word_id in row_ids.tolist()]
+        self.offsets = np.append(row_starts, len(order)).astype(np.int64)
+        self.columns = user_ids[order].astype(np.int32)
+        self.counts = counts[order].astype(np.int64)
+        self._by_user = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, word):
+        return word in self.rows
+
+    def top(self, word, n):
+        """某个词出现次数最多的 n 个发送者 [(uin, 次数)]"""
+        row = self.rows.get(word)
+        if row is None:
+            return []
+        start, stop = self.offsets[row], self.offsets[row + 1]
+        picked = _top_positions(self.counts[start:stop], n)
+        columns = self.columns[start:stop][picked].tolist()
+        return [(self.uins[col], count) for col, count in zip(columns, self.counts[start:stop][picked].tolist())]
+
+    def user_words(self, uin, n=None):
+        """某个发送者说得最多的 n 个词 [(词, 次数)]，n 为 None 时返回全部；并列时按词表中的顺序"""
+        if self._by_user is None:
+            order = np.argsort(self.columns, kind='stable')
+            starts = np.searchsorted(self.columns[order], np.arange(len(self.uins) + 1))
+            self._by_user = ({uin: i for i, uin in enumerate(self.uins)}, order, starts)
+        user_index, order, starts = self._by_user
+        user = user_index.get(uin)
+        if user is None:
+            return []
+        entries = order[starts[user]:starts[user + 1]]
+        counts = self.counts[entries]
+        picked = _top_positions(counts, len(counts) if n is None else n)
+        rows = np.searchsorted(self.offsets, entries[picked], side='right') - 1
+        return [(self.row_words[row], count) for row, count in zip(rows.tolist(), counts[picked].tolist())]
+
+
+def _top_positions(counts, n):
+    """
+    次数最大的 n 项的下标，按次数降序、并列时按下标升序（与 Counter.most_common 相同）
+
+    先用 argpartition 求出第 n 大的次数，只对不小于它的项排序。
+    """
+    if n <= 0 or not len(counts):
+        return np.zeros(0, dtype=np.int64)
+    if n < len(counts):
+        kth = counts[np.argpartition(-counts, n - 1)[n - 1]]
+        candidates = np.flatnonzero(counts >= kth)
+    else:
+        candidates = np.arange(len(counts))
+    return candidates[np.argsort(-counts[candidates], kind='stable')][:n]
+
+
+class WordSamples:
+    """
+    每个词的例句，以文本下标存储（按词分行）
+
+    每个 (词, 文本) 组合取一个随机优先级，每个词保留优先级最小的 k 个：
+    相当于对包含该词的全部文本做容量为 k 的蓄水池抽样（均匀、不放回，不偏向最早的消息），
+    保留的优先级也可以在分片之间合并。
+    """
+
+    def __init__(self, words=(), word_ids=None, text_ids=None, k=10, rng=None):
+        """
+        Args:
+            words: 词表，word_ids 为其中的下标
+            word_ids, text_ids: 各 (词, 文本) 组合，不重复
+            k: 每个词保留的例句数
+            rng: numpy 随机数生成器
+        """
+        if word_ids is None or not len(word_ids) or k <= 0:
+            word_ids = text_ids = np.zeros(0, dtype=np.int64)
+        rng = rng or np.random.default_rng()
+        order = np.lexsort((rng.random(len(word_ids)), word_ids))
+        word_ids = word_ids[order]
+        rank = np.arange(len(word_ids)) - np.searchsorted(word_ids, word_ids)
+        kept = rank < k
+        row_ids, row_starts = np.unique(word_ids[kept], return_index=True)
+        self.rows = {words[word_id]: row for row, word_id in enumerate(row_ids.tolist())}
+        self.offsets = np.append(row_starts, np.count_nonzero(kept)).astype(np.int64)
+        self.text_ids = text_ids[order][kept].astype(np.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, word):
+        return word in self.rows
+
+    def get(self, word):
+        """某个词的例句文本下标（随机顺序）"""
+        row = self.rows.get(word)
+        if row is None:
+            return []
+        return self.text_ids[self.offsets[row]:self.offsets[row + 1]].tolist()
+
+
+class TokenCache:
+    """
+    分词结果缓存
+
+    words 为词表（词 id 按首次加入的顺序分配），ids 为所有文本的词 id 依次拼接，
+    第 i 条文本的词为 ids[offsets[i]:offsets[i + 1]]
+
+    Args:
+        texts: 清理后的文本列表
+        workers: 分词进程数；为 1 或文本过少时在当前进程分词
+        user_words: 本次分析加入词典的 [(词, 词频), ...]，按添加顺序，子进程据此安装新词
+        cache_size: 各分片分词缓存的容量；None 时读取配置 SEGMENT_CACHE_SIZE
+        tokenizer: 本次分析的分词器（含 user_words）；None 时为共享的基础分词器
+    """
+
+    # 旧版本保存的缓存没有记录词频总数，视为未知（重新切分时全部重切）
+    total = None
+
+    def __init__(self, texts, workers=1, user_words=(), cache_size=None, tokenizer=None):
+        self.words = []
+        self._word_ids = {}
+        self.workers = workers
+        self.cache_size = cache_size
+        self.tokenizer = tokenizer
+        # 切分时的词频总数，加入新词后据此找出切分受 total 变化影响的文本
+        self.total = self._tokenizer().total
+        lengths, self.ids = self._segment(texts, user_words)
+        self.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getstate__(self):
+        # 分词器不随缓存序列化，恢复后由使用方重新指定（None 为共享的基础分词器）
+        state = self.__dict__.copy()
+        state['tokenizer'] = None
+        return state
+
+    def copy(self):
+        """浅拷贝：重新切分只替换数组、追加词表，拷贝之间互不影响"""
+        other = object.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other.words = list(self.words)
+        other._word_ids = dict(self._word_ids)
+        return other
+
+    @classmethod
+    def concat(cls, caches):
+        """
+        按顺序拼接多个分词结果缓存
+
+        词表按首次加入的顺序合并，后面的缓存中的词 id 映射到合并后的词表，
+        结果与对拼接后的文本整体分词得到的缓存相同。分词器等设置取自第一个缓存。
+        """
+        caches = list(caches)
+        merged = caches[0].copy()
+        if len(caches) == 1:
+            return merged
+        if any(cache.total != merged.total for cache in caches):
+            # 在不同词典下切分，之后重新切分全部文本
+            merged.total = None
+        word_ids = merged._word_ids
+        all_ids = [merged.ids]
+        all_lengths = [np.diff(merged.offsets)]
+        for cache in caches[1:]:
+            for word in cache.words:
+                if word not in word_ids:
+                    word_ids[word] = len(merged.words)
+                    merged.words.append(word)
+            remap = np.array([word_ids[word] for word in cache.words], dtype=np.int32)
+            all_ids.append(remap[cache.ids])
+            all_lengths.append(np.diff(cache.offsets))
+        lengths = np.concatenate(all_lengths)
+        merged.ids = np.concatenate(all_ids).astype(np.int32, copy=False)
+        merged.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=merged.offsets[1:])
+        return merged
+
+    def _tokenizer(self):
+        return self.tokenizer if self.tokenizer is not None else base_tokenizer()
+
+    def _segment(self, texts, user_words):
+        """分词并把各分片的局部词 id 映射到全局词表，返回 (每条文本的词数, 词 id 数组)"""
+        parts = None
+        if self.workers > 1 and len(texts) >= _MIN_PARALLEL_TEXTS:
+            shards = _shards(texts, self.workers)
+            logger.debug(f"并行分词: {len(shards)} 个分片, {self.workers} 个进程")
+            parts = _run_parallel(_segment_shard, [(shard, self.cache_size) for shard in shards],
+                                  self.workers, user_words)
+        if parts is None:
+            parts = [_segment_texts(texts, SegmentCache(self.cache_size, self.tokenizer))]
+
+        all_lengths = []
+        all_ids = []
+        cache_stats = [0, 0, 0.0]
+        word_ids = self._word_ids
+        for vocab, ids, lengths, part_stats in parts:
+            cache_stats = [total + value for total, value in zip(cache_stats, part_stats)]
+            for word in vocab:
+                if word not in word_ids:
+                    word_ids[word] = len(self.words)
+                    self.words.append(word)
+            remap = np.array([word_ids[word] for word in vocab], dtype=np.int32)
+            all_ids.append(remap[np.frombuffer(ids, dtype=np.intc)])
+            all_lengths.append(np.frombuffer(lengths, dtype=np.intc))
+        log_cache_stats(*cache_stats)
+        return np.concatenate(all_lengths), np.concatenate(all_ids)
+
+    def resegment(self, texts, new_words, user_words=()):
+        """
+        加入新词后，只重新切分包含新词的文本，以及词频总数变化后切分会改变的文本
+
+        add_word 同时增大 jieba 的词频总数（total），它进入每条切分路径的打分，
+        不含新词的文本也可能切分不同（见 find_texts_affected_by_total）；两类文本都重新切分后，
+        结果与用当前词典整体重新分词完全一致。
+
+        Args:
+            texts: 与构建时相同的文本列表
+            new_words: 自上次分词以来加入词典的词
+            user_words: 本次分析加入词典的全部 (词, 词频)
+
+        Returns:
+            重新切分的文本条数
+        """
+        tokenizer = self._tokenizer()
+        indices = find_texts_containing(texts, new_words)
+        if self.total is None:
+            indices = list(range(len(texts)))
+        elif self.total != tokenizer.total:
+            affected = find_texts_affected_by_total(texts, tokenizer, self.total, skip=indices)
+            if affected:
+                logger.debug(f"词频总数变化后切分改变的文本: {len(affected)} 条")
+                indices = sorted(set(indices).union(affected))
+        self.total = tokenizer.total
+        if not indices:
+            return 0
+        indices = np.asarray(indices, dtype=np.int64)
+        new_lengths, new_ids = self._segment([texts[i] for i in indices], user_words)
+
+        old_lengths = np.diff(self.offsets)
+        lengths = old_lengths.copy()
+        lengths[indices] = new_lengths
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        ids = np.empty(offsets[-1], dtype=np.int32)
+        # 未改动文本的词原样搬到新位置
+        changed = np.zeros(len(lengths), dtype=bool)
+        changed[indices] = True
+        text_of = np.repeat(np.arange(len(lengths)), old_lengths)
+        keep = ~changed[text_of]
+        kept_text = text_of[keep]
+        dest = offsets[kept_text] + (np.flatnonzero(keep) - self.offsets[kept_text])
+        ids[dest] = self.ids[keep]
+        # 重新切分的文本
+        new_text = np.repeat(indices, new_lengths)
+        new_starts = np.repeat(np.cumsum(new_lengths) - new_lengths, new_lengths)
+        dest = offsets[new_text] + (np.arange(len(new_ids)) - new_starts)
+        ids[dest] = new_ids
+
+        self.ids = ids
+        self.offsets = offsets
+        return len(indices)
+
+    def _text_of_tokens(self):
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.offsets))
+
+    def count_words(self, senders, stopwords=(), sample_count=10, seed=None):
+        """
+        统计词频、贡献者和例句
+
+        Args:
+            senders: 每条文本的发送者 uin
+            stopwords: 跳过的停用词
+            sample_count: 每个词抽取的例句数
+            seed: 例句抽样的随机种子，相同的种子和输入得到相同的例句
+
+        Returns:
+            (word_freq, word_contributors, word_samples)：word_contributors 为 WordContributions，
+            word_samples 为 WordSamples（文本下标）
+        """
+        words = self.words
+        ids = self.ids
+        text_of = self._text_of_tokens()
+        if stopwords:
+            is_stop = np.array([word in stopwords for word in words], dtype=bool)
+            keep = ~is_stop[ids]
+            ids = ids[keep]
+            text_of = text_of[keep]
+
+        word_freq = Counter()
+        if not len(ids):
+            return word_freq, WordContributions(), WordSamples()
+
+        first_ids, counts = count_first_seen(ids)
+        for word_id, count in zip(first_ids, counts):
+            word_freq[words[word_id]] = count
+
+        # 贡献者：发送者 uin 转为整数 id，(词, 发送者) 组合直接计数为稀疏矩阵
+        sender_pool = {}
+        sender_ids = np.array([sender_pool.setdefault(uin, len(sender_pool)) for uin in senders], dtype=np.int64)
+        sender_list = list(sender_pool)
+        token_senders = sender_ids[text_of]
+        has_sender = np.array([bool(uin) for uin in sender_list], dtype=bool)[token_senders]
+        n_senders = max(len(sender_list), 1)
+        pair_keys, pair_first, pair_counts = np.unique(
+            ids[has_sender].astype(np.int64) * n_senders + token_senders[has_sender],
+            return_index=True, return_counts=True,
+        )
+        word_contributors = WordContributions(
+            words, sender_list, pair_keys // n_senders, pair_keys % n_senders, pair_counts, pair_first,
+        )
+
+        # 例句：对 (词, 文本) 组合做蓄水池抽样
+        n_texts = max(len(self), 1)
+        occurrences = np.unique(ids.astype(np.int64) * n_texts + text_of)
+        word_samples = WordSamples(
+            words, occurrences // n_texts, occurrences % n_texts, sample_count, np.random.default_rng(seed),
+        )
+        return word_freq, word_contributors, word_samples
+
+    def count_word_pairs(self):
+        """
+        统计同一文本内的相邻词对（跳过纯数字 / 符号的词），供词组合并使用
+
+        Returns:
+            (bigram_counter, word_right_counter)
+        """
+        words = self.words
+        bigram_counter = Counter()
+        word_right_counter = Counter()
+        if len(self.ids) < 2:
+            return bigram_counter, word_right_counter
+
+        text_of = self._text_of_tokens()
+        is_symbol = np.array([bool(_DIGIT_SYMBOL_PATTERN.match(word)) for word in words], dtype=bool)
+        left = self.ids[:-1]
+        right = self.ids[1:]
+        valid = (text_of[:-1] == text_of[1:]) & ~is_symbol[left] & ~is_symbol[right]
+        left = left[valid].astype(np.int64)
+        right = right[valid]
+
+        n_words = len(words)
+        pair_keys, pair_counts = count_first_seen(left * n_words + right)
+        for key, count in zip(pair_keys, pair_counts):
+            left_id, right_id = divmod(key, n_words)
+            bigram_counter[(words[left_id], words[right_id])] = count
+        left_ids, left_counts = count_first_seen(left)
+        for word_id, count in zip(left_ids, left_counts):
+            word_right_counter[words[word_id]] = count
+        return bigram_counter, word_right_counter
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""测试公共设置：项目根目录加入 sys.path（各模块为平铺的顶层模块）"""
+
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
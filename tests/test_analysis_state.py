@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""分片状态合并：与整体分析一致"""
+
+import copy
+import json
+import random
+
+import pytest
+
+import analyzer
+from analysis_config import AnalysisConfig
+from benchmarks.synthetic_export import iter_synthetic_messages
+
+
+def _export(a):
+    report = a.export_json()
+    report['discoveredWords'] = sorted(a.discovered_words)
+    return json.dumps(report, ensure_ascii=False, sort_keys=True)
+
+
+def _data(messages):
+    return {'chatInfo': {'name': '合成测试群'}, 'messages': copy.deepcopy(messages)}
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_merged_shards_match_whole_analysis(seed):
+    messages = list(iter_synthetic_messages(1500, n_users=20))
+    config = AnalysisConfig.from_module(NEW_WORD_MIN_FREQ=5, SEGMENT_WORKERS=1, PARSE_WORKERS=1)
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(messages)), rng.randint(1, 4)))
+    shards = [messages[start:stop] for start, stop in zip([0] + cuts, cuts + [len(messages)])]
+
+    states = [analyzer.ChatAnalyzer(_data(shard), use_stopwords=False, config=config).collect_state()
+              for shard in shards]
+    merged = analyzer.ChatAnalyzer.from_state(sum(states), use_stopwords=False, config=config)
+    merged.analyze()
+    whole = analyzer.ChatAnalyzer(_data(messages), use_stopwords=False, config=config)
+    whole.analyze()
+    assert _export(merged) == _export(whole)
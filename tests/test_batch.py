@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""批量分析：增量分析按群分组，状态按群名保存"""
+
+import json
+import os
+
+import pytest
+
+from analyzer import analyze_incremental, state_path_for
+from batch import group_exports
+from message_table import load_message_table
+
+
+def _write_export(path, chat_name, n_messages=1):
+    messages = [{'id': str(i), 'timestamp': 1700000000000 + i, 'sender': {'uin': '1', 'name': 'a'},
+                 'content': {'text': '你好'}} for i in range(n_messages)]
+    with open(path, 'w', encoding='utf-8') as f:
+        chat_info = {'name': chat_name} if chat_name is not None else {}
+        json.dump({'chatInfo': chat_info, 'messages': messages}, f, ensure_ascii=False)
+    return str(path)
+
+
+def test_same_group_exports_run_in_one_group(tmp_path):
+    old = _write_export(tmp_path / '2024-01.json', '甲群')
+    new = _write_export(tmp_path / '2024-02.json', '甲群')
+    other = _write_export(tmp_path / 'other.json', '乙群', n_messages=50)
+    os.utime(old, (1, 1))
+    os.utime(new, (2, 2))
+
+    groups = group_exports([new, other, old])
+
+    # 较大的组先调度，组内按修改时间从旧到新
+    assert groups == [[other], [old, new]]
+
+
+def test_nameless_exports_are_not_merged(tmp_path):
+    first = _write_export(tmp_path / 'a.json', None, n_messages=2)
+    second = _write_export(tmp_path / 'b.json', None)
+
+    # 两个无名导出可能来自不同的群，各自成组
+    assert group_exports([first, second]) == [[first], [second]]
+    # 不能按群名确定状态文件
+    with pytest.raises(ValueError):
+        analyze_incremental(load_message_table(first, use_cache=False), None, use_stopwords=False)
+
+
+def test_state_path_keeps_sanitized_names_apart():
+    # 清理非法字符后相同的群名
+    assert state_path_for('甲/乙') != state_path_for('甲_乙')
+    assert state_path_for('甲/乙') == state_path_for('甲/乙')
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""增量分析：与整体分析一致"""
+
+import copy
+import json
+
+import analyzer
+from analysis_config import AnalysisConfig
+from analysis_state import AnalysisState
+from benchmarks.synthetic_export import iter_synthetic_messages
+
+
+def _export(a):
+    report = a.export_json()
+    report['discoveredWords'] = sorted(a.discovered_words)
+    return json.dumps(report, ensure_ascii=False, sort_keys=True)
+
+
+def _data(messages):
+    return {'chatInfo': {'name': '合成测试群'}, 'messages': copy.deepcopy(messages)}
+
+
+def test_switching_new_word_mode_between_runs(tmp_path):
+    """精确 -> 近似 -> 精确：近似模式不留下过期的 n-gram 索引，切回精确模式后结果与整体分析一致"""
+    messages = list(iter_synthetic_messages(1500, n_users=20))
+    exact = AnalysisConfig.from_module(NEW_WORD_MIN_FREQ=5, SEGMENT_WORKERS=1, PARSE_WORKERS=1)
+    approx = exact.replace(NEW_WORD_APPROXIMATE=True)
+    state_path = str(tmp_path / 'group.state')
+
+    analyzer.analyze_incremental(_data(messages[:500]), state_path, use_stopwords=False, config=exact)
+    assert AnalysisState.load(state_path).ngrams is not None
+
+    analyzer.analyze_incremental(_data(messages[:1000]), state_path, use_stopwords=False, config=approx)
+    assert AnalysisState.load(state_path).ngrams is None
+
+    incremental = analyzer.analyze_incremental(_data(messages), state_path, use_stopwords=False, config=exact)
+    whole = analyzer.ChatAnalyzer(_data(messages), use_stopwords=False, config=exact)
+    whole.analyze()
+    assert _export(incremental) == _export(whole)
+    assert AnalysisState.load(state_path).ngrams is not None
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""n-gram 统计：与逐句枚举一致，增量更新与整体统计一致"""
+
+import re
+from collections import Counter, defaultdict
+
+import pytest
+
+from benchmarks.synthetic_export import iter_synthetic_messages
+from ngrams import _BOS, _EOS, _SENTENCE_SPLIT_PATTERN, NgramIndex, count_ngrams
+from utils import SingleCharStats, analyze_single_chars, iter_text_codes
+
+_LETTER = re.compile(r'^[\u4e00-\u9fffa-zA-Z]$')
+_PUNCTUATION = set('，。！？、；：""''（）,.!?;:\'"()[]【】《》<>…—～·')
+
+
+def _texts(n_messages, seed=42):
+    return [message['content']['text'] for message in iter_synthetic_messages(n_messages, n_users=20, seed=seed)]
+
+
+def _brute_force_ngrams(texts, min_freq, max_n=5):
+    """逐句枚举全部 n-gram 及其邻字（Counter 的插入顺序即首次出现的顺序）"""
+    freq = Counter()
+    left = defaultdict(Counter)
+    right = defaultdict(Counter)
+    total_chars = 0
+    for text in texts:
+        for sentence in _SENTENCE_SPLIT_PATTERN.split(text):
+            sentence = sentence.strip()
+            if len(sentence) < 2:
+                continue
+            total_chars += len(sentence)
+            for n in range(2, min(max_n, len(sentence)) + 1):
+                for i in range(len(sentence) - n + 1):
+                    ngram = sentence[i:i + n]
+                    if not ngram.strip():
+                        continue
+                    freq[ngram] += 1
+                    left[ngram][sentence[i - 1] if i > 0 else '<BOS>'] += 1
+                    right[ngram][sentence[i + n] if i + n < len(sentence) else '<EOS>'] += 1
+    kept = {word for word, count in freq.items() if count >= min_freq}
+    return ({word: freq[word] for word in kept},
+            {word: list(left[word].items()) for word in kept},
+            {word: list(right[word].items()) for word in kept},
+            total_chars)
+
+
+def _neighbors(stats, side):
+    """{词: [(邻字, 次数), ...]}，按首次出现的顺序"""
+    offsets, counts, codes = ((stats.left_offsets, stats.left_counts, stats.left_neighbors) if side == 'left'
+                              else (stats.right_offsets, stats.right_counts, stats.right_neighbors))
+    marks = {_BOS: '<BOS>', _EOS: '<EOS>'}
+    result = {}
+    for i, word in enumerate(stats.words):
+        start, stop = offsets[i], offsets[i + 1]
+        result[word] = [(marks.get(code, chr(code) if code < _BOS else None), count)
+                        for code, count in zip(codes[start:stop].tolist(), counts[start:stop].tolist())]
+    return result
+
+
+def _flatten(stats):
+    return (stats.words, stats.freqs.tolist(), _neighbors(stats, 'left'), _neighbors(stats, 'right'),
+            stats.total_chars)
+
+
+@pytest.mark.parametrize('min_freq', [1, 3])
+def test_count_ngrams_matches_brute_force(min_freq):
+    texts = _texts(800) + ['', '哈', '你好，世界！你好', 'ab cd\nab', '（括号）里面。。好好好好好好']
+    stats = count_ngrams(texts, min_freq)
+    freq, left, right, total_chars = _brute_force_ngrams(texts, min_freq)
+
+    assert stats.freq_map() == freq
+    assert _neighbors(stats, 'left') == left
+    assert _neighbors(stats, 'right') == right
+    assert stats.total_chars == total_chars
+
+
+def test_ngram_index_updates_without_rebuild():
+    texts = _texts(3000)
+    min_freq = 3
+    steps = [1200, 1500, 1900, 2300, 2600, 3000]
+    index = NgramIndex.build(texts[:1000], min_freq)
+    for stop in steps:
+        index, stats, report = index.update(texts[:stop], min_freq)
+        assert not report['rebuilt'], stop
+        assert _flatten(stats) == _flatten(count_ngrams(texts[:stop], min_freq))
+    # 单字独立性随索引一起增量累加
+    assert index.char_stats.result() == analyze_single_chars(texts)
+
+
+def _per_char_scan(texts):
+    """逐字判定的单字独立性"""
+    total_count = Counter()
+    solo_count = Counter()
+    boundary_count = Counter()
+    for text in texts:
+        letters = [char for char in text if _LETTER.match(char)]
+        total_count.update(letters)
+        if len(letters) == 1:
+            solo_count[letters[0]] += 1
+        for i, char in enumerate(text):
+            if not _LETTER.match(char):
+                continue
+            left_ok = i == 0 or text[i - 1] in _PUNCTUATION or text[i - 1].isspace()
+            right_ok = i == len(text) - 1 or text[i + 1] in _PUNCTUATION or text[i + 1].isspace()
+            if left_ok and right_ok:
+                boundary_count[char] += 1
+    result = {}
+    for char, total in total_count.items():
+        independent = solo_count[char] + boundary_count[char] * 0.5
+        result[char] = (total, independent, independent / total)
+    return result
+
+
+def test_single_char_stats_match_per_char_scan():
+    texts = _texts(1500) + ['好', ' a ', '【好】', '好…坏', 'x\ty']
+    stats = SingleCharStats()
+    # 分批累加与整体统计相同
+    for start in range(0, len(texts), 400):
+        for codes, lengths in iter_text_codes(texts[start:start + 400]):
+            stats.update(codes, lengths)
+
+    assert stats.result() == _per_char_scan(texts)
+    assert list(stats.result()) == list(_per_char_scan(texts))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""分词结果缓存：加入新词后重新切分，与整体重新分词一致"""
+
+import pytest
+
+from segmenter import AnalysisTokenizer, TokenCache
+
+
+def _texts(cache):
+    return [[cache.words[i] for i in cache.ids[start:stop]]
+            for start, stop in zip(cache.offsets[:-1], cache.offsets[1:])]
+
+
+def test_resegment_matches_full_segmentation_when_total_shifts():
+    # "管理方面" 的两种切分打分只差约 1.6%：词频总数增大约 2% 后整词胜出，尽管文本不含新词
+    texts = ['管理方面还要加强', '今天的群友发言好多', '群友发言', '国际机场在哪里', '我们开展活动吧', '管理方面还要加强']
+    tokenizer = AnalysisTokenizer()
+    cache = TokenCache(texts, tokenizer=tokenizer)
+    assert _texts(cache)[0][:2] == ['管理', '方面']
+
+    # 词组合并以 次数 * 1000 作为词频，合计超过原词频总数的 2%
+    user_words = [('群友发言', 2000 * 1000), ('今天的群', 1000)]
+    for word, freq in user_words:
+        tokenizer.add_word(word, freq=freq)
+    assert cache.resegment(texts, [word for word, _ in user_words], user_words) == 4
+
+    assert _texts(cache) == _texts(TokenCache(texts, tokenizer=tokenizer))
+    assert _texts(cache)[0][0] == '管理方面'
+
+
+def test_resegment_follows_jieba_fast_route():
+    # jieba_fast 用自己的 C 实现求最优路径，"多多 / 多" 与 "多 / 多多" 打分相同，选择随词频总数变化
+    pytest.importorskip('jieba_fast')
+    texts = ['多多多这想', '去个个个的是是', '你想个他大大大来', '今天的群友发言好多']
+    tokenizer = AnalysisTokenizer()
+    cache = TokenCache(texts, tokenizer=tokenizer)
+
+    user_words = [('群友发言', tokenizer.total // 100)]
+    for word, freq in user_words:
+        tokenizer.add_word(word, freq=freq)
+    cache.resegment(texts, [word for word, _ in user_words], user_words)
+
+    assert _texts(cache) == [[w.strip() for w in tokenizer.cut(text) if w.strip()] for text in texts]
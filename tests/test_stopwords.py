@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""停用词按配置缓存"""
+
+from analysis_config import AnalysisConfig
+from analyzer import load_stopwords
+
+
+def test_stopwords_follow_config():
+    base = AnalysisConfig.from_module(STOPWORDS_PATHS=(), STOPWORDS_WARN_IF_MISSING=False)
+    first = load_stopwords(force_enable=True, config=base.replace(STOPWORDS_MANUAL=('甲',)))
+    second = load_stopwords(force_enable=True, config=base.replace(STOPWORDS_MANUAL=('乙',)))
+
+    assert first == {'甲'}
+    assert second == {'乙'}
+    # 相同配置命中缓存
+    assert load_stopwords(force_enable=True, config=base.replace(STOPWORDS_MANUAL=('甲',))) is first
+    assert load_stopwords(force_enable=False, config=base) == set()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""上传的临时文件不写入解析缓存"""
+
+import importlib
+import importlib.util
+import io
+import os
+import sys
+
+import pytest
+
+from analysis_config import AnalysisConfig
+from benchmarks.synthetic_export import write_synthetic_export
+from message_table import load_message_table
+from personal_analyzer import load_personal_data
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def export_path(tmp_path):
+    path = tmp_path / 'export.json'
+    write_synthetic_export(str(path), 300, n_users=10)
+    return str(path)
+
+
+def _cache_files(cache_dir):
+    return sorted(os.listdir(cache_dir)) if os.path.isdir(cache_dir) else []
+
+
+def test_use_cache_false_leaves_cache_empty(tmp_path, export_path):
+    cache_dir = str(tmp_path / 'parse_cache')
+    config = AnalysisConfig.from_module(PARSE_CACHE_DIR=cache_dir, PARSE_WORKERS=1)
+
+    load_message_table(export_path, config=config, use_cache=False)
+    load_personal_data(export_path, '群友0', config=config, use_cache=False)
+    assert _cache_files(cache_dir) == []
+
+    # 对照：本地文件照常写入缓存
+    load_message_table(export_path, config=config)
+    assert any(name.endswith('.mtbl') for name in _cache_files(cache_dir))
+
+
+@pytest.fixture
+def backend_app(monkeypatch, tmp_path):
+    for name in ('flask', 'flask_cors', 'flask_limiter', 'dotenv', 'requests'):
+        pytest.importorskip(name)
+    monkeypatch.setenv('SECURITY_ENABLED', 'false')
+    monkeypatch.setenv('STORAGE_MODE', 'json')
+    if importlib.util.find_spec('config') is None:
+        # 没有 config.py 时使用示例配置
+        spec = importlib.util.spec_from_file_location('config', os.path.join(PROJECT_ROOT, 'config.example.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        monkeypatch.setitem(sys.modules, 'config', module)
+    monkeypatch.setattr(importlib.import_module('config'), 'TOKENIZER_WARMUP', False, raising=False)
+    monkeypatch.delitem(sys.modules, 'backend.app', raising=False)
+    app_mod = importlib.import_module('backend.app')
+    cache_dir = str(tmp_path / 'parse_cache')
+    monkeypatch.setattr(app_mod.config, 'PARSE_CACHE_DIR', cache_dir, raising=False)
+    monkeypatch.setattr(app_mod.config, 'PARSE_CACHE_ENABLED', True, raising=False)
+    return app_mod, cache_dir
+
+
+@pytest.mark.parametrize('route, form', [
+    ('/api/upload', {}),
+    ('/api/personal-report', {'target_name': '群友0'}),
+])
+def test_upload_leaves_cache_empty(backend_app, export_path, route, form):
+    app_mod, cache_dir = backend_app
+    with open(export_path, 'rb') as f:
+        content = f.read()
+
+    client = app_mod.app.test_client()
+    client.post(route, data={**form, 'file': (io.BytesIO(content), 'export.json')},
+                content_type='multipart/form-data')
+
+    assert _cache_files(cache_dir) == []
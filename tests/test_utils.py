@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""导出文件识别、压缩文件的解压大小上限与原子写入"""
+
+import gzip
+import json
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+from message_table import load_message_table
+from utils import DecompressedSizeError, atomic_write, is_export_file, load_json, open_export
+
+
+def test_is_export_file():
+    for name in ('export.json', 'EXPORT.JSON', 'a/b/chat.jsonl', 'chat.ndjson.zst', 'chat.json.gz', 'chat.json.zstd'):
+        assert is_export_file(name), name
+    for name in ('readme.txt', 'json', 'chat.gz', 'chat.txt.gz', 'chat.json.bz2', ''):
+        assert not is_export_file(name), name
+
+
+def test_is_export_file_with_allowed_extensions():
+    # 后端按配置限定允许上传的扩展名
+    assert is_export_file('chat.json.gz', ['json'], ['gz'])
+    assert not is_export_file('chat.json.zstd', ['json'], ['gz', 'zst'])
+    assert not is_export_file('chat.ndjson', ['json'], ['gz'])
+
+
+def _write_gzip_bomb(path, padding_mb):
+    # 合法的导出 JSON：消息之间填充大量空白，压缩后只有几十 KB
+    message = json.dumps({'messageId': '1', 'timestamp': '2024-01-01T00:00:00.000Z',
+                          'sender': {'uin': '1', 'name': 'a'}, 'content': {'text': '你好'}})
+    with gzip.open(path, 'wb') as f:
+        f.write(b'{"chatInfo": {"name": "x"}, "messages": [' + message.encode())
+        for _ in range(padding_mb):
+            f.write(b' ' * (1024 * 1024))
+        f.write(b']}')
+    return str(path)
+
+
+def test_open_export_limits_decompressed_size(tmp_path):
+    path = _write_gzip_bomb(tmp_path / 'bomb.json.gz', padding_mb=8)
+    assert os.path.getsize(path) < 64 * 1024
+
+    with pytest.raises(DecompressedSizeError):
+        with open_export(path, max_bytes=1024 * 1024) as f:
+            while f.read(256 * 1024):
+                pass
+    # 上限足够时照常读完
+    with open_export(path, max_bytes=16 * 1024 * 1024) as f:
+        assert json.load(f)['chatInfo']['name'] == 'x'
+
+
+def test_loaders_stop_at_configured_limit(tmp_path, monkeypatch):
+    path = _write_gzip_bomb(tmp_path / 'bomb.json.gz', padding_mb=8)
+    # 未传入配置时各加载函数经 resolve_config 读取 config 模块
+    monkeypatch.setitem(sys.modules, 'config', types.SimpleNamespace(MAX_DECOMPRESSED_SIZE_MB=1))
+
+    with pytest.raises(DecompressedSizeError):
+        load_message_table(path, use_cache=False, workers=1)
+    with pytest.raises(DecompressedSizeError):
+        load_json(path)
+
+
+def test_atomic_write_concurrent_threads(tmp_path):
+    path = str(tmp_path / 'shared.bin')
+    errors = []
+
+    def write(i):
+        try:
+            for _ in range(20):
+                with atomic_write(path) as f:
+                    f.write(bytes([i]) * 4096)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    with open(path, 'rb') as f:
+        data = f.read()
+    # 最终内容完整地来自某一次写入
+    assert len(data) == 4096 and len(set(data)) == 1
+    assert os.listdir(tmp_path) == ['shared.bin']
+
+
+def test_atomic_write_failure_keeps_old_file(tmp_path):
+    path = str(tmp_path / 'index.json')
+    with atomic_write(path, 'w', encoding='utf-8') as f:
+        f.write('旧内容')
+    with pytest.raises(RuntimeError):
+        with atomic_write(path, 'w', encoding='utf-8') as f:
+            f.write('写了一半')
+            raise RuntimeError
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == '旧内容'
+    assert os.listdir(tmp_path) == ['index.json']
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+分词词典预构建缓存
+
+jieba 第一次分词前要读取默认词典（约 35 万词）并构建前缀词典（约 50 万条），新进程中需要 0.5 秒以上；
+jieba 自带的 marshal 缓存在新进程中反序列化同样要 0.6 秒左右。这部分时间原本落在每个 worker 的第一个请求上。
+
+本模块把前缀词典和停用词文件预先序列化为 pickle（新进程中加载约 0.17 秒），在构建镜像时生成，
+进程启动时由 segmenter.base_tokenizer() 加载。gunicorn 在主进程中预热（gunicorn.conf.py 调用 analyzer.warm_up），
+只加载一次，fork 出的 worker 以写时复制共享这些内存页。
+
+缓存记录 jieba 实现、版本以及词典 / 停用词文件的大小和 mtime，与当前环境不符的部分直接忽略，照常从文件构建。
+
+用法:
+    python tokenizer_cache.py            # 构建缓存（写入配置 TOKENIZER_CACHE_FILE）
+    python tokenizer_cache.py --check    # 检查缓存能否在当前环境中使用
+"""
+
+import os
+import sys
+import time
+import pickle
+import argparse
+
+# 尝试导入 jieba_fast（更快），如果失败则回退到 jieba（标准版本）
+try:
+    import jieba_fast as jieba
+except ImportError:
+    import jieba
+
+from analysis_config import resolve_config
+from logger import get_logger
+from utils import atomic_write
+
+logger = get_logger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 进程内已加载的缓存内容；False 表示已尝试过但不可用
+_loaded = None
+
+
+def cache_path(path=None):
+    """缓存文件路径；未指定时读取配置 TOKENIZER_CACHE_FILE，相对路径相对于项目根目录，留空表示不使用缓存"""
+    if path is None:
+        path = resolve_config().TOKENIZER_CACHE_FILE
+    if not path:
+        return None
+    return path if os.path.isabs(path) else os.path.join(_BASE_DIR, path)
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _dictionary_key(tokenizer):
+    """词典标识：jieba 实现与版本、词典文件路径、大小和 mtime"""
+    path = tokenizer.dictionary
+    if path is None or path == getattr(jieba, 'DEFAULT_DICT', None):
+        path = os.path.join(os.path.dirname(jieba.__file__), getattr(jieba, 'DEFAULT_DICT_NAME', 'dict.txt'))
+    return [jieba.__name__, getattr(jieba, '__version__', ''), os.path.realpath(path), _file_stamp(path)]
+
+
+def read_stopword_file(path, encoding='utf-8'):
+    """读取停用词文件：每行一个词，忽略空行和 # 开头的行"""
+    with open(path, 'r', encoding=encoding) as f:
+        return {line.strip() for line in f if line.strip() and not line.startswith('#')}
+
+
+def build(path=None, config=None):
+    """
+    从词典文件构建前缀词典，连同停用词文件写入缓存（先写临时文件再原子替换）
+
+    Args:
+        path: 缓存文件路径；None 时读取配置 TOKENIZER_CACHE_FILE
+        config: AnalysisConfig（读取 STOPWORDS_PATHS / STOPWORDS_ENCODING）；None 时从 config 模块解析
+    Returns:
+        缓存文件路径
+    """
+    path = cache_path(path)
+    if path is None:
+        raise ValueError("未配置 TOKENIZER_CACHE_FILE")
+    config = resolve_config(config)
+
+    start = time.perf_counter()
+    tokenizer = jieba.Tokenizer()
+    freq, total = tokenizer.gen_pfdict(tokenizer.get_dict_file())
+
+    encoding = config.STOPWORDS_ENCODING
+    stopwords = {}
+    for stopwords_path in config.STOPWORDS_PATHS:
+        stopwords_path = os.path.realpath(os.path.join(_BASE_DIR, stopwords_path))
+        if os.path.exists(stopwords_path) and stopwords_path not in stopwords:
+            stopwords[stopwords_path] = (_file_stamp(stopwords_path), encoding,
+                                         frozenset(read_stopword_file(stopwords_path, encoding)))
+
+    payload = {
+        'format': CACHE_FORMAT_VERSION,
+        'dictionary': _dictionary_key(tokenizer),
+        'freq': freq,
+        'total': total,
+        'stopwords': stopwords,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_write(path) as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    logger.info(f"💾 分词词典缓存已写入: {path} ({len(freq)} 条, 停用词文件 {len(stopwords)} 个, "
+                f"{time.perf_counter() - start:.2f}s)")
+    return path
+
+
+def load(path=None):
+    """读取缓存内容（每个进程只读一次）；文件不存在、损坏或格式版本不符时返回 None"""
+    global _loaded
+    if _loaded is None:
+        _loaded = False
+        path = cache_path(path)
+        if path is not None and os.path.exists(path):
+            start = time.perf_counter()
+            try:
+                with open(path, 'rb') as f:
+                    payload = pickle.load(f)
+                if payload.get('format') == CACHE_FORMAT_VERSION:
+                    _loaded = payload
+                    logger.info(f"⚡ 已加载分词词典缓存 ({time.perf_counter() - start:.2f}s)")
+                else:
+                    logger.info(f"ℹ️ 分词词典缓存格式版本不符，忽略: {path}")
+            except Exception as e:
+                logger.warning(f"⚠️ 读取分词词典缓存失败，从词典文件构建: {e}")
+    return _loaded or None
+
+
+def install(tokenizer):
+    """
+    把缓存中的前缀词典装入尚未初始化的 jieba 分词器
+
+    Returns:
+        分词器已初始化（包括此前已经初始化）时返回 True；缓存不可用或与当前词典不符时返回 False
+    """
+    if tokenizer.initialized:
+        return True
+    payload = load()
+    if payload is None or payload['freq'] is None:
+        return False
+    matched = payload['dictionary'] == _dictionary_key(tokenizer)
+    if matched:
+        with tokenizer.lock:
+            if not tokenizer.initialized:
+                tokenizer.FREQ = payload['freq']
+                tokenizer.total = payload['total']
+                tokenizer.initialized = True
+    else:
+        logger.info("ℹ️ 分词词典缓存与当前 jieba / 词典不符，从词典文件构建")
+    # 前缀词典只装入一次（已归分词器所有或不可用），缓存内容中只保留停用词
+    payload['freq'] = None
+    return matched
+
+
+def stopword_file(path, encoding='utf-8'):
+    """读取停用词文件，文件与缓存时一致则直接使用缓存中的词表"""
+    payload = load()
+    if payload is not None:
+        entry = payload['stopwords'].get(os.path.realpath(path))
+        if entry is not None and entry[0] == _file_stamp(path) and entry[1] == encoding:
+            return set(entry[2])
+    return read_stopword_file(path, encoding)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分词词典预构建缓存')
+    parser.add_argument('--output', help='缓存文件路径（默认读取配置 TOKENIZER_CACHE_FILE）')
+    parser.add_argument('--check', action='store_true', help='只检查缓存能否在当前环境中使用')
+    args = parser.parse_args()
+
+    if args.check:
+        payload = load(args.output)
+        if payload is None:
+            print(f"缓存不存在或不可用: {cache_path(args.output)}")
+            return 1
+        if payload['dictionary'] != _dictionary_key(jieba.dt):
+            print(f"缓存与当前 jieba / 词典不符: {payload['dictionary']}")
+            return 1
+        print(f"缓存可用: {cache_path(args.output)} ({len(payload['freq'])} 条, "
+              f"停用词文件 {len(payload['stopwords'])} 个)")
+        return 0
+
+    build(args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,232 +1,692 @@
 # -*- coding: utf-8 -*-
+import io
+import os
 import re
+import gzip
 import json
 import math
+import tempfile
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
-from collections import Counter
+
+import numpy as np
+
+from analysis_config import resolve_config
 from logger import get_logger
+from message_table import count_first_seen
+
+# zstd 压缩的导出文件需要 zstandard（可选依赖）
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 logger = get_logger(__name__)
 
-def load_json(filepath):
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_COMPRESSION_SUFFIXES = ('.gz', '.zst', '.zstd')
+_NDJSON_SUFFIXES = ('.ndjson', '.jsonl')
+# 支持的导出文件扩展名和压缩扩展名（不带点）
+EXPORT_EXTENSIONS = ('json',) + tuple(suffix[1:] for suffix in _NDJSON_SUFFIXES)
+COMPRESSION_EXTENSIONS = tuple(suffix[1:] for suffix in _COMPRESSION_SUFFIXES)
+# 未配置 MAX_DECOMPRESSED_SIZE_MB 时，解压后大小上限为上传大小上限的倍数
+_DECOMPRESSED_SIZE_RATIO = 10
+# 探测 NDJSON 时读取的（解压后）字节数
+_SNIFF_BYTES = 64 * 1024
+# mkstemp 创建的文件权限为 0600，atomic_write 改为与 open() 相同的 0666 & ~umask（os.umask 只能设置，读取后还原）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# ijson 后端优先级：C 扩展最快，纯 Python 实现最慢
+_IJSON_BACKEND_PREFERENCE = ('yajl2_c', 'yajl2_cffi', 'yajl2', 'python')
+_IJSON_FAST_BACKENDS = ('yajl2_c', 'yajl2_cffi')
+_IJSON_BUF_SIZE = 256 * 1024
+_ijson_backend = None
+
+
+def get_ijson_backend(name=None):
+    """
+    获取 ijson 解析后端
+
+    Args:
+        name: 指定后端名称；为 None 时按优先级选择可用的最快后端
+
+    Returns:
+        ijson 后端模块（未安装 ijson 时抛出 ImportError）
+    """
+    global _ijson_backend
+    import ijson
+
+    if name is not None:
+        return ijson.get_backend(name)
+    if _ijson_backend is not None:
+        return _ijson_backend
+
+    for candidate in _IJSON_BACKEND_PREFERENCE:
+        try:
+            backend = ijson.get_backend(candidate)
+        except Exception:
+            continue
+        if candidate in _IJSON_FAST_BACKENDS:
+            logger.debug(f"ijson 后端: {candidate}")
+        else:
+            logger.warning(
+                f"⚠️ ijson C 后端 (yajl2_c / yajl2_cffi) 不可用，回退到 {candidate} 后端，大文件解析会明显变慢"
+            )
+        _ijson_backend = backend
+        return backend
+
+    raise ImportError("没有可用的 ijson 后端")
+
+
+def detect_compression(filepath):
+    """按文件头魔数识别压缩格式：'gzip'、'zstd'，未压缩返回 None"""
+    with open(filepath, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(_GZIP_MAGIC):
+        return 'gzip'
+    if magic == _ZSTD_MAGIC:
+        return 'zstd'
+    return None
+
+
+class DecompressedSizeError(ValueError):
+    """压缩的导出文件解压后超过大小上限"""
+
+
+def max_decompressed_bytes(cfg=None):
+    """
+    压缩的导出文件解压后的字节数上限；None 表示不限制
+
+    MAX_DECOMPRESSED_SIZE_MB 为 None 时取上传大小上限（环境变量 MAX_UPLOAD_SIZE_MB，默认 1024）的 10 倍
+    """
+    limit_mb = resolve_config(cfg).MAX_DECOMPRESSED_SIZE_MB
+    if limit_mb is None:
+        limit_mb = _DECOMPRESSED_SIZE_RATIO * int(os.getenv('MAX_UPLOAD_SIZE_MB', '1024'))
+    return int(limit_mb * 1024 * 1024) if limit_mb else None
+
+
+class _SizeLimitedReader(io.RawIOBase):
+    """统计读出的字节数，超过 max_bytes 时抛出 DecompressedSizeError"""
+
+    def __init__(self, raw, max_bytes, filepath):
+        self._raw = raw
+        self._max_bytes = max_bytes
+        self._filepath = filepath
+        self._read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._raw.readinto(b)
+        self._read += n or 0
+        if self._read > self._max_bytes:
+            raise DecompressedSizeError(
+                f"解压后的导出文件超过 {self._max_bytes / 1024 / 1024:.0f} MB 上限"
+                f"（MAX_DECOMPRESSED_SIZE_MB）: {self._filepath}"
+            )
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+        super().close()
+
+
+def open_export(filepath, max_bytes=None):
+    """
+    以二进制流打开导出文件；gzip / zstd 压缩的文件按魔数识别并流式解压，不解压到临时文件
+
+    解压后的字节数超过 max_bytes（None 时按配置 MAX_DECOMPRESSED_SIZE_MB，见 max_decompressed_bytes）
+    时读取抛出 DecompressedSizeError，压缩比极高的文件不会无限制地展开。
+    """
+    compression = detect_compression(filepath)
+    if compression == 'gzip':
+        stream = gzip.open(filepath, 'rb')
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("读取 zstd 压缩的导出文件需要安装 zstandard: pip install zstandard")
+        stream = zstandard.ZstdDecompressor().stream_reader(open(filepath, 'rb'), read_across_frames=True,
+                                                            closefd=True)
+    else:
+        return open(filepath, 'rb')
+
+    if max_bytes is None:
+        max_bytes = max_decompressed_bytes()
+    if not max_bytes:
+        return stream
+    return io.BufferedReader(_SizeLimitedReader(stream, max_bytes, filepath))
+
+
+def is_export_file(filename, extensions=EXPORT_EXTENSIONS, compressions=COMPRESSION_EXTENSIONS):
+    """
+    按文件名判断是否为导出文件：扩展名在 extensions 中，之后可以再带一个 compressions 中的压缩扩展名（如 export.json.gz）
+
+    extensions / compressions 为不带点的小写扩展名，默认为全部支持的格式；后端按配置传入允许上传的范围。
+    """
+    base, dot, ext = os.path.basename(str(filename)).rpartition('.')
+    if not dot:
+        return False
+    ext = ext.lower()
+    if ext in compressions and '.' in base:
+        ext = base.rsplit('.', 1)[1].lower()
+    return ext in extensions
+
+
+def detect_export_format(filepath):
+    """
+    识别导出文件格式：'json'（QQChatExporter 导出的完整对象）或 'ndjson'（每行一条消息）
+
+    .ndjson / .jsonl（可带压缩后缀）直接视为 NDJSON；否则探测首行：
+    首行本身是一个完整的 JSON 对象且不含 messages 时视为 NDJSON。
+    NDJSON 中可以有一行 {"chatInfo": {...}} 提供群信息。
+    """
+    name = str(filepath).lower()
+    for suffix in _COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    if name.endswith(_NDJSON_SUFFIXES):
+        return 'ndjson'
+
+    with open_export(filepath) as f:
+        head = f.read(_SNIFF_BYTES)
+    first_line, newline, _ = head.lstrip(b'\xef\xbb\xbf \t\r\n').partition(b'\n')
+    if not newline and len(head) >= _SNIFF_BYTES:
+        return 'json'
+    try:
+        first = json.loads(first_line)
+    except ValueError:
+        return 'json'
+    return 'ndjson' if isinstance(first, dict) and 'messages' not in first else 'json'
+
+
+def _parse_events(ijson_backend, f, export_format):
+    """按格式生成 ijson 事件流；NDJSON 每行一个顶层值，消息前缀为空串"""
+    if export_format == 'ndjson':
+        return ijson_backend.parse(f, buf_size=_IJSON_BUF_SIZE, multiple_values=True)
+    return ijson_backend.parse(f, buf_size=_IJSON_BUF_SIZE)
+
+
+def _items_prefix(export_format):
+    return '' if export_format == 'ndjson' else 'messages.item'
+
+
+class _ExportStreamParser:
+    """
+    表驱动的流式解析器
+
+    按 (prefix, event) 查预编译的处理函数表进行分发，只保留分析需要的字段。
+    未登记的事件只付出一次字典查找的开销。
+    items_prefix 为空串时解析 NDJSON（每个顶层值是一条消息）。
+    """
+
+    def __init__(self, items_prefix='messages.item'):
+        self.chat_info = {}
+        self.message_count = 0
+        self._message = None
+        self._element = None
+        self._handlers = self._build_handlers(items_prefix)
+
+    def _build_handlers(self, p):
+        # 消息内字段的前缀；NDJSON 的消息位于顶层，字段前缀没有 '.'
+        m = p + '.' if p else ''
+        e = m + 'rawMessage.elements.item'
+        table = {
+            ('chatInfo.name', 'string'): self._on_chat_name,
+
+            (p, 'start_map'): self._on_message_start,
+            (p, 'end_map'): self._on_message_end,
+
+            # 消息 ID / 时间戳 / 发送者
+            (m + 'messageId', 'string'): self._on_message_id,
+            (m + 'timestamp', 'string'): self._on_timestamp,
+            (m + 'timestamp', 'number'): self._on_timestamp,
+            (m + 'sender.uin', 'string'): self._on_sender_uin,
+            (m + 'sender.name', 'string'): self._on_sender_name,
+
+            # 内容
+            (m + 'content.text', 'string'): self._on_text,
+            (m + 'content.resources', 'start_array'): self._on_resources,
+            (m + 'content.resources', 'null'): self._on_resources,
+            (m + 'content.resources.item', 'start_map'): self._on_resource_item,
+            (m + 'content.resources.item.type', 'string'): self._on_resource_type,
+            (m + 'content.emojis', 'start_array'): self._on_emojis,
+            (m + 'content.emojis.item', 'string'): self._on_emoji_item,
+            (m + 'content.emojis.item', 'start_map'): self._on_emoji_map,
+            (m + 'content.mentions', 'start_array'): self._on_mentions,
+            (m + 'content.mentions', 'null'): self._on_mentions,
+            (m + 'content.mentions.item', 'start_map'): self._on_mention_item,
+            (m + 'content.mentions.item.uid', 'string'): self._on_mention_uid,
+            (m + 'content.multiForward', 'start_map'): self._on_multi_forward,
+            (m + 'content.reply.referencedMessageId', 'string'): self._on_reply_reference,
+
+            # rawMessage 中的关键字段
+            (m + 'rawMessage.subMsgType', 'number'): self._on_sub_msg_type,
+            (m + 'rawMessage.sendMemberName', 'string'): self._on_send_member_name,
+            (m + 'rawMessage.elements', 'start_array'): self._on_elements,
+
+            # elements
+            (e, 'start_map'): self._on_element_start,
+            (e, 'end_map'): self._on_element_end,
+            (e + '.elementType', 'number'): self._on_element_type,
+            (e + '.textElement', 'start_map'): self._on_text_element,
+            (e + '.textElement', 'null'): self._on_text_element,
+            (e + '.textElement.atType', 'number'): self._on_at_type,
+            (e + '.textElement.atUid', 'string'): self._on_at_uid,
+            (e + '.textElement.content', 'string'): self._on_text_element_content,
+            (e + '.picElement', 'start_map'): self._on_pic_element,
+            (e + '.picElement', 'null'): self._on_pic_element,
+            (e + '.picElement.summary', 'string'): self._on_pic_summary,
+            (e + '.replyElement', 'start_map'): self._on_reply_element,
+            (e + '.replyElement', 'null'): self._on_reply_element,
+            (e + '.replyElement.sourceMsgIdInRecords', 'string'): self._on_reply_source_id,
+            (e + '.replyElement.replayMsgId', 'string'): self._on_reply_replay_id,
+            (e + '.replyElement.senderUid', 'string'): self._on_reply_sender_uid,
+            (e + '.replyElement.senderUid', 'number'): self._on_reply_sender_uid,
+            (e + '.arkElement', 'start_map'): self._on_ark_element,
+            (e + '.multiForwardMsgElement', 'start_map'): self._on_multi_forward_element,
+        }
+        # 按 prefix 分两级索引：绝大多数事件在第一级即未命中，无需构造元组键
+        handlers = {}
+        for (prefix, event), handler in table.items():
+            handlers.setdefault(prefix, {})[event] = handler
+        return handlers
+
+    def iter_messages(self, events):
+        """消费 ijson 事件流，逐条产出精简后的消息"""
+        handlers = self._handlers
+        for prefix, event, value in events:
+            by_event = handlers.get(prefix)
+            if by_event is not None:
+                handler = by_event.get(event)
+                if handler is not None:
+                    message = handler(value)
+                    if message is not None:
+                        yield message
+
+    # ---- 辅助 ----
+
+    def _content(self):
+        content = self._message.get('content')
+        if content is None:
+            content = self._message['content'] = {}
+        return content
+
+    def _raw(self):
+        raw = self._message.get('rawMessage')
+        if raw is None:
+            raw = self._message['rawMessage'] = {}
+        return raw
+
+    def _sub_element(self, key):
+        sub = self._element.get(key)
+        if sub is None:
+            sub = self._element[key] = {}
+        return sub
+
+    # ---- 群信息 / 消息边界 ----
+
+    def _on_chat_name(self, value):
+        self.chat_info['name'] = value
+
+    def _on_message_start(self, value):
+        self._message = {}
+        self.message_count += 1
+        if self.message_count % 10000 == 0:
+            logger.debug(f"   已处理 {self.message_count} 条消息...")
+
+    def _on_message_end(self, value):
+        message, self._message = self._message, None
+        if message:
+            return message
+
+    # ---- 基础字段 ----
+
+    def _on_message_id(self, value):
+        self._message['messageId'] = value
+
+    def _on_timestamp(self, value):
+        self._message['timestamp'] = str(value)
+
+    def _on_sender_uin(self, value):
+        self._message.setdefault('sender', {})['uin'] = value
+
+    def _on_sender_name(self, value):
+        self._message.setdefault('sender', {})['name'] = value
+
+    # ---- content ----
+
+    def _on_text(self, value):
+        self._content()['text'] = value
+
+    def _on_resources(self, value):
+        self._content().setdefault('resources', [])
+
+    def _on_resource_item(self, value):
+        self._content().setdefault('resources', []).append({})
+
+    def _on_resource_type(self, value):
+        resources = self._content().get('resources')
+        if resources:
+            resources[-1]['type'] = value
+
+    def _on_emojis(self, value):
+        self._content()['emojis'] = []
+
+    def _on_emoji_item(self, value):
+        emojis = self._content().get('emojis')
+        if emojis is not None:
+            emojis.append(value)
+
+    def _on_emoji_map(self, value):
+        emojis = self._content().get('emojis')
+        if emojis is not None:
+            emojis.append({})
+
+    def _on_mentions(self, value):
+        self._content().setdefault('mentions', [])
+
+    def _on_mention_item(self, value):
+        self._content().setdefault('mentions', []).append({})
+
+    def _on_mention_uid(self, value):
+        mentions = self._content().get('mentions')
+        if mentions:
+            mentions[-1]['uid'] = value
+
+    def _on_multi_forward(self, value):
+        self._content()['multiForward'] = {}
+
+    def _on_reply_reference(self, value):
+        self._content().setdefault('reply', {})['referencedMessageId'] = value
+
+    # ---- rawMessage ----
+
+    def _on_sub_msg_type(self, value):
+        self._raw()['subMsgType'] = value
+
+    def _on_send_member_name(self, value):
+        self._raw()['sendMemberName'] = value
+
+    def _on_elements(self, value):
+        self._raw()['elements'] = []
+
+    def _on_element_start(self, value):
+        self._element = {}
+
+    def _on_element_end(self, value):
+        element, self._element = self._element, None
+        if element:
+            self._message['rawMessage']['elements'].append(element)
+
+    def _on_element_type(self, value):
+        if self._element is not None:
+            self._element['elementType'] = value
+
+    # textElement（文本/艾特）
+    def _on_text_element(self, value):
+        if self._element is not None:
+            self._sub_element('textElement')
+
+    def _on_at_type(self, value):
+        if self._element is not None:
+            self._sub_element('textElement')['atType'] = value
+
+    def _on_at_uid(self, value):
+        if self._element is not None:
+            self._sub_element('textElement')['atUid'] = value
+
+    def _on_text_element_content(self, value):
+        if self._element is not None:
+            self._sub_element('textElement')['content'] = value
+
+    # picElement（图片）
+    def _on_pic_element(self, value):
+        if self._element is not None:
+            self._sub_element('picElement')
+
+    def _on_pic_summary(self, value):
+        if self._element is not None:
+            self._sub_element('picElement')['summary'] = value
+
+    # replyElement（回复）
+    def _on_reply_element(self, value):
+        if self._element is not None:
+            self._sub_element('replyElement')
+
+    def _on_reply_source_id(self, value):
+        if self._element is not None:
+            self._sub_element('replyElement')['sourceMsgIdInRecords'] = value
+
+    def _on_reply_replay_id(self, value):
+        if self._element is not None:
+            self._sub_element('replyElement')['replayMsgId'] = value
+
+    def _on_reply_sender_uid(self, value):
+        if self._element is not None:
+            self._sub_element('replyElement')['senderUid'] = str(value)
+
+    # arkElement（链接/小程序）、multiForwardMsgElement（合并转发）
+    def _on_ark_element(self, value):
+        if self._element is not None:
+            self._element['arkElement'] = {}
+
+    def _on_multi_forward_element(self, value):
+        if self._element is not None:
+            self._element['multiForwardMsgElement'] = {}
+
+
+def _load_standard(filepath):
+    """标准加载（非流式）：返回完整的 {'messages', 'chatInfo'}，支持压缩文件和 NDJSON"""
+    try:
+        with io.TextIOWrapper(open_export(filepath), encoding='utf-8-sig') as f:
+            if detect_export_format(filepath) != 'ndjson':
+                return json.load(f)
+            messages = []
+            chat_info = {}
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                if not isinstance(item, dict):
+                    continue
+                if 'chatInfo' in item:
+                    chat_info.update(item.get('chatInfo') or {})
+                else:
+                    messages.append(item)
+            return {'messages': messages, 'chatInfo': chat_info}
+    except MemoryError:
+        logger.error("❌ 文件过大，无法加载到内存")
+        raise MemoryError("JSON 文件过大，请减小文件大小或增加系统内存")
+
+
+def _iter_loaded_messages(filepath, chat_info):
+    """标准加载（非流式）后逐条产出消息，作为流式解析的兜底"""
+    data = _load_standard(filepath)
+    chat_info.update(data.get('chatInfo') or {})
+    yield from data.get('messages', [])
+
+
+def read_chat_name(filepath, backend=None):
+    """
+    只读取导出文件的群名（chatInfo.name），不解析消息；没有群名时返回 '未知群聊'
+
+    QQChatExporter 导出的 chatInfo 位于 messages 之前，读到群名即停止；群名在消息之后时需要扫描整个文件。
+    """
+    try:
+        ijson_backend = get_ijson_backend(backend)
+    except ImportError:
+        return (_load_standard(filepath).get('chatInfo') or {}).get('name') or '未知群聊'
+
+    export_format = detect_export_format(filepath)
+    with open_export(filepath) as f:
+        for prefix, event, value in _parse_events(ijson_backend, f, export_format):
+            if prefix == 'chatInfo.name' and event == 'string':
+                return value or '未知群聊'
+    return '未知群聊'
+
+
+def iter_messages(filepath, chat_info=None, backend=None, message_filter=None):
+    """
+    惰性加载：逐条产出精简后的消息，不在内存中保留完整消息列表
+
+    Args:
+        filepath: 导出文件路径
+        chat_info: 可选的 dict，解析到的群信息会写入其中（群名可能位于 messages 之后，
+                   因此只有在迭代结束后才保证完整）
+        backend: 指定 ijson 后端名称
+        message_filter: 可选的 MessageFilter，被拒绝的消息在解析完成时即丢弃
+
+    流式解析在产出第一条消息之前失败时会回退到标准加载；已经产出消息后失败，或解压后超过大小上限时直接抛出异常。
+    """
+    if chat_info is None:
+        chat_info = {}
+    if message_filter is not None:
+        yield from message_filter.filter(iter_messages(filepath, chat_info, backend))
+        return
+
+    try:
+        ijson_backend = get_ijson_backend(backend)
+    except ImportError:
+        logger.warning("⚠️ ijson 未安装，使用标准加载（大文件可能导致内存不足）")
+        yield from _iter_loaded_messages(filepath, chat_info)
+        return
+
+    logger.info("📖 使用流式解析逐条读取 JSON 文件...")
+    yielded = 0
+    try:
+        export_format = detect_export_format(filepath)
+        parser = _ExportStreamParser(items_prefix=_items_prefix(export_format))
+        parser.chat_info = chat_info
+        with open_export(filepath) as f:
+            for message in parser.iter_messages(_parse_events(ijson_backend, f, export_format)):
+                yielded += 1
+                yield message
+    except Exception as e:
+        if yielded or isinstance(e, DecompressedSizeError):
+            raise
+        logger.warning(f"⚠️ 流式解析失败，尝试标准加载: {e}")
+        yield from _iter_loaded_messages(filepath, chat_info)
+
+    if not chat_info.get('name'):
+        chat_info['name'] = '未知群聊'
+    logger.info(f"✅ 流式读取 {yielded} 条消息, 群聊: {chat_info['name']}")
+
+
+def load_json(filepath, backend=None, lazy=False, workers=None, message_filter=None, config=None):
     """
     使用流式解析加载 JSON 文件，减少内存占用
     对于大文件，只保留必要的字段
+
+    Args:
+        filepath: 导出文件路径
+        backend: 指定 ijson 后端名称（默认自动选择最快的可用后端）
+        lazy: 为 True 时 messages 为逐条产出消息的迭代器（见 iter_messages），
+              ChatAnalyzer 会以单遍流式方式消费
+        workers: 并行解析的进程数（None 时读取配置 PARSE_WORKERS，0 表示全部核心），
+                 大于 1 时大文件按段并行解析（见 parallel_loader），结果与串行一致
+        message_filter: 可选的 MessageFilter（时间范围 / 发送者 / 机器人），
+                        被拒绝的消息在流式解析时即丢弃；返回的 dict 中以 messageFilter 附带该过滤器
+        config: 可选的 AnalysisConfig，workers 为 None 时取其中的 PARSE_WORKERS
     """
+    if workers is None and config is not None:
+        workers = config.PARSE_WORKERS
+    if message_filter is not None and not message_filter.is_noop:
+        result = _load_json(filepath, backend, lazy, workers, message_filter)
+        result['messageFilter'] = message_filter
+        if not lazy:
+            message_filter.log_summary(len(result['messages']))
+        return result
+    return _load_json(filepath, backend, lazy, workers)
+
+
+def _load_json(filepath, backend, lazy, workers, message_filter=None):
+    if lazy:
+        chat_info = {}
+        return {
+            'messages': iter_messages(filepath, chat_info, backend, message_filter),
+            'chatInfo': chat_info
+        }
+
+    from parallel_loader import load_parallel, resolve_workers
+    parallel = load_parallel(filepath, resolve_workers(workers), backend, message_filter=message_filter)
+    if parallel is not None:
+        messages, chat_info = parallel
+        return {'messages': messages, 'chatInfo': chat_info}
+
     try:
-        import ijson
+        ijson_backend = get_ijson_backend(backend)
         logger.info("📖 使用流式解析加载 JSON 文件...")
-        
-        with open(filepath, 'rb') as f:
-            parser = ijson.parse(f)
+
+        export_format = detect_export_format(filepath)
+        parser = _ExportStreamParser(items_prefix=_items_prefix(export_format))
+        with open_export(filepath) as f:
+            events = _parse_events(ijson_backend, f, export_format)
+            messages = parser.iter_messages(events)
+            if message_filter is not None:
+                messages = message_filter.filter(messages)
             result = {
-                'messages': [],
-                'chatInfo': {}
+                'messages': list(messages),
+                'chatInfo': parser.chat_info
             }
-            
-            current_message = None
-            current_element = None
-            in_messages = False
-            in_elements = False
-            message_count = 0
-            
-            for prefix, event, value in parser:
-                if prefix == 'chatInfo.name' and event == 'string':
-                    result['chatInfo']['name'] = value
-                
-                elif prefix == 'messages' and event == 'start_array':
-                    in_messages = True
-                elif prefix == 'messages' and event == 'end_array':
-                    in_messages = False
-                
-                elif in_messages:
-                    if prefix == 'messages.item' and event == 'start_map':
-                        current_message = {}
-                        message_count += 1
-                        if message_count % 10000 == 0:
-                            logger.debug(f"   已处理 {message_count} 条消息...")
-                    
-                    elif prefix == 'messages.item' and event == 'end_map':
-                        if current_message:
-                            result['messages'].append(current_message)
-                            current_message = None
-                    
-                    # 保留必要字段
-                    elif current_message is not None:
-                        # 消息 ID
-                        if prefix == 'messages.item.messageId' and event == 'string':
-                            current_message['messageId'] = value
-                        
-                        # 时间戳
-                        elif prefix == 'messages.item.timestamp' and event in ('string', 'number'):
-                            current_message['timestamp'] = str(value)
-                        
-                        # 发送者信息
-                        elif prefix == 'messages.item.sender.uin' and event == 'string':
-                            if 'sender' not in current_message:
-                                current_message['sender'] = {}
-                            current_message['sender']['uin'] = value
-                        elif prefix == 'messages.item.sender.name' and event == 'string':
-                            if 'sender' not in current_message:
-                                current_message['sender'] = {}
-                            current_message['sender']['name'] = value
-                        
-                        # 内容
-                        elif prefix == 'messages.item.content.text' and event == 'string':
-                            if 'content' not in current_message:
-                                current_message['content'] = {}
-                            current_message['content']['text'] = value
-                        
-                        # resources（图片等资源）
-                        elif prefix.startswith('messages.item.content.resources'):
-                            if 'content' not in current_message:
-                                current_message['content'] = {}
-                            if 'resources' not in current_message['content']:
-                                current_message['content']['resources'] = []
-                            
-                            if prefix == 'messages.item.content.resources.item' and event == 'start_map':
-                                current_message['content']['resources'].append({})
-                            elif prefix.endswith('.type') and event == 'string':
-                                if current_message['content']['resources']:
-                                    current_message['content']['resources'][-1]['type'] = value
-                        
-                        # emojis
-                        elif prefix == 'messages.item.content.emojis' and event == 'start_array':
-                            if 'content' not in current_message:
-                                current_message['content'] = {}
-                            current_message['content']['emojis'] = []
-                        elif prefix == 'messages.item.content.emojis.item' and event in ('string', 'start_map'):
-                            if 'content' in current_message and 'emojis' in current_message['content']:
-                                current_message['content']['emojis'].append({} if event == 'start_map' else value)
-                        
-                        # mentions
-                        elif prefix.startswith('messages.item.content.mentions'):
-                            if 'content' not in current_message:
-                                current_message['content'] = {}
-                            if 'mentions' not in current_message['content']:
-                                current_message['content']['mentions'] = []
-                            
-                            if prefix == 'messages.item.content.mentions.item' and event == 'start_map':
-                                current_message['content']['mentions'].append({})
-                            elif prefix.endswith('.uid') and event == 'string':
-                                if current_message['content']['mentions']:
-                                    current_message['content']['mentions'][-1]['uid'] = value
-                        
-                        # multiForward
-                        elif prefix == 'messages.item.content.multiForward' and event == 'start_map':
-                            if 'content' not in current_message:
-                                current_message['content'] = {}
-                            current_message['content']['multiForward'] = {}
-                        
-                        # 回复信息
-                        elif prefix == 'messages.item.content.reply.referencedMessageId' and event == 'string':
-                            if 'content' not in current_message:
-                                current_message['content'] = {}
-                            if 'reply' not in current_message['content']:
-                                current_message['content']['reply'] = {}
-                            current_message['content']['reply']['referencedMessageId'] = value
-                        
-                        # rawMessage 中的关键字段
-                        elif prefix == 'messages.item.rawMessage.subMsgType' and event == 'number':
-                            if 'rawMessage' not in current_message:
-                                current_message['rawMessage'] = {}
-                            current_message['rawMessage']['subMsgType'] = value
-                        elif prefix == 'messages.item.rawMessage.sendMemberName' and event == 'string':
-                            if 'rawMessage' not in current_message:
-                                current_message['rawMessage'] = {}
-                            current_message['rawMessage']['sendMemberName'] = value
-                        
-                        # 完整保留 elements
-                        elif prefix == 'messages.item.rawMessage.elements' and event == 'start_array':
-                            if 'rawMessage' not in current_message:
-                                current_message['rawMessage'] = {}
-                            current_message['rawMessage']['elements'] = []
-                            in_elements = True
-                        
-                        elif prefix == 'messages.item.rawMessage.elements' and event == 'end_array':
-                            in_elements = False
-                        
-                        elif in_elements:
-                            if prefix == 'messages.item.rawMessage.elements.item' and event == 'start_map':
-                                current_element = {}
-                            
-                            elif prefix == 'messages.item.rawMessage.elements.item' and event == 'end_map':
-                                if current_element:
-                                    current_message['rawMessage']['elements'].append(current_element)
-                                    current_element = None
-                            
-                            # 元素类型
-                            elif prefix == 'messages.item.rawMessage.elements.item.elementType' and event == 'number':
-                                if current_element is not None:
-                                    current_element['elementType'] = value
-                            
-                            # textElement（文本/艾特）
-                            elif prefix.startswith('messages.item.rawMessage.elements.item.textElement'):
-                                if current_element is not None:
-                                    if 'textElement' not in current_element:
-                                        current_element['textElement'] = {}
-                                    
-                                    if prefix.endswith('.atType') and event == 'number':
-                                        current_element['textElement']['atType'] = value
-                                    elif prefix.endswith('.atUid') and event == 'string':
-                                        current_element['textElement']['atUid'] = value
-                                    elif prefix.endswith('.content') and event == 'string':
-                                        current_element['textElement']['content'] = value
-                            
-                            # picElement（图片）
-                            elif prefix.startswith('messages.item.rawMessage.elements.item.picElement'):
-                                if current_element is not None:
-                                    if 'picElement' not in current_element:
-                                        current_element['picElement'] = {}
-                                    
-                                    if prefix.endswith('.summary') and event == 'string':
-                                        current_element['picElement']['summary'] = value
-                            
-                            # replyElement（回复）
-                            elif prefix.startswith('messages.item.rawMessage.elements.item.replyElement'):
-                                if current_element is not None:
-                                    if 'replyElement' not in current_element:
-                                        current_element['replyElement'] = {}
-                                    
-                                    if prefix.endswith('.sourceMsgIdInRecords') and event == 'string':
-                                        current_element['replyElement']['sourceMsgIdInRecords'] = value
-                                    elif prefix.endswith('.replayMsgId') and event == 'string':
-                                        current_element['replyElement']['replayMsgId'] = value
-                                    elif prefix.endswith('.senderUid') and event in ('string', 'number'):
-                                        current_element['replyElement']['senderUid'] = str(value)                            
-
-                            # arkElement（链接/小程序）
-                            elif prefix == 'messages.item.rawMessage.elements.item.arkElement' and event == 'start_map':
-                                if current_element is not None:
-                                    current_element['arkElement'] = {}
-                            
-                            # multiForwardMsgElement（合并转发）
-                            elif prefix == 'messages.item.rawMessage.elements.item.multiForwardMsgElement' and event == 'start_map':
-                                if current_element is not None:
-                                    current_element['multiForwardMsgElement'] = {}
-        
+
         # 确保群名有值
         chat_name = result['chatInfo'].get('name', '未知群聊')
         if not chat_name:
             chat_name = '未知群聊'
             result['chatInfo']['name'] = chat_name
-            
+
         logger.info(f"✅ 成功加载 {len(result['messages'])} 条消息, 群聊: {chat_name}")
         return result
-        
+
     except ImportError:
         logger.warning("⚠️ ijson 未安装，使用标准加载（大文件可能导致内存不足）")
-        with open(filepath, 'r', encoding='utf-8-sig') as f:
-            return json.load(f)
+        return _filter_loaded(_load_standard(filepath), message_filter)
+    except DecompressedSizeError:
+        raise
     except Exception as e:
         logger.warning(f"⚠️ 流式解析失败，尝试标准加载: {e}")
-        try:
-            with open(filepath, 'r', encoding='utf-8-sig') as f:
-                return json.load(f)
-        except MemoryError:
-            logger.error("❌ 文件过大，无法加载到内存")
-            raise MemoryError("JSON 文件过大，请减小文件大小或增加系统内存")
-        
+        return _filter_loaded(_load_standard(filepath), message_filter)
+
+
+def _filter_loaded(data, message_filter):
+    """标准加载得到的完整数据按过滤条件筛选 messages"""
+    if message_filter is not None:
+        # 失败重试前已计入的条数作废
+        message_filter.dropped.clear()
+        data['messages'] = list(message_filter.filter(data.get('messages', [])))
+    return data
+
+@contextmanager
+def atomic_write(path, mode='wb', encoding=None):
+    """
+    先写同目录下的临时文件，with 块正常结束时原子替换 path，出错时删除临时文件
+
+    临时文件名由 tempfile.mkstemp 生成，多个线程 / 进程同时写同一路径互不干扰（后替换的生效）
+
+    用法:
+        with atomic_write(path) as f:
+            pickle.dump(obj, f)
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            fd = None
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if fd is not None:
+            os.close(fd)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
 def extract_emojis(text):
     emoji_pattern = re.compile(
         "["
@@ -360,36 +820,130 @@ def sanitize_filename(filename):
     return sanitized
 
 
-def analyze_single_chars(texts):
-    total_count = Counter()
-    solo_count = Counter()
-    boundary_count = Counter()
-    punctuation = set('，。！？、；：""''（）,.!?;:\'"()[]【】《》<>…—～·')
-    
+# 单字独立性统计的字符分类
+CHAR_LETTER = 1     # 参与统计的字：CJK 统一表意文字（U+4E00~U+9FFF）和英文字母
+CHAR_EDGE = 2       # 单字两侧的边界：标点和空白
+_SINGLE_CHAR_PUNCTUATION = set('，。！？、；：""''（）,.!?;:\'"()[]【】《》<>…—～·')
+# 每批编码的文本条数
+_CHAR_BATCH_TEXTS = 100000
+_char_classes = None
+
+
+def all_code_points():
+    """依次包含全部 Unicode 码点（含代理区）的字符串，用正则 / 集合批量构建码点查找表"""
+    return np.arange(0x110000, dtype=np.int32).tobytes().decode('utf-32-le', 'surrogatepass')
+
+
+def char_classes():
+    """码点 -> 字符分类（CHAR_LETTER / CHAR_EDGE 位）的查找表，首次调用时构建"""
+    global _char_classes
+    if _char_classes is None:
+        table = np.zeros(0x110000, dtype=np.uint8)
+        table[0x4e00:0xa000] |= CHAR_LETTER
+        table[ord('a'):ord('z') + 1] |= CHAR_LETTER
+        table[ord('A'):ord('Z') + 1] |= CHAR_LETTER
+        table[[ord(c) for c in _SINGLE_CHAR_PUNCTUATION]] |= CHAR_EDGE
+        # \s 与 str.isspace 的字符集相同
+        table[[m.start() for m in re.finditer(r'\s', all_code_points())]] |= CHAR_EDGE
+        _char_classes = table
+    return _char_classes
+
+
+def iter_text_codes(texts, batch_size=_CHAR_BATCH_TEXTS):
+    """
+    按批把文本编码为码点数组
+
+    Yields:
+        (codes, lengths)：该批文本首尾相接的 int32 码点数组（无分隔符），以及各条文本的长度
+    """
+    batch = []
     for text in texts:
-        for char in text:
-            if re.match(r'^[\u4e00-\u9fffa-zA-Z]$', char):
-                total_count[char] += 1
-        
-        clean_chars = [c for c in text if re.match(r'^[\u4e00-\u9fffa-zA-Z]$', c)]
-        if len(clean_chars) == 1:
-            solo_count[clean_chars[0]] += 1
-        
-        for i, char in enumerate(text):
-            if not re.match(r'^[\u4e00-\u9fffa-zA-Z]$', char):
-                continue
-            left_ok = (i == 0) or (text[i-1] in punctuation) or (text[i-1].isspace())
-            right_ok = (i == len(text)-1) or (text[i+1] in punctuation) or (text[i+1].isspace())
-            if left_ok and right_ok:
-                boundary_count[char] += 1
-    
-    result = {}
-    for char in total_count:
-        total = total_count[char]
-        solo = solo_count[char]
-        boundary = boundary_count[char]
-        independent = solo + boundary * 0.5
-        ratio = independent / total if total > 0 else 0
-        result[char] = (total, independent, ratio)
-    
-    return result
+        batch.append(text)
+        if len(batch) >= batch_size:
+            yield _encode_texts(batch)
+            batch = []
+    if batch:
+        yield _encode_texts(batch)
+
+
+def _encode_texts(texts):
+    # 文本中可能有 JSON 转义留下的孤立代理字符
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le', 'surrogatepass'), dtype=np.int32)
+    return codes, np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+
+
+class SingleCharStats:
+    """
+    单字独立性统计，逐批累加 iter_text_codes 的结果
+
+    对每个参与统计的字记录：出现次数、单独成句（文本中只有这一个字）的次数、
+    两侧都是文本边界 / 标点 / 空白的次数。字的顺序为首次出现的顺序。
+    """
+
+    def __init__(self):
+        self._counts = {}
+
+    def update(self, codes, lengths):
+        if not len(codes):
+            return
+        classes = char_classes()[codes]
+        letter = (classes & CHAR_LETTER) != 0
+        edge = (classes & CHAR_EDGE) != 0
+
+        starts = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=starts[1:])
+        nonempty = lengths > 0
+        is_start = np.zeros(len(codes), dtype=bool)
+        is_start[starts[nonempty]] = True
+        is_end = np.zeros(len(codes), dtype=bool)
+        is_end[starts[nonempty] + lengths[nonempty] - 1] = True
+
+        left_ok = is_start.copy()
+        left_ok[1:] |= edge[:-1]
+        right_ok = is_end.copy()
+        right_ok[:-1] |= edge[1:]
+
+        positions = np.flatnonzero(letter)
+        text_ids = np.repeat(np.arange(len(lengths)), lengths)[positions]
+        solo = np.bincount(text_ids, minlength=len(lengths))[text_ids] == 1
+        boundary = left_ok[positions] & right_ok[positions]
+
+        letters = codes[positions]
+        entries = self._counts
+        for code, total in zip(*count_first_seen(letters)):
+            entry = entries.get(code)
+            if entry is None:
+                entries[code] = [total, 0, 0]
+            else:
+                entry[0] += total
+        for column, mask in ((1, solo), (2, boundary)):
+            uniq, counts = np.unique(letters[mask], return_counts=True)
+            for code, count in zip(uniq.tolist(), counts.tolist()):
+                entries[code][column] += count
+
+    def copy(self):
+        """拷贝，之后各自累加互不影响"""
+        other = SingleCharStats()
+        other._counts = {code: list(entry) for code, entry in self._counts.items()}
+        return other
+
+    def result(self):
+        """{字: (出现次数, 独立次数, 独立比例)}，独立次数 = 单独成句次数 + 两侧为边界的次数 * 0.5"""
+        result = {}
+        for code, (total, solo, boundary) in self._counts.items():
+            independent = solo + boundary * 0.5
+            ratio = independent / total if total > 0 else 0
+            result[chr(code)] = (total, independent, ratio)
+        return result
+
+
+def analyze_single_chars(texts):
+    """
+    单字独立性：{字: (出现次数, 独立次数, 独立比例)}
+
+    新词发现时由 count_ngrams 在同一遍扫描中统计（SingleCharStats），这里单独统计一组文本。
+    """
+    stats = SingleCharStats()
+    for codes, lengths in iter_text_codes(texts):
+        stats.update(codes, lengths)
+    return stats.result()